@@ -1,4 +1,6 @@
 import json
+import hashlib
+import itertools
 import threading
 import time
 import math
@@ -9,31 +11,70 @@ import uuid
 from time import sleep
 
 from pydantic import BaseModel, Field, model_validator
-from typing import List, Optional, Any, Tuple, Dict
-from datetime import date, timedelta
+from typing import Callable, List, Optional, Any, Tuple, Dict
+from datetime import date, datetime, timedelta
 from models import *
+from config import MAPS_API_BASE
+from place_cache import PlaceCoordinateCache
+from storage import CHAT_TAIL_SIZE, HISTORY_PAGE_SIZE, StorageBackend, StorageError
+from memory_storage import MemoryStorage
+from sqlite_storage import SQLiteStorage
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-gmaps_client = googlemaps.Client(key=GOOGLE_API_KEY)
+gmaps_client = googlemaps.Client(key=GOOGLE_API_KEY, base_url=MAPS_API_BASE)
 
-users_db: Dict[int, UserModel] = {}
-locations_db: Dict[str, LocationModel] = {}
-DB_LOCK = threading.Lock()
+# Storage engine: "memory" (dicts, durable through a journal when MUNICH_DATA_DIR is set) or "sqlite"
+DATA_DIR = os.getenv("MUNICH_DATA_DIR")
+STORAGE_BACKEND = os.getenv("MUNICH_STORAGE", "memory")
+SNAPSHOT_INTERVAL_SECONDS = 300
+# Chat messages older than this leave memory for the packed chat archive
+CHAT_ARCHIVE_AGE = timedelta(days=1)
+
+
+def create_backend(kind: str = STORAGE_BACKEND, data_dir: Optional[str] = DATA_DIR) -> StorageBackend:
+    if kind == "sqlite":
+        return SQLiteStorage(os.path.join(data_dir or os.path.dirname(__file__), "munich_companion.db"))
+    return MemoryStorage(data_dir)
+
+
+backend: StorageBackend = create_backend()
+
+
+# Ready-to-send JSON bodies per location, invalidated through the version counter.
+# Every bump stores a value never used before, so a cached body is valid exactly while its version is current.
+# next() on a count and single dict reads and writes are atomic, no lock is shared by all requests.
+location_versions: Dict[str, int] = {}
+location_json_cache: Dict[str, Tuple[int, bytes, str]] = {}
+_version_counter = itertools.count(1)
+
+
+# Called with the location id after every change, main.py forwards them to the other worker processes
+location_listeners: List[Callable[[str], None]] = []
+
+
+def invalidate_location(location_id: str):
+    location_versions[location_id] = next(_version_counter)
+
+
+def _touch_location(location_id: str):
+    invalidate_location(location_id)
+    for listener in location_listeners:
+        listener(location_id)
 
 
 def register_users(user: UserModel):
-    with DB_LOCK:
-        if user.user_id in users_db:
-            print(f"User ID {user.user_id} already exists!")
-            return False
-        users_db[user.user_id] = user
-        print(f"User registered: {user.name} (ID: {user.user_id}")
-        return True
+    if not backend.register_user(user):
+        print(f"User ID {user.user_id} already exists!")
+        return False
+    print(f"User registered: {user.name} (ID: {user.user_id}")
+    return True
 
 def get_user(user_id: int):
-    with DB_LOCK:
-        return users_db.get(user_id)
+    return backend.get_user(user_id)
+
+def get_all_users() -> List[UserModel]:
+    return backend.get_all_users()
 
 def run_deleter_in_background():
     deletion_thread = threading.Thread(target=timed_deleting)
@@ -42,20 +83,32 @@ def run_deleter_in_background():
     deletion_thread.start()
     print("Hintergrund-Löschung gestartet.")
 
+def delete_expired_groups():
+    for location_id in backend.delete_expired(date.today()):
+        _touch_location(location_id)
+
+# Set when a group is created, its date may expire before the one the deleter is waiting for
+expiry_changed = threading.Event()
+EXPIRY_MAX_SLEEP_SECONDS = 3600*6
+
+
+def seconds_until_next_expiry(now: datetime) -> float:
+    next_date = backend.next_expiry()
+    if next_date is None:
+        return EXPIRY_MAX_SLEEP_SECONDS
+    # Groups are deleted once their day is over
+    expires_at = datetime.combine(next_date + timedelta(days=1), datetime.min.time())
+    return min(max((expires_at - now).total_seconds(), 1.0), EXPIRY_MAX_SLEEP_SECONDS)
+
+
 def timed_deleting():
     while(True):
-        with DB_LOCK:
-            for l in locations_db.values():
-                keys_to_delete = []
-                for k,g in l.groups.items():
-                    if g.date < date.today():
-                        keys_to_delete.append(k)
-                for key in keys_to_delete:
-                    del l.groups[key]
-        time.sleep(3600*6)
-
-
-def fetch_coordinates_from_google(place_id: str) -> Tuple[float, float]:
+        expiry_changed.clear()
+        delete_expired_groups()
+        expiry_changed.wait(seconds_until_next_expiry(datetime.now()))
+
+
+def fetch_coordinates_from_google(place_id: str) -> Optional[Tuple[float, float]]:
     try:
         result = gmaps_client.place(place_id, fields=['geometry'])
         if result['status'] == 'OK':
@@ -63,84 +116,64 @@ def fetch_coordinates_from_google(place_id: str) -> Tuple[float, float]:
             return loc['lat'], loc['lng']
     except Exception as e:
         print(f"Error fetching coords for {place_id}: {e}")
-    # Fallback (München Zentrum)
-    return 48.137, 11.575
+    # Unresolved, the location stays off the map until a retry succeeds
+    return None
+
+
+PLACE_CACHE_PATH = os.getenv("PLACE_CACHE_PATH", os.path.join(os.path.dirname(__file__), "place_coordinates.json"))
+GEOCODE_RETRY_SECONDS = 600
+place_cache = PlaceCoordinateCache(PLACE_CACHE_PATH, fetch_coordinates_from_google)
+
+
+def retry_unresolved_locations():
+    for location_id in backend.unresolved_locations():
+        coords = place_cache.get(location_id)
+        if coords is None:
+            continue
+        if backend.set_coordinates(location_id, *coords):
+            _touch_location(location_id)
+            print(f"Resolved coordinates for {location_id}")
+
+
+def run_geocode_retry_in_background():
+    retry_thread = threading.Thread(target=timed_geocode_retry)
+    retry_thread.daemon = True
+    retry_thread.start()
+
+
+def timed_geocode_retry():
+    while(True):
+        time.sleep(GEOCODE_RETRY_SECONDS)
+        retry_unresolved_locations()
 
 
 def delete_group(location_id:str, group_id:uuid.UUID):
-    with DB_LOCK:
-        if location_id not in locations_db:
-            print("Location not found")
-            return False
-        else:
-            location = locations_db[location_id]
-            if group_id not in location.groups:
-                print("Group not found")
-                return False
-            else:
-                del location.groups[group_id]
-                return True
-
-
-def add_group_to_user(user_id: int, location_id: str, group: GroupModel):
-    if user_id in users_db:
-        user = users_db[user_id]
-
-        for existing in user.joined_groups:
-            if existing.group_id == group.group_id:
-                return  #avoid duplicates
-
-        info = UserGroupInfo(
-            location_id=location_id,
-            group_id=group.group_id,
-            title=group.title
-        )
-        user.joined_groups.append(info)
-        print(f"Updated User {user.name}: Added group '{group.title}'")
+    try:
+        backend.delete_group(location_id, group_id)
+    except StorageError as e:
+        print(e)
+        return False
+    _touch_location(location_id)
+    return True
 
 
 def join_group(location_id: str, group_id: uuid.UUID, user: UserModel):
-    with DB_LOCK:
-        if user.user_id not in users_db:
-            users_db[user.user_id] = user
-
-        if location_id in locations_db:
-            location = locations_db[location_id]
-            groups = location.groups
-            if group_id in groups:
-                group = groups[group_id]
-                min_age, max_age = group.age_range
-                if min_age <= user.age <= max_age:
-                    if any(m.user_id == user.user_id for m in group.members):
-                        print("You cant join a Group twice")
-                        return False
-                    else:
-                        group.members.append(user)
-                        add_group_to_user(user.user_id, location_id, group)
-                        return True
-                else:
-                    print("You dont fit the age restrictions of this Group")
-                    return False
-            else:
-                print("Group was not found at the location")
-                return False
-        else:
-            print("this location doesnt have any groups yet")
-            return False
+    try:
+        backend.join_group(location_id, group_id, user)
+    except StorageError as e:
+        print(e)
+        return False
+    _touch_location(location_id)
+    print(f"Updated User {user.name}: Joined group {group_id}")
+    return True
 
 
 def get_user_groups(user_id: int):
-    with DB_LOCK:
-        user = users_db.get(user_id)
-        if user:
-            return [g.model_dump() for g in user.joined_groups]
-        return []
+    return [g.model_dump() for g in backend.get_user_groups(user_id)]
 
 
 def create_group(location_id: str, title: str, description: str, age_range: Tuple[int,int], gdate: date, host: UserModel):
-    with DB_LOCK:
-        if host.user_id not in users_db:
-            users_db[host.user_id] = host
+    backend.ensure_user(host)
     group_id = uuid.uuid4()
     group = GroupModel(
         group_id = group_id,
@@ -149,112 +182,137 @@ def create_group(location_id: str, title: str, description: str, age_range: Tupl
         age_range= age_range,
         date= gdate,
         host_id= host.user_id,
-        members=[host]
+        member_ids=[host.user_id]
     )
-    with DB_LOCK:
-        if location_id in locations_db:
-            location = locations_db[location_id]
-            if group_id in location.groups:
-                print("Something went wrong, pls try again")
-                return None
-            location.groups[group_id] = group
-        else:
-            lat, lng = fetch_coordinates_from_google(location_id)
-            groups: Dict[uuid.UUID, GroupModel] = {group_id: group}
-            location = LocationModel(
-                location_id = location_id,
-                lat = lat,
-                lng = lng,
-                groups = groups
-            )
-            locations_db[location_id] = location
-        add_group_to_user(host.user_id, location_id, group)
-        return group
+    # Geocoding runs outside of all storage locks, a slow Places request must not block the other requests
+    coords = None
+    if backend.needs_coordinates(location_id):
+        coords = place_cache.get(location_id)
+        if coords is None:
+            print(f"Could not resolve coordinates for {location_id}, retrying later")
+
+    try:
+        backend.create_group(location_id, group, coords)
+    except StorageError as e:
+        print(e)
+        return None
+    _touch_location(location_id)
+    expiry_changed.set()
+    print(f"Updated User {host.name}: Added group '{group.title}'")
+    return group
 
 
 def get_groups_by_location(locations : List[str]):
     json_list = []
-    with DB_LOCK:
-        for location in locations:
-            if location in locations_db:
-                current_location =  locations_db[location]
-                json_output = current_location.model_dump_json(indent=4)
-                json_list.append(json_output)
-            #else:
-                #raise ValueError(f"Location '{location}' not found!.")
+    for location in locations:
+        json_output = backend.location_json(location)
+        if json_output is not None:
+            json_list.append(json_output.decode())
+        #else:
+            #raise ValueError(f"Location '{location}' not found!.")
     return json_list
 
 
+def get_location_groups_json(location_id: str) -> Tuple[bytes, str]:
+    """Compact JSON body for /api/locations/{id}/groups and its ETag, serialized once per change"""
+    # The version is read first, a change during serialization leaves a stale version that is rebuilt next time
+    version = location_versions.get(location_id, 0)
+    cached = location_json_cache.get(location_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    location_json = backend.location_json(location_id)
+    if location_json is None:
+        return b"[]", '"empty"'
+    body = b"[" + location_json + b"]"
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    location_json_cache[location_id] = (version, body, etag)
+    return body, etag
+
+
+def get_group_summaries_by_location(location_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Group summaries for many places at once, used to join groups onto map search results"""
+    return backend.group_summaries(location_ids)
+
+
 def get_nearby_groups(user_lat: float, user_lng: float, radius_km: float = 3.0) -> List[Dict]:
-    nearby_groups = []
-    with DB_LOCK:
-        for loc in locations_db.values():
-            if loc.lat == 0.0 and loc.lng == 0.0:
-                continue
-
-            # Euklidische Distanz-Schätzung für München (1° Lat ~ 111km, 1° Lng ~ 74km), from Gemini
-            lat_diff = (loc.lat - user_lat) * 111
-            lng_diff = (loc.lng - user_lng) * 74
-            dist_km = math.sqrt(lat_diff ** 2 + lng_diff ** 2)
-            if dist_km <= radius_km:
-                loc_data = loc.model_dump(mode='json')
-                for group in loc.groups.values():
-                    g_data = group.model_dump(mode='json')
-                    g_data['location_id'] = loc.location_id
-                    nearby_groups.append(g_data)
-    return nearby_groups
+    return backend.nearby_groups(user_lat, user_lng, radius_km)
+
+
+# A group one day later ranks like one a kilometer further away
+RANK_KM_PER_DAY = 1.0
+
+
+def get_nearby_group_summaries(user_lat: float, user_lng: float, radius_km: float = 3.0,
+                               limit: Optional[int] = None) -> List[Dict]:
+    """Summaries (member count instead of members and chat) of the groups in range, closest and soonest first"""
+    distances = backend.nearby_locations(user_lat, user_lng, radius_km)
+    today = date.today()
+    ranked = []
+    for location_id, summaries in backend.group_summaries(list(distances)).items():
+        for summary in summaries:
+            summary["location_id"] = location_id
+            summary["distance_km"] = round(distances[location_id], 2)
+            days = max((date.fromisoformat(summary["date"]) - today).days, 0)
+            ranked.append((distances[location_id] + days * RANK_KM_PER_DAY, summary))
+    ranked.sort(key=lambda r: r[0])
+    return [summary for _, summary in ranked[:limit]]
+
+
+def is_group_member(location_id: str, group_id: uuid.UUID, user_id: int) -> bool:
+    return backend.is_member(location_id, group_id, user_id)
 
 
 def send_message(location_id: str, group_id: uuid.UUID, user: UserModel, content: str):
-    with DB_LOCK:
-        if location_id not in locations_db:
-            print("Location not found")
-            return None
+    try:
+        new_message = backend.send_message(location_id, group_id, user, content)
+    except StorageError as e:
+        print(e)
+        return None
+    _touch_location(location_id)
+    print(f"Message sent by {user.name}.")
+    return new_message
+
 
-        location = locations_db[location_id]
+def get_chat_history(location_id: str, group_id: uuid.UUID, user_id: int,
+                     before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE):
+    try:
+        return backend.get_chat_history(location_id, group_id, user_id, before, max(1, min(limit, CHAT_TAIL_SIZE)))
+    except StorageError as e:
+        print(e)
+        return []
 
-        if group_id not in location.groups:
-            print("Group not found")
-            return None
 
-        group = location.groups[group_id]
+def open_storage():
+    backend.open()
 
-        is_member = any(m.user_id == user.user_id for m in group.members)
 
-        if not is_member:
-            print("You cant write in chats where you arent a member! What the hell did you do????")
-            return None
+def archive_old_messages():
+    # The shortened chat tails are part of the cached listing bodies
+    for location_id in backend.archive_chats(datetime.now() - CHAT_ARCHIVE_AGE):
+        invalidate_location(location_id)
 
-        new_message = ChatMessageModel(
-            sender_id=user.user_id,
-            sender_name=user.name,
-            group_id=group.group_id,
-            content=content,
-            timestamp=datetime.now()
-        )
 
-        group.chat_history.append(new_message)
-        print(f"Message sent by {user.name}.")
-        return new_message
+def write_snapshot():
+    backend.snapshot()
 
 
-def get_chat_history(location_id: str, group_id: uuid.UUID, user_id: int):
-    with DB_LOCK:
-        if location_id not in locations_db:
-            return []
+def close_storage():
+    backend.close()
 
-        location = locations_db[location_id]
-        if group_id not in location.groups:
-            return []
 
-        group = location.groups[group_id]
+def run_snapshots_in_background():
+    snapshot_thread = threading.Thread(target=timed_snapshots)
+    snapshot_thread.daemon = True
+    snapshot_thread.start()
 
-        is_member = any(m.user_id == user_id for m in group.members)
-        if not is_member:
-            print("Accesse denied: You are not a member.")
-            return []
 
-        return group.chat_history
+def timed_snapshots():
+    while(True):
+        time.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        archive_old_messages()
+        if backend.needs_snapshot():
+            write_snapshot()
 
 
 
@@ -1,23 +1,118 @@
+import asyncio
 import json
-import requests
-from config import API_KEY, API_URL
+import random
+import httpx
+from config import API_KEY, API_URL, STREAM_API_URL
 from datetime import datetime
+from typing import AsyncIterator, Optional
+
+# Gemini calls: one pooled connection set per process, bounded in time and in parallelism
+CONNECT_TIMEOUT_SECONDS = 5.0
+READ_TIMEOUT_SECONDS = 30.0
+MAX_RETRIES = 3
+RETRY_BASE_SECONDS = 0.5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_CONCURRENT_REQUESTS = 16
 
 class MunichCompanion:
 
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.api_key = API_KEY
         self.api_url = API_URL
+        self.stream_url = STREAM_API_URL
+        self.transport = transport
+        # Created on first use, they belong to the event loop that runs the requests
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"Content-Type": "application/json", "X-goog-api-key": self.api_key or ""},
+                timeout=httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS),
+                transport=self.transport,
+            )
+            self._slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._slots = None
+
+    async def _post(self, data: dict) -> httpx.Response:
+        """POST to Gemini, retrying transport errors and overload answers with full jitter backoff"""
+        client = self._get_client()
+        async with self._slots:
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    response = await client.post(self.api_url, json=data)
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                        return response
+                except httpx.TransportError:
+                    if attempt == MAX_RETRIES:
+                        raise
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def _stream(self, data: dict) -> AsyncIterator[str]:
+        """streamGenerateContent as SSE, yields the text of every chunk; retried only until the first chunk arrived"""
+        client = self._get_client()
+        async with self._slots:
+            for attempt in range(MAX_RETRIES + 1):
+                started = False
+                try:
+                    async with client.stream("POST", self.stream_url, json=data) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                                raise RuntimeError(f"Error: {response.status_code}-{response.text}")
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                try:
+                                    text = json.loads(line[5:])["candidates"][0]["content"]["parts"][0]["text"]
+                                except (ValueError, KeyError, IndexError):
+                                    continue
+                                if text:
+                                    started = True
+                                    yield text
+                            return
+                except httpx.TransportError:
+                    if started or attempt == MAX_RETRIES:
+                        raise
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def _generate(self, prompt: str) -> str:
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        try:
+            response = await self._post(data)
+        except httpx.TransportError as e:
+            return f"Error: {type(e).__name__}"
 
-    def ask(self, user_input,location=None, available_groups=None):
+        if response.status_code != 200:
+            return f"Error: {response.status_code}-{response.text}"
+
+        try:
+            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        except Exception:
+            return "Unexpected response format"
+
+    async def ask(self, user_input,location=None, available_groups=None):
         if not self.api_key:
             raise ValueError("API key is missing")
+        return await self._generate(self._chat_prompt(user_input, location, available_groups))
 
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": self.api_key
-        }
+    async def ask_stream(self, user_input, location=None, available_groups=None) -> AsyncIterator[str]:
+        """Same answer as ask(), handed out piece by piece while Gemini generates it"""
+        if not self.api_key:
+            raise ValueError("API key is missing")
+        async for text in self._stream({"contents": [{"parts": [{"text": self._chat_prompt(user_input, location, available_groups)}]}]}):
+            yield text
 
+    def _chat_prompt(self, user_input, location=None, available_groups=None) -> str:
         groups_context_text = ""
         if available_groups and len(available_groups) > 0:
             groups_list = []
@@ -25,7 +120,9 @@ class MunichCompanion:
                 info = (f"- GROUP: '{g.get('title')}' "
                         f"(Topic: {g.get('description')}, "
                         f"Age: {g.get('age_range')}, "
-                        f"Date: {g.get('date')})")
+                        f"Date: {g.get('date')}, "
+                        f"Members: {g.get('member_count')}, "
+                        f"{g.get('distance_km')} km away)")
                 groups_list.append(info)
             groups_context_text = (
                     "There are active social groups nearby the user right now! "
@@ -50,28 +147,13 @@ class MunichCompanion:
             f"User: {user_input}"
             "If the user input has nothing todo with Munich or the Munich Companion, give friendly feedback that this is off topic"
         )
-
-        data = {"contents": [{"parts": [{"text": prompt}]}]}
-        response = requests.post(self.api_url, headers=headers, data=json.dumps(data))
-
-        if response.status_code != 200:
-            return f"Error: {response.status_code}-{response.text}"
-
-        try:
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception:
-            return "Unexpected response format"
+        return prompt
 
 
-    def ask_automated(self, answer):
+    async def ask_automated(self, answer):
         if not self.api_key:
             raise ValueError("API key is missing")
 
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": self.api_key
-        }
-
         prompt_old = (
             "You are a friendly and knowledgeable Munich companion chatbot. "
             "You guide international students and newcomers, helping them with settling in, social life, culture, and well-being. "
@@ -88,20 +170,11 @@ class MunichCompanion:
             "Its very important that you answer exactly yes or no."
         )
 
-        data = {"contents": [{"parts": [{"text": prompt}]}]}
-        response = requests.post(self.api_url, headers=headers, data=json.dumps(data))
-
-        if response.status_code != 200:
-            return f"Error: {response.status_code}-{response.text}"
-
-        try:
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception:
-            return "Unexpected response format"
+        return await self._generate(prompt)
 
 
 
 if __name__ == "__main__":
     bot = MunichCompanion()
-    print(bot.ask("Any fun things to do today?",
-    location={"lat": 48.1599, "lon": 11.5820}))
+    print(asyncio.run(bot.ask("Any fun things to do today?",
+    location={"lat": 48.1599, "lon": 11.5820})))
@@ -0,0 +1,212 @@
+"""
+Contention benchmark for GroupDataManager.
+
+Worker threads chat in their own small groups while one "hot" thread keeps posting to a large
+group and re-serializing its location listing. --io-ms adds a blocking write (think fsync) inside
+the hot location's critical section after every post. The global-lock mode wraps every GroupDataManager
+call in one process-wide lock, which is how the module worked before per-location/per-group locking.
+
+By default both modes run in alternating rounds on fresh storage and the medians are compared; the exit
+status is 1 unless fine-grained locking beats the global lock on worker throughput and p99 latency.
+The max latency is reported next to the max of the same number of threads running plain Python without
+any storage calls: with more threads than cores the GIL hand-off alone causes stalls of that size.
+
+    python bench_contention.py
+    python bench_contention.py --mode global
+    python bench_contention.py --io-ms 2 --rounds 5
+"""
+import argparse
+import contextlib
+import functools
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional
+
+sys.path.append(os.path.dirname(__file__))
+os.environ.setdefault("GOOGLE_API_KEY", "AIza-bench-key")
+os.environ.setdefault("PLACE_CACHE_PATH", "")
+
+import GroupDataManager as db
+from memory_storage import MemoryStorage
+from models import UserModel
+from place_cache import PlaceCoordinateCache
+
+PUBLIC_FUNCTIONS = ["join_group", "send_message", "get_chat_history", "get_location_groups_json", "create_group"]
+global_lock: Optional[threading.Lock] = None
+
+
+def install_global_lock():
+    """Returns a callable that restores the unlocked functions"""
+    global global_lock
+    global_lock = threading.Lock()
+    originals = {name: getattr(db, name) for name in PUBLIC_FUNCTIONS}
+    for name, original in originals.items():
+
+        @functools.wraps(original)
+        def locked(*args, _original=original, **kwargs):
+            with global_lock:
+                return _original(*args, **kwargs)
+
+        setattr(db, name, locked)
+
+    def restore():
+        global global_lock
+        global_lock = None
+        for name, original in originals.items():
+            setattr(db, name, original)
+    return restore
+
+
+def blocking_write(location_id: str, io_ms: float):
+    location = db.backend._get_location(location_id)
+    with global_lock or contextlib.nullcontext():
+        with location._lock:
+            time.sleep(io_ms / 1000)
+
+
+def setup(workers: int, hot_groups: int, hot_messages: int):
+    db.close_storage()
+    db.backend = MemoryStorage()
+    db.location_json_cache.clear()
+    db.place_cache = PlaceCoordinateCache(None, lambda place_id: (48.137, 11.575))
+    host = UserModel(user_id=0, name="Host", age=30, gender="x")
+
+    hot_group_ids = []
+    for i in range(hot_groups):
+        group = db.create_group("hot_location", f"Hot {i}", "busy place", (0, 120), date.today(), host)
+        for m in range(hot_messages):
+            db.send_message("hot_location", group.group_id, host, f"message {m}")
+        hot_group_ids.append(group.group_id)
+
+    worker_groups = []
+    for w in range(workers):
+        user = UserModel(user_id=w + 1, name=f"Worker {w}", age=30, gender="x")
+        group = db.create_group(f"location_{w}", f"Group {w}", "quiet place", (0, 120), date.today(), user)
+        worker_groups.append((f"location_{w}", group.group_id, user))
+    return host, hot_group_ids, worker_groups
+
+
+def run(workers: int, duration: float, hot_groups: int, hot_messages: int, io_ms: float):
+    # GroupDataManager prints on every operation, keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        host, hot_group_ids, worker_groups = setup(workers, hot_groups, hot_messages)
+    stop = threading.Event()
+    latencies = [[] for _ in range(workers)]
+    hot_ops = [0]
+
+    def hot_loop():
+        while not stop.is_set():
+            hot_ops[0] += 1
+            db.send_message("hot_location", hot_group_ids[0], host, "ping")
+            if io_ms:
+                blocking_write("hot_location", io_ms)
+            db.get_location_groups_json("hot_location")
+
+    def worker_loop(index):
+        location_id, group_id, user = worker_groups[index]
+        while not stop.is_set():
+            start = time.perf_counter()
+            db.send_message(location_id, group_id, user, "hello")
+            db.get_chat_history(location_id, group_id, user.user_id)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=hot_loop)] + [threading.Thread(target=worker_loop, args=(i,)) for i in range(workers)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        stop.set()
+        for t in threads:
+            t.join()
+
+    return _summary(latencies, duration, hot_ops=hot_ops[0] / duration)
+
+
+def _summary(latencies, duration: float, **extra) -> Dict[str, float]:
+    all_latencies = sorted(l for per_worker in latencies for l in per_worker)
+    return dict(extra,
+                ops=len(all_latencies) / duration,
+                p50=statistics.median(all_latencies) * 1000,
+                p99=all_latencies[int(len(all_latencies) * 0.99) - 1] * 1000,
+                max=all_latencies[-1] * 1000)
+
+
+def run_interpreter_only(workers: int, duration: float) -> Dict[str, float]:
+    """Same number of threads doing a comparable amount of pure Python work, no storage and no locks"""
+    stop = threading.Event()
+    latencies = [[] for _ in range(workers + 1)]
+
+    def loop(index):
+        while not stop.is_set():
+            start = time.perf_counter()
+            sum(range(2000))
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(workers + 1)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return _summary(latencies, duration)
+
+
+def report(name: str, result: Dict[str, float]):
+    hot = f"  hot {result['hot_ops']:6.0f} ops/s" if "hot_ops" in result else ""
+    print(f"{name:<18} worker {result['ops']:7.0f} ops/s{hot}  p50 {result['p50']:6.2f} ms  "
+          f"p99 {result['p99']:7.2f} ms  max {result['max']:8.2f} ms")
+
+
+def compare(args) -> bool:
+    results = {"fine-grained": [], "global lock": []}
+    for round_number in range(args.rounds):
+        for mode in ("fine-grained", "global lock"):
+            restore = install_global_lock() if mode == "global lock" else None
+            try:
+                result = run(args.workers, args.duration, args.hot_groups, args.hot_messages, args.io_ms)
+            finally:
+                if restore is not None:
+                    restore()
+            report(f"{mode} #{round_number + 1}", result)
+            results[mode].append(result)
+
+    medians = {mode: {key: statistics.median(r[key] for r in rounds) for key in rounds[0]}
+               for mode, rounds in results.items()}
+    floor = run_interpreter_only(args.workers, args.duration)
+    print(f"\nmedians of {args.rounds} rounds, {args.workers} workers, {os.cpu_count()} cpus")
+    for mode, result in medians.items():
+        report(mode, result)
+    report("plain python", floor)
+
+    fine, coarse = medians["fine-grained"], medians["global lock"]
+    print(f"\nworker throughput x{fine['ops'] / coarse['ops']:.2f}, hot throughput x{fine['hot_ops'] / max(coarse['hot_ops'], 1e-9):.2f}, "
+          f"p99 x{fine['p99'] / coarse['p99']:.2f}, max x{fine['max'] / coarse['max']:.2f} (fine-grained / global lock)")
+    better = fine["ops"] > coarse["ops"] and fine["p99"] < coarse["p99"]
+    print("fine-grained locking is faster" if better else "fine-grained locking is NOT faster")
+    return better
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["compare", "fine", "global"], default="compare",
+                        help="global emulates the old process-wide DB_LOCK")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--hot-groups", type=int, default=50)
+    parser.add_argument("--hot-messages", type=int, default=10)
+    parser.add_argument("--io-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.mode == "compare":
+        sys.exit(0 if compare(args) else 1)
+    if args.mode == "global":
+        install_global_lock()
+    report("global lock" if args.mode == "global" else "fine-grained",
+           run(args.workers, args.duration, args.hot_groups, args.hot_messages, args.io_ms))
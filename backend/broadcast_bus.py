@@ -0,0 +1,224 @@
+import asyncio
+import fcntl
+import os
+import struct
+import sys
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Set, Tuple
+
+# Handlers get the topic without the subscribed prefix and the published data
+Handler = Callable[[str, str], None]
+
+FRAME_HEADER = struct.Struct("<HI")   # topic length, data length
+RECONNECT_SECONDS = 0.5
+CONNECT_TIMEOUT_SECONDS = 2.0
+# A worker that lets this much pile up in the broker is disconnected, it reconnects and carries on
+BROKER_MAX_BUFFER = 8 * 1024 * 1024
+
+
+def _frame(topic: str, data: str) -> bytes:
+    topic_bytes, data_bytes = topic.encode(), data.encode()
+    return FRAME_HEADER.pack(len(topic_bytes), len(data_bytes)) + topic_bytes + data_bytes
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    topic_length, data_length = FRAME_HEADER.unpack(header)
+    return header + await reader.readexactly(topic_length + data_length)
+
+
+def _parse_frame(frame: bytes) -> Tuple[str, str]:
+    topic_length, _ = FRAME_HEADER.unpack_from(frame)
+    body = frame[FRAME_HEADER.size:]
+    return body[:topic_length].decode(), body[topic_length:].decode()
+
+
+class BroadcastBus(ABC):
+    """Delivers published (topic, data) pairs to the subscribers of every worker process, the publishing one included"""
+
+    def __init__(self):
+        self.handlers: List[Tuple[str, Handler]] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, prefix: str, handler: Handler):
+        self.handlers.append((prefix, handler))
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def close(self):
+        pass
+
+    def _dispatch(self, topic: str, data: str):
+        for prefix, handler in self.handlers:
+            if topic.startswith(prefix):
+                try:
+                    handler(topic[len(prefix):], data)
+                except Exception as e:
+                    print(f"Error handling broadcast {topic}: {e!r}")
+
+    @abstractmethod
+    def publish(self, topic: str, data: str):
+        """Must be called on the event loop"""
+
+    def publish_threadsafe(self, topic: str, data: str):
+        """For worker threads (threadpool endpoints, background jobs)"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish, topic, data)
+
+
+class LocalBus(BroadcastBus):
+    """Single worker: publishing is a direct call"""
+
+    def publish(self, topic: str, data: str):
+        self._dispatch(topic, data)
+
+
+class BroadcastBroker:
+    """
+    Relays every frame to all other connected workers.
+    The broker of a path is elected through an flock on path.lock, held as long as it runs and released by the
+    OS when its process dies. Only the holder removes and binds the socket, so two brokers can never split the workers.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.clients: Set[asyncio.StreamWriter] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._lock_fd: Optional[int] = None
+
+    async def start(self):
+        """Raises OSError when another broker holds the lock"""
+        lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # left behind by a broker that died, it released the lock with its process
+            self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+        except BaseException:
+            os.close(lock_fd)
+            raise
+        self._lock_fd = lock_fd
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                for other in list(self.clients):
+                    if other is writer:
+                        continue
+                    if other.transport.get_write_buffer_size() > BROKER_MAX_BUFFER:
+                        print("Broadcast broker: dropping a worker that does not keep up")
+                        self.clients.discard(other)
+                        other.close()
+                    else:
+                        other.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+        self.clients.clear()
+        if self._lock_fd is not None:
+            # Removed while still holding the lock, the next broker binds a fresh socket
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class UnixSocketBus(BroadcastBus):
+    """
+    Multi-worker bus over a broker on a Unix socket. The first worker that finds no broker
+    and wins the broker lock starts one inside its own event loop, the others connect to it (and take over when it goes away).
+    Publishing delivers locally right away and forwards the frame, so local sockets never wait for the broker.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.broker: Optional[BroadcastBroker] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await super().start()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), CONNECT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Broadcast bus: no broker at {self.path} yet, chat messages stay in this worker until it is up")
+
+    async def _become_broker(self) -> bool:
+        broker = BroadcastBroker(self.path)
+        try:
+            await broker.start()
+        except OSError:
+            return False  # another worker is the broker, connect to it
+        self.broker = broker
+        print(f"Broadcast broker listening on {self.path}")
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if self.broker is None and await self._become_broker():
+                    continue
+                await asyncio.sleep(RECONNECT_SECONDS)
+                continue
+            self.writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    self._dispatch(*_parse_frame(await _read_frame(reader)))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print("Broadcast bus: lost the broker, reconnecting")
+            finally:
+                self.writer = None
+                self._connected.clear()
+                writer.close()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    def publish(self, topic: str, data: str):
+        self._dispatch(topic, data)
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(_frame(topic, data))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.writer is not None:
+            self.writer.close()
+        if self.broker is not None:
+            await self.broker.close()
+
+
+def create_bus(socket_path: Optional[str]) -> BroadcastBus:
+    return UnixSocketBus(socket_path) if socket_path else LocalBus()
+
+
+async def _serve_forever(path: str):
+    broker = BroadcastBroker(path)
+    await broker.start()
+    print(f"Broadcast broker listening on {path}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    # Standalone broker, instead of letting the first worker host it: python broadcast_bus.py /tmp/munich.sock
+    asyncio.run(_serve_forever(sys.argv[1]))
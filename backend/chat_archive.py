@@ -0,0 +1,263 @@
+import bisect
+import mmap
+import os
+import shutil
+import struct
+import threading
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from journal import fsync_directory
+from models import ChatMessageModel
+
+# Segment layout: header once, then sender definitions and messages in append order.
+# A sender (id + name) is written the first time it appears in a segment and referenced by index afterwards,
+# the seq of a message is implicit (first_seq + position) and the group id is only stored in the header.
+HEADER = struct.Struct("<4s16sQ")     # magic, group id, first seq
+SENDER = struct.Struct("<cHqH")       # b"S", sender index, sender id, name length
+MESSAGE = struct.Struct("<cHqI")      # b"M", sender index, timestamp in µs, content length
+MAGIC = b"MCA1"
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+MAX_SENDERS = 0xFFFF
+EPOCH = datetime(1970, 1, 1)
+
+
+def _micros(timestamp: datetime) -> int:
+    return (timestamp.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+
+class _Segment:
+    """A contiguous run of archived messages of one group, in a file or (without a directory) in a bytearray"""
+
+    def __init__(self, path: Optional[str], group_id: uuid.UUID, first_seq: int):
+        self.path = path
+        self.group_id = group_id
+        self.first_seq = first_seq
+        self.offsets = array('I')
+        self.senders: List[Tuple[int, str]] = []
+        self.sender_index: Dict[Tuple[int, str], int] = {}
+        self.buffer: Optional[bytearray] = None
+        self.size = HEADER.size
+
+    @property
+    def last_seq(self) -> int:
+        return self.first_seq + len(self.offsets) - 1
+
+    @property
+    def full(self) -> bool:
+        return self.size >= SEGMENT_MAX_BYTES or len(self.senders) >= MAX_SENDERS
+
+    @classmethod
+    def create(cls, path: Optional[str], group_id: uuid.UUID, first_seq: int) -> '_Segment':
+        segment = cls(path, group_id, first_seq)
+        header = HEADER.pack(MAGIC, group_id.bytes, first_seq)
+        if path is None:
+            segment.buffer = bytearray(header)
+        else:
+            with open(path, 'wb') as f:
+                f.write(header)
+        return segment
+
+    @classmethod
+    def load(cls, path: str) -> '_Segment':
+        with open(path, 'r+b') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, group_bytes, first_seq = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC:
+                    raise ValueError(f"{path} is not a chat archive segment")
+                segment = cls(path, uuid.UUID(bytes=group_bytes), first_seq)
+                segment._scan(mm)
+            # A torn record at the end was never acknowledged as archived, its message is still in the journal
+            f.truncate(segment.size)
+        return segment
+
+    def _scan(self, view):
+        offset, end = HEADER.size, len(view)
+        while offset < end:
+            tag = view[offset:offset + 1]
+            if tag == b"S" and offset + SENDER.size <= end:
+                _, index, sender_id, length = SENDER.unpack_from(view, offset)
+                body = offset + SENDER.size
+                if body + length > end:
+                    break
+                self._add_sender(sender_id, str(view[body:body + length], 'utf-8'))
+                offset = body + length
+            elif tag == b"M" and offset + MESSAGE.size <= end:
+                length = MESSAGE.unpack_from(view, offset)[3]
+                if offset + MESSAGE.size + length > end:
+                    break
+                self.offsets.append(offset)
+                offset += MESSAGE.size + length
+            else:
+                break
+        self.size = offset
+
+    def _add_sender(self, sender_id: int, sender_name: str) -> int:
+        index = len(self.senders)
+        self.senders.append((sender_id, sender_name))
+        self.sender_index[(sender_id, sender_name)] = index
+        return index
+
+    def append(self, messages: List[ChatMessageModel]):
+        out = bytearray()
+        for m in messages:
+            index = self.sender_index.get((m.sender_id, m.sender_name))
+            if index is None:
+                index = self._add_sender(m.sender_id, m.sender_name)
+                name = m.sender_name.encode()
+                out += SENDER.pack(b"S", index, m.sender_id, len(name))
+                out += name
+            content = m.content.encode()
+            self.offsets.append(self.size + len(out))
+            out += MESSAGE.pack(b"M", index, _micros(m.timestamp), len(content))
+            out += content
+        if self.buffer is not None:
+            self.buffer += out
+        else:
+            with open(self.path, 'ab') as f:
+                f.write(out)
+        self.size += len(out)
+
+    def _decode(self, view, start: int, end: int) -> List[ChatMessageModel]:
+        messages = []
+        for i in range(start, end):
+            offset = self.offsets[i]
+            _, index, micros, length = MESSAGE.unpack_from(view, offset)
+            body = offset + MESSAGE.size
+            sender_id, sender_name = self.senders[index]
+            # Straight from the mapped pages into the str, the data was validated before it was archived
+            messages.append(ChatMessageModel.model_construct(
+                seq=self.first_seq + i, sender_id=sender_id, sender_name=sender_name, group_id=self.group_id,
+                content=str(view[body:body + length], 'utf-8'), timestamp=EPOCH + timedelta(microseconds=micros)))
+        return messages
+
+    def read(self, start: int, end: int) -> List[ChatMessageModel]:
+        """Messages at positions start..end-1"""
+        if self.buffer is not None:
+            with memoryview(self.buffer) as view:
+                return self._decode(view, start, end)
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return self._decode(view, start, end)
+
+
+class _GroupArchive:
+    """All segments of one group, seqs are contiguous across them"""
+
+    def __init__(self, directory: Optional[str], group_id: uuid.UUID):
+        self.directory = directory
+        self.group_id = group_id
+        self.segments: List[_Segment] = []
+        self.first_seqs: List[int] = []
+        if directory and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".seg"):
+                    self._add(_Segment.load(os.path.join(directory, name)))
+
+    def _add(self, segment: _Segment):
+        self.segments.append(segment)
+        self.first_seqs.append(segment.first_seq)
+
+    @property
+    def last_seq(self) -> int:
+        return self.segments[-1].last_seq if self.segments else 0
+
+    def append(self, messages: List[ChatMessageModel]) -> Optional[str]:
+        """Returns the path written to (None in memory)"""
+        # Replaying the journal after a crash can hand in messages that were archived already
+        messages = [m for m in messages if m.seq > self.last_seq]
+        if not messages:
+            return None
+        if not self.segments or self.segments[-1].full:
+            path = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{messages[0].seq:012d}.seg")
+            self._add(_Segment.create(path, self.group_id, messages[0].seq))
+        segment = self.segments[-1]
+        segment.append(messages)
+        return segment.path
+
+    def read(self, before_seq: int, limit: int) -> List[ChatMessageModel]:
+        if not self.segments:
+            return []
+        end = min(before_seq, self.last_seq + 1)
+        start = max(self.first_seqs[0], end - limit)
+        messages = []
+        i = max(0, bisect.bisect_right(self.first_seqs, start) - 1)
+        while start < end and i < len(self.segments):
+            segment = self.segments[i]
+            stop = min(end, segment.last_seq + 1)
+            if start < stop:
+                messages.extend(segment.read(start - segment.first_seq, stop - segment.first_seq))
+                start = stop
+            i += 1
+        return messages
+
+
+class ChatArchive:
+    """
+    Chat messages that dropped out of the in-memory tail of GroupModel.chat_history.
+    Packed into append-only segment files under directory/<group_id>/ and read through mmap,
+    kept as the same packed bytes in memory when there is no directory.
+    Calls for one group must be serialized by the caller (MemoryStorage holds the group lock).
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._groups: Dict[uuid.UUID, _GroupArchive] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, group_id: uuid.UUID) -> Optional[str]:
+        return os.path.join(self.directory, str(group_id)) if self.directory else None
+
+    def _group(self, group_id: uuid.UUID) -> _GroupArchive:
+        with self._lock:
+            archive = self._groups.get(group_id)
+        if archive is None:
+            # Segments are indexed on first access, that scan must not hold up the other groups
+            archive = _GroupArchive(self._path(group_id), group_id)
+            with self._lock:
+                archive = self._groups.setdefault(group_id, archive)
+        return archive
+
+    def append(self, group_id: uuid.UUID, messages: List[ChatMessageModel]):
+        path = self._group(group_id).append(messages)
+        if path is not None:
+            with self._lock:
+                self._dirty.add(path)
+
+    def read(self, group_id: uuid.UUID, before_seq: int, limit: int) -> List[ChatMessageModel]:
+        return self._group(group_id).read(before_seq, limit)
+
+    def drop(self, group_id: uuid.UUID):
+        with self._lock:
+            self._groups.pop(group_id, None)
+            prefix = self._path(group_id)
+            if prefix:
+                self._dirty = {p for p in self._dirty if not p.startswith(prefix)}
+        path = self._path(group_id)
+        if path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def sync(self):
+        """fsync everything archived since the last call, the journal records of these messages may be dropped afterwards"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for path in dirty:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    os.fsync(f.fileno())
+        # New segment files and group directories are entries of their parent directories
+        directories = {os.path.dirname(path) for path in dirty}
+        if directories:
+            directories.add(self.directory)
+        for directory in directories:
+            if os.path.isdir(directory):
+                fsync_directory(directory)
@@ -5,4 +5,9 @@ load_dotenv()
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL = "gemini-2.0-flash"
-API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
\ No newline at end of file
+# Point GEMINI_API_BASE at fake_llm.py to test without Gemini
+API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+API_URL = f"{API_BASE}/models/{MODEL}:generateContent"
+STREAM_API_URL = f"{API_BASE}/models/{MODEL}:streamGenerateContent?alt=sse"
+# Point GOOGLE_MAPS_API_BASE at fake_places.py to test without the Places API
+MAPS_API_BASE = os.getenv("GOOGLE_MAPS_API_BASE", "https://maps.googleapis.com")
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import uuid
+from typing import Dict, Optional
+
+from fastapi import WebSocket
+
+from broadcast_bus import BroadcastBus, LocalBus
+
+# Messages buffered per socket before the client counts as too slow and is disconnected
+SEND_QUEUE_SIZE = 64
+SEND_TIMEOUT_SECONDS = 5.0
+CLOSE_TIMEOUT_SECONDS = 1.0
+# Policy violation, the client did not keep up with the chat
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+
+class _Connection:
+    """One websocket with its outbound queue, drained by its own writer task"""
+
+    def __init__(self, manager: 'ConnectionManager', websocket: WebSocket, group_id: uuid.UUID):
+        self.manager = manager
+        self.websocket = websocket
+        self.group_id = group_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), SEND_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to client of group {self.group_id}: {e!r}")
+            self.manager.evict(self)
+
+
+class ConnectionManager:
+    """Websockets of this worker, messages of all workers reach them through the bus"""
+
+    def __init__(self, bus: Optional[BroadcastBus] = None):
+        self.active_connections: Dict[uuid.UUID, Dict[WebSocket, _Connection]] = {}
+        self.bus = bus or LocalBus()
+        self.bus.subscribe("chat/", self._deliver)
+
+    async def connect(self, websocket: WebSocket, group_id: uuid.UUID):
+        await websocket.accept()
+        self.register(websocket, group_id)
+
+    def register(self, websocket: WebSocket, group_id: uuid.UUID):
+        """Start delivering the group's messages to an accepted socket"""
+        self.active_connections.setdefault(group_id, {})[websocket] = _Connection(self, websocket, group_id)
+        print(f"Client connected to group {group_id}")
+
+    def send(self, websocket: WebSocket, group_id: uuid.UUID, message: dict):
+        """Queue a message for one socket only (acks, errors), behind the broadcasts already queued for it"""
+        connection = self.active_connections.get(group_id, {}).get(websocket)
+        if connection is None:
+            return
+        try:
+            connection.queue.put_nowait(json.dumps(message, separators=(",", ":"), ensure_ascii=False))
+        except asyncio.QueueFull:
+            self.evict(connection)
+
+    def _remove(self, websocket: WebSocket, group_id: uuid.UUID):
+        connections = self.active_connections.get(group_id)
+        if connections is None:
+            return None
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[group_id]
+        return connection
+
+    def disconnect(self, websocket: WebSocket, group_id: uuid.UUID):
+        connection = self._remove(websocket, group_id)
+        if connection is not None:
+            connection.writer.cancel()
+            print(f"Client disconnected from group {group_id}")
+
+    def evict(self, connection: _Connection):
+        """Drop a client that fell behind or whose send failed, the others are not held up by it"""
+        if self._remove(connection.websocket, connection.group_id) is None:
+            return
+        connection.writer.cancel()
+        asyncio.create_task(self._close(connection.websocket))
+        print(f"Evicted slow client from group {connection.group_id}")
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), CLOSE_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def broadcast(self, message: dict, group_id: uuid.UUID):
+        """Publish the message to the sockets of the group in every worker, serialized once; never waits for a client"""
+        # Same encoding as WebSocket.send_json
+        self.bus.publish(f"chat/{group_id}", json.dumps(message, separators=(",", ":"), ensure_ascii=False))
+
+    def _deliver(self, group_id: str, text: str):
+        connections = self.active_connections.get(uuid.UUID(group_id))
+        if not connections:
+            return
+        for connection in list(connections.values()):
+            try:
+                connection.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self.evict(connection)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from http import HTTPStatus
+from typing import AsyncIterator, Dict, Optional
+
+
+class FakeRequest:
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.target = target
+        self.headers = headers
+        self.body = body
+
+
+class FakeResponse:
+    """A body with Content-Length, or chunks sent with chunked transfer encoding as they are produced"""
+
+    def __init__(self, status: int = 200, content_type: str = "application/json", body: bytes = b"",
+                 chunks: Optional[AsyncIterator[bytes]] = None):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.chunks = chunks
+
+    @classmethod
+    def json(cls, payload, status: int = 200) -> 'FakeResponse':
+        return cls(status, body=json.dumps(payload).encode())
+
+
+class FakeHTTPServer(ABC):
+    """
+    Minimal HTTP/1.1 server for the fake Google APIs: keep-alive connections, Content-Length request bodies.
+    Subclasses only turn a request into a response.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @abstractmethod
+    async def respond(self, request: FakeRequest) -> FakeResponse: ...
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def start_in_thread(self):
+        """Run on a private event loop in a daemon thread, for tests that drive the API synchronously"""
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:  # keep-alive, the clients pool their connections
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                await self._write(writer, await self.respond(FakeRequest(method, target, headers, body)))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: FakeResponse):
+        head = f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}\r\nContent-Type: {response.content_type}\r\n"
+        if response.chunks is None:
+            writer.write(f"{head}Content-Length: {len(response.body)}\r\n\r\n".encode() + response.body)
+            await writer.drain()
+            return
+        writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+        await writer.drain()
+        async for chunk in response.chunks:
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import random
+from typing import AsyncIterator, List
+
+from fake_http import FakeHTTPServer, FakeRequest, FakeResponse
+
+# Answer of the fake model, streamed in pieces of CHUNK_WORDS words
+DEFAULT_ANSWER = ("Servus! Right next to you is the Viktualienmarkt, Munich's food market since 1807. "
+                  "Grab a Brezn and say 'Griaß di' - that's Bavarian for hello. "
+                  "Check the Munich Companion map to find a group heading there today!")
+CHUNK_WORDS = 4
+
+
+def _candidate(text: str) -> bytes:
+    return json.dumps({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}).encode()
+
+
+class FakeLLMServer(FakeHTTPServer):
+    """
+    Stand-in for Gemini's generateContent and streamGenerateContent?alt=sse.
+    first_chunk_delay is the time to the first token, chunk_delay the time between the following ones.
+    Prompts that ask for a plain yes/no (ask_automated) are answered with "yes".
+    error_rate is the share of requests answered with 503, which the client retries.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, first_chunk_delay: float = 0.5,
+                 chunk_delay: float = 0.1, answer: str = DEFAULT_ANSWER, error_rate: float = 0.0):
+        super().__init__(host, port)
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.answer = answer
+        self.error_rate = error_rate
+        self.rng = random.Random()
+
+    @property
+    def base_url(self) -> str:
+        return f"{super().base_url}/v1beta"
+
+    def _chunks(self, prompt: str) -> List[str]:
+        if "exactly yes or no" in prompt:
+            return ["yes"]
+        words = self.answer.split(" ")
+        return [" ".join(words[i:i + CHUNK_WORDS]) + " " for i in range(0, len(words), CHUNK_WORDS)]
+
+    async def respond(self, request: FakeRequest) -> FakeResponse:
+        try:
+            prompt = json.loads(request.body)["contents"][0]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError):
+            prompt = ""
+        chunks = self._chunks(prompt)
+        if self.rng.random() < self.error_rate:
+            return FakeResponse.json({"error": {"code": 503, "message": "Injected by the fake Gemini server"}}, status=503)
+        if ":streamGenerateContent" in request.target:
+            return FakeResponse(content_type="text/event-stream", chunks=self._stream(chunks))
+        await asyncio.sleep(self.first_chunk_delay + self.chunk_delay * (len(chunks) - 1))
+        return FakeResponse(body=_candidate("".join(chunks).strip()))
+
+    async def _stream(self, chunks: List[str]) -> AsyncIterator[bytes]:
+        for i, text in enumerate(chunks):
+            await asyncio.sleep(self.first_chunk_delay if i == 0 else self.chunk_delay)
+            yield b"data: " + _candidate(text) + b"\r\n\r\n"
+
+
+async def _main(args):
+    server = FakeLLMServer(args.host, args.port, args.first_chunk_delay, args.chunk_delay, error_rate=args.error_rate)
+    await server.start()
+    print(f"Fake Gemini on {server.base_url} (set GEMINI_API_BASE to this)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini API with configurable delays")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-chunk-delay", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(_main(parser.parse_args()))
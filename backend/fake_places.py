@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from fake_http import FakeHTTPServer, FakeRequest, FakeResponse
+from spatial_index import estimate_distance_km
+
+PAGE_SIZE = 20
+MAX_PAGES = 3
+
+# (place_id, name, lat, lng, types, rating, user_ratings_total, price_level)
+LANDMARKS = [
+    ("fake-marienplatz", "Marienplatz", 48.1374, 11.5755, ["tourist_attraction", "point_of_interest"], 4.7, 98000, 0),
+    ("fake-viktualienmarkt", "Viktualienmarkt", 48.1351, 11.5763, ["food", "point_of_interest"], 4.6, 61000, 2),
+    ("fake-hofbraeuhaus", "Hofbräuhaus", 48.1376, 11.5799, ["bar", "restaurant", "point_of_interest"], 4.4, 83000, 2),
+    ("fake-augustiner-keller", "Augustiner-Keller", 48.1437, 11.5521, ["bar", "restaurant", "point_of_interest"], 4.5, 14000, 2),
+    ("fake-p1", "P1 Club", 48.1441, 11.5859, ["night_club", "point_of_interest"], 3.6, 2900, 3),
+    ("fake-harry-klein", "Harry Klein", 48.1403, 11.5654, ["night_club", "point_of_interest"], 4.2, 1800, 2),
+    ("fake-pinakothek", "Alte Pinakothek", 48.1482, 11.5700, ["museum", "art_gallery", "point_of_interest"], 4.7, 17000, 0),
+    ("fake-lenbachhaus", "Lenbachhaus", 48.1469, 11.5638, ["museum", "art_gallery", "point_of_interest"], 4.6, 7800, 0),
+    ("fake-deutsches-museum", "Deutsches Museum", 48.1299, 11.5834, ["museum", "point_of_interest"], 4.7, 48000, 0),
+    ("fake-rathaus", "Neues Rathaus", 48.1376, 11.5762, ["city_hall", "point_of_interest"], 4.7, 12000, 0),
+    ("fake-residenz", "Residenz München", 48.1410, 11.5786, ["museum", "point_of_interest"], 4.6, 21000, 0),
+    ("fake-englischer-garten", "Englischer Garten", 48.1642, 11.6056, ["park", "point_of_interest"], 4.8, 57000, 0),
+    ("fake-olympiapark", "Olympiapark", 48.1755, 11.5518, ["park", "stadium", "point_of_interest"], 4.7, 66000, 0),
+    ("fake-hellabrunn", "Tierpark Hellabrunn", 48.0982, 11.5553, ["zoo", "amusement_park", "point_of_interest"], 4.5, 38000, 2),
+    ("fake-allianz-arena", "Allianz Arena", 48.2188, 11.6247, ["stadium", "point_of_interest"], 4.7, 79000, 0),
+    ("fake-nymphenburg", "Schloss Nymphenburg", 48.1583, 11.5033, ["museum", "park", "point_of_interest"], 4.7, 41000, 0),
+]
+
+# Types the mood configs search for, spread over the synthetic places
+SYNTHETIC_TYPES = ["bar", "night_club", "museum", "art_gallery", "city_hall", "park", "zoo", "restaurant", "cafe",
+                   "stadium", "gym", "amusement_park"]
+STREETS = ["Sendlinger", "Schwabinger", "Haidhauser", "Maxvorstädter", "Giesinger", "Neuhauser", "Bogenhausener"]
+
+
+def munich_places(count: int = 600, seed: int = 2215) -> List[Dict]:
+    """Landmarks plus synthetic places, denser in the center like the real city, in Places API result format"""
+    rng = random.Random(seed)
+    rows = list(LANDMARKS)
+    for i in range(count):
+        place_type = SYNTHETIC_TYPES[i % len(SYNTHETIC_TYPES)]
+        lat = rng.gauss(48.1374, 0.025)
+        lng = rng.gauss(11.5755, 0.035)
+        rows.append((f"fake-{i}", f"{rng.choice(STREETS)} {place_type.replace('_', ' ').title()} {i}", lat, lng,
+                     [place_type, "point_of_interest"], round(rng.uniform(3.0, 5.0), 1), rng.randint(5, 5000),
+                     rng.randint(0, 4)))
+    return [{
+        "place_id": place_id,
+        "name": name,
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+        "types": types,
+        "rating": rating,
+        "user_ratings_total": ratings,
+        "price_level": price,
+        "vicinity": "München",
+        "opening_hours": {"open_now": True},
+    } for place_id, name, lat, lng, types, rating, ratings, price in rows]
+
+
+class FakePlacesServer(FakeHTTPServer):
+    """
+    Stand-in for the Places API endpoints the backend uses (nearbysearch, details).
+    Nearby search filters by radius and type (the keyword is ignored) and orders by rating and number of ratings.
+    latency is added to every response, error_rate is the share of requests answered with UNKNOWN_ERROR.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.15, error_rate: float = 0.0,
+                 places: Optional[List[Dict]] = None):
+        super().__init__(host, port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.places = places if places is not None else munich_places()
+        self.by_id = {place["place_id"]: place for place in self.places}
+        self.rng = random.Random()
+
+    def nearby_search(self, params: Dict[str, str]) -> Dict:
+        token = params.get("pagetoken")
+        if token:
+            # The token carries the original query, paging is stateless
+            params = {k: v[0] for k, v in parse_qs(token).items()}
+        lat, lng = (float(x) for x in params["location"].split(","))
+        radius_km = float(params.get("radius", 5000)) / 1000
+        place_type = params.get("type")
+        found = [p for p in self.places
+                 if (not place_type or place_type in p["types"])
+                 and estimate_distance_km(lat, lng, p["geometry"]["location"]["lat"], p["geometry"]["location"]["lng"]) <= radius_km]
+        found.sort(key=lambda p: -p["rating"] * math.log1p(p["user_ratings_total"]))  # "prominence"
+        page = int(params.get("page", 0))
+        results = found[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        body = {"status": "OK" if results else "ZERO_RESULTS", "results": results}
+        if (page + 1) * PAGE_SIZE < len(found) and page + 1 < MAX_PAGES:
+            next_params = {k: v for k, v in params.items() if k in ("location", "radius", "type", "keyword")}
+            next_params["page"] = str(page + 1)
+            body["next_page_token"] = "&".join(f"{k}={v}" for k, v in next_params.items())
+        return body
+
+    def details(self, params: Dict[str, str]) -> Dict:
+        place = self.by_id.get(params.get("placeid") or params.get("place_id", ""))
+        if place is None:
+            return {"status": "NOT_FOUND"}
+        return {"status": "OK", "result": {"place_id": place["place_id"], "name": place["name"], "geometry": place["geometry"]}}
+
+    def handle(self, target: str) -> Dict:
+        url = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self.rng.random() < self.error_rate:
+            return {"status": "UNKNOWN_ERROR", "error_message": "Injected by the fake Places server"}
+        if url.path.endswith("/place/nearbysearch/json"):
+            return self.nearby_search(params)
+        if url.path.endswith("/place/details/json"):
+            return self.details(params)
+        return {"status": "INVALID_REQUEST", "error_message": f"Not faked: {url.path}"}
+
+    async def respond(self, request: FakeRequest) -> FakeResponse:
+        await asyncio.sleep(self.latency)
+        try:
+            return FakeResponse.json(self.handle(request.target))
+        except (KeyError, ValueError) as e:
+            return FakeResponse.json({"status": "INVALID_REQUEST", "error_message": str(e)})
+
+
+async def _main(args):
+    server = FakePlacesServer(args.host, args.port, args.latency, args.error_rate)
+    await server.start()
+    print(f"Fake Places API with {len(server.places)} places on {server.base_url} (set GOOGLE_MAPS_API_BASE to this)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Places API with Munich places")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(_main(parser.parse_args()))
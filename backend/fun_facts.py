@@ -0,0 +1,88 @@
+import asyncio
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from spatial_index import KM_PER_DEG_LAT, KM_PER_DEG_LNG
+from ttl_cache import TTLCache
+
+# Everybody within the same cell and time-of-day bucket gets the same fact
+CELL_KM = 0.5
+BUCKET_HOURS = 3
+FUN_FACT_TTL_SECONDS = BUCKET_HOURS * 3600
+FUN_FACT_CACHE_SIZE = 4096
+PREWARM_INTERVAL_SECONDS = 15 * 60
+FUN_FACT_QUESTION = "Can you give me any fun facts about my nearby location?"
+
+# Places most users open the app at, warmed before anyone asks
+POPULAR_SPOTS: List[Tuple[float, float]] = [
+    (48.1374, 11.5755),  # Marienplatz
+    (48.1351, 11.5763),  # Viktualienmarkt
+    (48.1423, 11.5770),  # Odeonsplatz
+    (48.1402, 11.5600),  # Hauptbahnhof
+    (48.1497, 11.5679),  # TUM Stammgelände
+    (48.1508, 11.5805),  # LMU Hauptgebäude
+    (48.1642, 11.6056),  # Englischer Garten
+    (48.1299, 11.5834),  # Deutsches Museum
+    (48.1755, 11.5518),  # Olympiapark
+    (48.1583, 11.5033),  # Schloss Nymphenburg
+    (48.2188, 11.6247),  # Allianz Arena
+]
+
+CellKey = Tuple[int, int, int]
+
+
+def cell_key(lat: float, lng: float, now: datetime) -> CellKey:
+    return (math.floor(lat * KM_PER_DEG_LAT / CELL_KM), math.floor(lng * KM_PER_DEG_LNG / CELL_KM),
+            now.hour // BUCKET_HOURS)
+
+
+def cell_center(key: CellKey) -> Tuple[float, float]:
+    """The prompt uses the cell center, so the cached answer fits everybody in the cell"""
+    return (round((key[0] + 0.5) * CELL_KM / KM_PER_DEG_LAT, 5), round((key[1] + 0.5) * CELL_KM / KM_PER_DEG_LNG, 5))
+
+
+class FunFactService:
+    """Fun facts for /api/chatbot/automatic: the fact and its accepted/rejected verdict are cached per cell and bucket"""
+
+    def __init__(self, chatbot, cache: Optional[TTLCache] = None):
+        self.chatbot = chatbot
+        # Rejected facts are cached as "" so they are not asked for again either
+        self.cache = cache or TTLCache(FUN_FACT_CACHE_SIZE, FUN_FACT_TTL_SECONDS)
+        self._inflight: Dict[CellKey, asyncio.Future] = {}
+
+    async def get(self, lat: float, lng: float, now: Optional[datetime] = None) -> str:
+        key = cell_key(lat, lng, now or datetime.now())
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # Concurrent misses for the same cell wait for one pair of LLM calls
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._compute(key))
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _compute(self, key: CellKey) -> str:
+        lat, lng = cell_center(key)
+        response = await self.chatbot.ask(FUN_FACT_QUESTION, location={"lat": lat, "lng": lng})
+        if response.startswith("Error") or response == "Unexpected response format":
+            return ""  # not cached, the next poll tries again
+        valid_response = await self.chatbot.ask_automated(response)
+        if valid_response.startswith("Error"):
+            return ""
+        fact = "" if "no" in valid_response else response
+        self.cache.set(key, fact)
+        return fact
+
+    async def prewarm(self, now: Optional[datetime] = None):
+        now = now or datetime.now()
+        await asyncio.gather(*(self.get(lat, lng, now) for lat, lng in POPULAR_SPOTS), return_exceptions=True)
+
+    async def run_prewarm(self):
+        while True:
+            try:
+                await self.prewarm()
+            except Exception as e:
+                print(f"Fun fact prewarm failed: {e}")
+            await asyncio.sleep(PREWARM_INTERVAL_SECONDS)
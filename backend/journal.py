@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+SEGMENT_PATTERN = re.compile(r"journal-(\d+)\.log$")
+SNAPSHOT_FILE = "snapshot.db"
+
+
+def fsync_directory(path: str):
+    """Make created, renamed and removed entries of a directory durable, fsyncing a file only covers its contents"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalError(RuntimeError):
+    """The writer thread failed, nothing appended from then on becomes durable"""
+
+
+class Journal:
+    """
+    Append-only journal of mutations, split into numbered segment files, plus one snapshot file.
+
+    append() only queues the record. A writer thread writes whatever has queued up, fsyncs once per
+    batch (group commit) and wakes everyone waiting in wait_durable() for those records.
+    When a write or fsync fails the writer stops and the error is raised from every waiting and later call.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        existing = self.segments()
+        self.segment = (existing[-1] + 1) if existing else 1
+        self._file = open(self._segment_path(self.segment), 'ab')
+        fsync_directory(directory)
+
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[Optional[int], object]] = []
+        self._next_seq = 1
+        self._durable_seq = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self.records_since_snapshot = 0
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"journal-{segment:06d}.log")
+
+    def segments(self) -> List[int]:
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def append(self, op: str, data: Dict) -> int:
+        """Queue a record, returns its sequence number for wait_durable"""
+        line = json.dumps({"op": op, **data}, separators=(',', ':')).encode() + b"\n"
+        with self._cond:
+            self._raise_if_failed()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._queue.append((seq, line))
+            self.records_since_snapshot += 1
+            self._cond.notify_all()
+        return seq
+
+    def wait_durable(self, seq: int):
+        with self._cond:
+            while self._durable_seq < seq and not self._closed and self._error is None:
+                self._cond.wait()
+            if self._durable_seq < seq:
+                self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        # Caller holds _cond
+        if self._error is not None:
+            raise JournalError(f"Journal write failed: {self._error!r}") from self._error
+
+    def rotate(self) -> int:
+        """Start a new segment, returns the number of the last closed one"""
+        done = threading.Event()
+        with self._cond:
+            self._raise_if_failed()
+            closed_segment = self.segment
+            self._queue.append((None, done))
+            self._cond.notify_all()
+        done.wait()
+        with self._cond:
+            self._raise_if_failed()
+        return closed_segment
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+                batch, self._queue = self._queue, []
+
+            try:
+                last_seq = self._write_batch(batch)
+            except Exception as e:
+                print(f"Journal writer stopped: {e!r}")
+                with self._cond:
+                    self._error = e
+                    pending, self._queue = batch + self._queue, []
+                    self._cond.notify_all()
+                for seq, item in pending:
+                    if seq is None:
+                        item.set()  # rotate() raises the error
+                return
+
+            with self._cond:
+                if last_seq is not None:
+                    self._durable_seq = last_seq
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: List[Tuple[Optional[int], object]]) -> Optional[int]:
+        last_seq = None
+        for seq, item in batch:
+            if seq is None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self.segment += 1
+                self._file = open(self._segment_path(self.segment), 'ab')
+                fsync_directory(self.directory)
+                item.set()
+                continue
+            self._file.write(item)
+            last_seq = seq
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return last_seq
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        try:
+            self._file.close()
+        except OSError:
+            if self._error is None:
+                raise  # after a failed write the buffered rest is expected to fail again
+
+    def replay(self, after_segment: int) -> Iterator[Dict]:
+        """Records of all segments newer than after_segment, in order"""
+        for segment in self.segments():
+            if segment <= after_segment or segment >= self.segment:
+                continue
+            with open(self._segment_path(segment), 'rb') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash, nothing after it was acknowledged
+                        print(f"Skipping damaged journal record in segment {segment}")
+                        break
+
+    def read_snapshot(self) -> Tuple[int, Iterator[bytes]]:
+        """Segment covered by the snapshot and an iterator over its lines"""
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0, iter(())
+        f = open(path, 'rb')
+        header = json.loads(f.readline())
+
+        def lines():
+            with f:
+                for line in f:
+                    yield line
+        return header["segment"], lines()
+
+    def write_snapshot(self, segment: int, lines: Iterable[bytes]):
+        """Atomically replace the snapshot and drop the journal segments it covers"""
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps({"segment": segment}).encode() + b"\n")
+            for line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # The rename must be durable before the segments it replaces are gone
+        fsync_directory(self.directory)
+        for old in self.segments():
+            if old <= segment:
+                os.remove(self._segment_path(old))
+        with self._cond:
+            self.records_since_snapshot = 0
@@ -0,0 +1,283 @@
+"""
+End-to-end load test for the API against the fake Places and Gemini servers.
+
+Virtual users loop over a mix of map, group, chat and chatbot requests (see MIX) without think time
+unless --think-ms is given. The report lists throughput and p50/p95/p99 latency per endpoint;
+--json writes the same numbers to a file to compare runs.
+
+By default the app runs in this process (httpx ASGI transport, lifespan included) and the fakes are
+started here too. With --url the requests go to a running server instead; start it with
+GOOGLE_MAPS_API_BASE and GEMINI_API_BASE pointing at `python fake_places.py` and `python fake_llm.py`.
+
+    python loadtest.py
+    python loadtest.py --users 200 --duration 60 --places-latency 0.3 --llm-error-rate 0.05
+    python loadtest.py --url http://127.0.0.1:8000 --json run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+sys.path.append(os.path.dirname(__file__))
+
+import httpx
+
+from fake_llm import FakeLLMServer
+from fake_places import LANDMARKS, FakePlacesServer
+
+MOODS = ["🌍 Everything", "🎉 Party / Pub Crawl", "🎨 Art & Culture", "🌿 Nature / Relax", "🍽️ Food Tour"]
+CHAT_LINES = ["Servus!", "Who is coming?", "I'm at the entrance", "Running 10 minutes late", "Prost 🍻"]
+CHAT_QUESTIONS = ["Where can I get a good Brezn?", "Any group going to a beer garden today?", "What should I see in Schwabing?"]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+
+class World:
+    """Users and groups of the run, with the memberships the harness knows about"""
+
+    def __init__(self, users: List[Dict], groups: List[Tuple[str, str]], members: Dict[int, Set[Tuple[str, str]]]):
+        self.users = users
+        self.groups = groups
+        self.members = members
+
+
+async def timed(client: httpx.AsyncClient, stats: Stats, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.is_success
+    except httpx.HTTPError:
+        response, ok = None, False
+    stats.record(name, time.perf_counter() - started, ok)
+    return response if ok else None
+
+
+def _position(rng: random.Random) -> Tuple[float, float]:
+    _, _, lat, lng, *_ = rng.choice(LANDMARKS)
+    return round(rng.gauss(lat, 0.003), 6), round(rng.gauss(lng, 0.003), 6)
+
+
+async def map_nearby(client, world, stats, user, rng):
+    lat, lng = _position(rng)
+    await timed(client, stats, "map_nearby", "GET", "/api/map/nearby",
+                params={"lat": lat, "lng": lng, "mood": rng.choice(MOODS), "radius": rng.choice([2000, 5000, 10000])})
+
+
+async def map_search(client, world, stats, user, rng):
+    lat, lng = _position(rng)
+    await timed(client, stats, "map_search", "GET", "/api/map/search",
+                params={"lat": lat, "lng": lng, "mood": rng.choice(MOODS), "radius": 5000})
+
+
+async def nearby_groups(client, world, stats, user, rng):
+    lat, lng = _position(rng)
+    await timed(client, stats, "nearby_groups", "GET", "/api/map/nearby/groups",
+                params={"lat": lat, "lng": lng, "radius": 3.0, "summary": True})
+
+
+async def location_groups(client, world, stats, user, rng):
+    location_id, _ = rng.choice(world.groups)
+    await timed(client, stats, "location_groups", "GET", f"/api/locations/{location_id}/groups")
+
+
+async def join(client, world, stats, user, rng):
+    joined = world.members[user["user_id"]]
+    candidates = [g for g in world.groups if g not in joined]
+    if not candidates:
+        return await chat_history(client, world, stats, user, rng)
+    location_id, group_id = rng.choice(candidates)
+    if await timed(client, stats, "join", "POST", "/api/groups/join",
+                   json={"location_id": location_id, "group_id": group_id, "user": user}) is not None:
+        joined.add((location_id, group_id))
+
+
+async def chat_send(client, world, stats, user, rng):
+    joined = world.members[user["user_id"]]
+    if not joined:
+        return await join(client, world, stats, user, rng)
+    location_id, group_id = rng.choice(sorted(joined))
+    await timed(client, stats, "chat_send", "POST", "/api/chat/send",
+                json={"location_id": location_id, "group_id": group_id, "user": user, "content": rng.choice(CHAT_LINES)})
+
+
+async def chat_history(client, world, stats, user, rng):
+    joined = world.members[user["user_id"]]
+    if not joined:
+        return await join(client, world, stats, user, rng)
+    location_id, group_id = rng.choice(sorted(joined))
+    await timed(client, stats, "chat_history", "GET", "/api/chat/history",
+                params={"location_id": location_id, "group_id": group_id, "user_id": user["user_id"]})
+
+
+async def chatbot_automatic(client, world, stats, user, rng):
+    lat, lng = _position(rng)
+    await timed(client, stats, "chatbot_automatic", "GET", "/api/chatbot/automatic", params={"lat": lat, "lng": lng})
+
+
+async def chatbot_user(client, world, stats, user, rng):
+    lat, lng = _position(rng)
+    await timed(client, stats, "chatbot_user", "GET", "/api/chatbot/user",
+                params={"user_input": rng.choice(CHAT_QUESTIONS), "lat": lat, "lng": lng})
+
+
+# Operation and relative weight, reads dominate like in the app
+MIX = [
+    (map_nearby, 20),
+    (map_search, 10),
+    (nearby_groups, 3),
+    (location_groups, 20),
+    (join, 5),
+    (chat_send, 15),
+    (chat_history, 15),
+    (chatbot_automatic, 8),
+    (chatbot_user, 4),
+]
+
+
+async def setup(client: httpx.AsyncClient, args) -> World:
+    rng = random.Random(args.seed)
+    users = [{"user_id": args.user_offset + i, "name": f"Load {i}", "age": rng.randint(20, 35),
+              "gender": rng.choice(["weiblich", "männlich", "divers"])} for i in range(args.users)]
+    for user in users:
+        await client.post("/users/register", json=user)  # 400 when a previous run registered it already
+
+    location_ids = [place_id for place_id, *_ in LANDMARKS[:args.locations]]
+    for i, location_id in enumerate(location_ids):
+        for k in range(args.groups_per_location):
+            host = users[(i * args.groups_per_location + k) % len(users)]
+            response = await client.post("/api/groups/create", json={
+                "location_id": location_id, "title": f"Load test {k}", "description": "Meet up",
+                "age_range": [18, 40], "date": (date.today() + timedelta(days=k % 3)).isoformat(), "host": host})
+            response.raise_for_status()
+
+    groups, members = [], defaultdict(set)
+    for location_id in location_ids:
+        response = await client.get(f"/api/locations/{location_id}/groups")
+        response.raise_for_status()
+        for location in response.json():
+            for group in location["groups"].values():
+                groups.append((location_id, group["group_id"]))
+                for user_id in group["member_ids"]:
+                    members[user_id].add((location_id, group["group_id"]))
+    return World(users, groups, members)
+
+
+async def virtual_user(client, world, stats, user, rng: random.Random, stop_at: float, think: float):
+    operations, weights = zip(*MIX)
+    while time.perf_counter() < stop_at:
+        operation = rng.choices(operations, weights)[0]
+        await operation(client, world, stats, user, rng)
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+
+
+async def run_load(client: httpx.AsyncClient, args) -> Tuple[Stats, float]:
+    world = await setup(client, args)
+    stats = Stats()
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    await asyncio.gather(*(virtual_user(client, world, stats, user, random.Random(args.seed + i), stop_at, args.think_ms / 1000)
+                           for i, user in enumerate(world.users)))
+    return stats, time.perf_counter() - started
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))]
+
+
+def report(stats: Stats, elapsed: float) -> Dict[str, Dict]:
+    rows = {}
+    everything = []
+    for name, latencies in sorted(stats.latencies.items()):
+        everything.extend(latencies)
+        rows[name] = _row(sorted(latencies), stats.errors[name], elapsed)
+    if everything:
+        rows["TOTAL"] = _row(sorted(everything), sum(stats.errors.values()), elapsed)
+
+    print(f"\n{'endpoint':<20}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in rows.items():
+        print(f"{name:<20}{row['count']:>8}{row['errors']:>8}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}")
+    return rows
+
+
+def _row(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def start_fakes(args):
+    places = FakePlacesServer(latency=args.places_latency, error_rate=args.places_error_rate).start_in_thread()
+    llm = FakeLLMServer(first_chunk_delay=args.llm_latency, chunk_delay=args.llm_chunk_delay,
+                        error_rate=args.llm_error_rate).start_in_thread()
+    # Read when config, GroupDataManager and main are imported
+    os.environ["GOOGLE_MAPS_API_BASE"] = places.base_url
+    os.environ["GEMINI_API_BASE"] = llm.base_url
+    os.environ.setdefault("GOOGLE_API_KEY", "AIza-loadtest-key")
+    os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-loadtest-key")
+    os.environ["PLACE_CACHE_PATH"] = ""
+    print(f"Fake Places on {places.base_url}, fake Gemini on {llm.base_url}")
+
+
+async def run(args) -> Tuple[Stats, float]:
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            return await run_load(client, args)
+
+    start_fakes(args)
+    import main
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://munich.test", timeout=args.timeout) as client:
+            return await run_load(client, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Munich Companion API")
+    parser.add_argument("--url", help="running server to test, default: the app in this process")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's requests")
+    parser.add_argument("--locations", type=int, default=len(LANDMARKS))
+    parser.add_argument("--groups-per-location", type=int, default=4)
+    parser.add_argument("--user-offset", type=int, default=100000, help="first user id")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--places-latency", type=float, default=0.15)
+    parser.add_argument("--places-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="time to the first token")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    stats, elapsed = asyncio.run(run(args))
+    rows = report(stats, elapsed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "elapsed_s": elapsed, "endpoints": rows}, f, indent=2, ensure_ascii=False)
+        print(f"Report written to {args.json}")
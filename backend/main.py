@@ -1,12 +1,21 @@
+import asyncio
+import json
+import os
+import re
 import uuid
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from watchfiles import awatch
 from app import MunichCompanion
 from models import *
 from mood_service import DirectMoodMapper
 import GroupDataManager as db
+from broadcast_bus import create_bus
+from connection_manager import ConnectionManager
+from fun_facts import FunFactService
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -29,43 +38,35 @@ class SendMessageRequest(BaseModel):
     user: UserModel
     content: str
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[uuid.UUID, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, group_id: uuid.UUID):
-        await websocket.accept()
-        if group_id not in self.active_connections:
-            self.active_connections[group_id] = []
-        self.active_connections[group_id].append(websocket)
-        print(f"Client connected to group {group_id}")
-
-    def disconnect(self, websocket: WebSocket, group_id: uuid.UUID):
-        if group_id in self.active_connections:
-            if websocket in self.active_connections[group_id]:
-                self.active_connections[group_id].remove(websocket)
-            if not self.active_connections[group_id]:
-                del self.active_connections[group_id]
-        print(f"Client disconnected from group {group_id}")
-
-    async def broadcast(self, message: dict, group_id: uuid.UUID):
-        if group_id in self.active_connections:
-            for connection in self.active_connections[group_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting: {e}")
-
-
-connection_manager = ConnectionManager()
+
+# Set MUNICH_BROADCAST_SOCKET to run several workers, they need a shared store too (MUNICH_STORAGE=sqlite)
+broadcast_bus = create_bus(os.getenv("MUNICH_BROADCAST_SOCKET"))
+connection_manager = ConnectionManager(broadcast_bus)
+# Each worker caches location JSON itself, changes made by one worker invalidate the caches of all
+broadcast_bus.subscribe("location/", lambda location_id, _: db.invalidate_location(location_id))
+db.location_listeners.append(lambda location_id: broadcast_bus.publish_threadsafe(f"location/{location_id}", ""))
 chatbot = MunichCompanion()
+fun_facts = FunFactService(chatbot)
+# Fills the fun fact cache for the busiest spots in the background, MUNICH_PREWARM_FUN_FACTS=0 turns it off
+PREWARM_FUN_FACTS = os.getenv("MUNICH_PREWARM_FUN_FACTS", "1") != "0"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting API")
+    db.open_storage()
+    await broadcast_bus.start()
     db.run_deleter_in_background()
+    db.run_geocode_retry_in_background()
+    db.run_snapshots_in_background()
+    prewarm = asyncio.create_task(fun_facts.run_prewarm()) if PREWARM_FUN_FACTS else None
     yield
     print("Shutting down API")
+    if prewarm is not None:
+        prewarm.cancel()
+    await broadcast_bus.close()
+    await chatbot.aclose()
+    db.write_snapshot()
+    db.close_storage()
 
 
 app = FastAPI(title="MunichCompanion API", lifespan=lifespan)
@@ -105,7 +106,7 @@ def register_new_user(user: UserModel):
 
 @app.get("/users/all")
 def get_all_users():
-    return list(db.users_db.values())
+    return db.get_all_users()
 
 @app.get("/users/{user_id}/groups")
 def get_groups_for_user(user_id: int):
@@ -118,7 +119,10 @@ def get_groups_for_user(user_id: int):
 
 
 @app.get("/api/map/nearby/groups")
-def get_nearby_groups(lat: float, lng: float, radius:float):
+def get_nearby_groups(lat: float, lng: float, radius:float, summary: bool = False):
+    # summary=true: member count instead of members and chat, ranked by distance and date
+    if summary:
+        return db.get_nearby_group_summaries(lat, lng, radius)
     nearby_groups = db.get_nearby_groups(lat, lng, radius)
     return nearby_groups
 
@@ -132,27 +136,53 @@ def get_places_nearby(
 ):
     try:
         result = mood_mapper.find_places(mood,lat, lng, radius)
-        print(result)
         return result
     except Exception as e:
         print(f"Error in mood_mapper: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/map/cache")
+def get_places_cache_stats():
+    """Hit/miss counters of the Places cache"""
+    return mood_mapper.cache.stats()
+
+@app.get("/api/map/search")
+def search_places_with_groups(
+        lat: float,
+        lng: float,
+        mood: str = "🌍 Everything",
+        radius: int = 10000
+):
+    try:
+        result = mood_mapper.find_places(mood, lat, lng, radius)
+        place_features = [f for f in result.get("features", []) if f["properties"].get("type") != "user"]
+        summaries = db.get_group_summaries_by_location([f["properties"]["id"] for f in place_features])
+        for feature in place_features:
+            feature["properties"]["groups"] = summaries.get(feature["properties"]["id"], [])
+        return result
+    except Exception as e:
+        print(f"Error in map search: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 13.1.2): "*" or any listed tag with the same opaque part"""
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in ENTITY_TAG.findall(if_none_match)
+
+
 @app.get("/api/locations/{location_id}/groups")
-def get_groups_at_location(location_id: str):
+def get_groups_at_location(location_id: str, request: Request):
     try:
-        json_strings_list = db.get_groups_by_location([location_id])
-        parsed_groups = []
-        for json_str in json_strings_list:
-            try:
-                parsed_groups.append(json.loads(json_str))
-            except json.JSONDecodeError:
-                continue
-        return parsed_groups
-    except ValueError:
-        return []
+        body, etag = db.get_location_groups_json(location_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/api/groups/create")
 def create_new_group(req: CreateGroupRequest):
@@ -176,26 +206,33 @@ def join_existing_group(req: JoinGroupRequest):
 
 @app.post("/api/chat/send")
 async def send_chat_message(req: SendMessageRequest):
-    created_message = db.send_message(location_id=req.location_id, group_id=req.group_id, user=req.user, content=req.content)
+    # The journal write blocks, keep it off the event loop that drives the websockets
+    created_message = await run_in_threadpool(db.send_message, location_id=req.location_id, group_id=req.group_id, user=req.user, content=req.content)
     if created_message is None:
         raise HTTPException(status_code=403, detail="Could not send message. User might not be in the group.")
     else:
         message_dict = created_message.model_dump(mode='json')
-        await connection_manager.broadcast(message_dict, req.group_id)
+        connection_manager.broadcast(message_dict, req.group_id)
         return {"status": "success", "message": "Message sent"}
 
 @app.get("/api/chat/history")
-def get_chat_history(location_id: str, group_id: uuid.UUID, user_id: int):
-    history = db.get_chat_history(location_id, group_id, user_id)
+def get_chat_history(location_id: str, group_id: uuid.UUID, user_id: int, before: Optional[int] = None,
+                     limit: int = Query(db.HISTORY_PAGE_SIZE, ge=1, le=db.CHAT_TAIL_SIZE)):
+    # Page backwards by passing the seq of the oldest message received as before
+    history = db.get_chat_history(location_id, group_id, user_id, before, limit)
     return history
 
 
+# Closest and soonest groups only, every one of them costs prompt tokens
+PROMPT_GROUP_LIMIT = 8
+
+
 @app.get("/api/chatbot/user")
-def chatbot_user_interaction(user_input: str, lat: float, lng: float):
+async def chatbot_user_interaction(user_input: str, lat: float, lng: float):
     try:
         location_data = {"lat": lat, "lng": lng}
-        active_groups = db.get_nearby_groups(lat, lng, radius_km=4.0)
-        response = chatbot.ask(user_input, location=location_data, available_groups=active_groups)
+        active_groups = await run_in_threadpool(db.get_nearby_group_summaries, lat, lng, 4.0, PROMPT_GROUP_LIMIT)
+        response = await chatbot.ask(user_input, location=location_data, available_groups=active_groups)
         return {"response": response}
     except ValueError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -204,16 +241,31 @@ def chatbot_user_interaction(user_input: str, lat: float, lng: float):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/chatbot/user/stream")
+async def chatbot_user_stream(user_input: str, lat: float, lng: float):
+    """Server-sent events: {"text": ...} per generated piece, then a "done" (or "error") event"""
+    location_data = {"lat": lat, "lng": lng}
+    active_groups = await run_in_threadpool(db.get_nearby_group_summaries, lat, lng, 4.0, PROMPT_GROUP_LIMIT)
+
+    async def events():
+        try:
+            async for text in chatbot.ask_stream(user_input, location=location_data, available_groups=active_groups):
+                yield f"data: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Chatbot Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    # No buffering in proxies, every piece should reach the widget as soon as it is generated
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/api/chatbot/automatic")
-def chatbot_automated_interaction(lat: float, lng: float):
+async def chatbot_automated_interaction(lat: float, lng: float):
     try:
-        location_data = {"lat": lat, "lng": lng}
-        response = chatbot.ask("Can you give me any fun facts about my nearby location?", location=location_data)
-        valid_response = chatbot.ask_automated(response)
-        if "no" in valid_response:
-            return {"response": ""}
-        else:
-            return {"response": response}
+        # Served from the cell/time-of-day cache, the LLM is only asked on a miss
+        return {"response": await fun_facts.get(lat, lng)}
     except ValueError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -221,11 +273,69 @@ def chatbot_automated_interaction(lat: float, lng: float):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+WS_AUTH_TIMEOUT_SECONDS = 10.0
+WS_MAX_MESSAGE_LENGTH = 2000
+
+
+async def _authenticate(websocket: WebSocket, group_id: uuid.UUID) -> Optional[Tuple[UserModel, str]]:
+    """First frame: {"type": "auth", "user_id": ..., "location_id": ...}, only members get in"""
+    try:
+        frame = json.loads(await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT_SECONDS))
+        user_id, location_id = int(frame["user_id"]), str(frame["location_id"])
+    except (asyncio.TimeoutError, ValueError, KeyError, TypeError):
+        return None
+    if frame.get("type") != "auth":
+        return None
+    user = await run_in_threadpool(db.get_user, user_id)
+    if user is None:
+        return None
+    if not await run_in_threadpool(db.is_group_member, location_id, group_id, user_id):
+        return None
+    return user, location_id
+
+
 @app.websocket("/api/ws/{group_id}")
 async def websocket_endpoint(websocket: WebSocket, group_id: uuid.UUID):
-    await connection_manager.connect(websocket, group_id)
+    # Bidirectional chat: authenticate once, then every {"type": "message", "content": ..., "client_id": ...}
+    # is stored, broadcast and answered with an ack carrying the server assigned seq
+    await websocket.accept()
+    try:
+        auth = await _authenticate(websocket, group_id)
+    except (WebSocketDisconnect, RuntimeError):
+        return
+    if auth is None:
+        await websocket.close(code=1008)
+        return
+    user, location_id = auth
+    connection_manager.register(websocket, group_id)
+    connection_manager.send(websocket, group_id, {"type": "ready"})
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                connection_manager.send(websocket, group_id, {"type": "error", "detail": "Invalid frame"})
+                continue
+            client_id = frame.get("client_id")
+            if frame.get("type") != "message":
+                connection_manager.send(websocket, group_id, {"type": "error", "client_id": client_id,
+                                                              "detail": f"Unknown frame type: {frame.get('type')!r}"})
+                continue
+            content = frame.get("content")
+            if not isinstance(content, str) or not content.strip() or len(content) > WS_MAX_MESSAGE_LENGTH:
+                connection_manager.send(websocket, group_id, {"type": "error", "client_id": client_id, "detail": "Invalid message"})
+                continue
+            created_message = await run_in_threadpool(db.send_message, location_id, group_id, user, content)
+            if created_message is None:
+                connection_manager.send(websocket, group_id, {"type": "error", "client_id": client_id, "detail": "Could not send message"})
+                continue
+            connection_manager.broadcast(created_message.model_dump(mode='json'), group_id)
+            connection_manager.send(websocket, group_id, {"type": "ack", "client_id": client_id, "seq": created_message.seq,
+                                                          "timestamp": created_message.timestamp.isoformat()})
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was already closed by an eviction
+        pass
+    finally:
         connection_manager.disconnect(websocket, group_id)
\ No newline at end of file
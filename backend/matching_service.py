@@ -1,9 +1,13 @@
-from typing import List, Dict, Optional
-from pydantic import BaseModel
+from typing import List, Dict, FrozenSet, NamedTuple, Optional, Tuple
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime, timedelta
 import math
 import json
 
+import numpy as np
+
+from spatial_index import KM_PER_DEG_LNG, GridIndex
+
 # ==========================================
 # INTEREST TAXONOMY DATA
 # ==========================================
@@ -73,6 +77,72 @@ ALL_INTERESTS = []
 for category_interests in INTEREST_CATEGORIES.values():
     ALL_INTERESTS.extend(category_interests)
 
+COMPLEMENTARY_PAIRS = [
+    ("Cooking & Baking", "Wine Tasting"),
+    ("Hiking", "Wildlife Photography"),
+    ("Programming", "AI"),
+    ("Music Festivals", "Travel Photography"),
+    ("Coffee & Espresso Culture", "Reading"),
+    ("Yoga", "Meditation"),
+    ("Photography", "Travel")
+]
+
+# Interned interest registry, built once: interest -> id (its position in ALL_INTERESTS and its bit in the
+# bitmasks), id -> category id and category bit. Every interest belongs to exactly one category.
+INTEREST_IDS: Dict[str, int] = {interest: interest_id for interest_id, interest in enumerate(ALL_INTERESTS)}
+CATEGORY_NAMES: List[str] = list(INTEREST_CATEGORIES)
+INTEREST_CATEGORY_IDS: List[int] = [category_id for category_id, category_interests in enumerate(INTEREST_CATEGORIES.values())
+                                    for _ in category_interests]
+INTEREST_CATEGORY_MASKS: List[int] = [1 << category_id for category_id in INTEREST_CATEGORY_IDS]
+INTEREST_WORDS = (len(ALL_INTERESTS) + 63) // 64
+# Pairs with an interest outside the taxonomy never match, add_user drops those interests
+COMPLEMENTARY_IDS = [(INTEREST_IDS[a], INTEREST_IDS[b]) for a, b in COMPLEMENTARY_PAIRS
+                     if a in INTEREST_IDS and b in INTEREST_IDS]
+
+# Users are bucketed into a grid of MATCH_CELL_KM cells, only the cells around the radius are scored
+MATCH_CELL_KM = 1.0
+EARTH_KM_PER_DEG = 6371 * math.pi / 180
+
+
+def _grid_radius_km(lat: float, radius_km: float) -> float:
+    """
+    GridIndex works with the Munich degree lengths. Widened by how much shorter a degree of longitude is
+    at the most poleward point of the radius, the grid query covers the whole haversine radius.
+    """
+    poleward = min(89.9, abs(lat) + radius_km / EARTH_KM_PER_DEG)
+    km_per_deg_lng = EARTH_KM_PER_DEG * math.cos(math.radians(poleward))
+    return radius_km * max(1.0, KM_PER_DEG_LNG / km_per_deg_lng)
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # NumPy < 2
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        return _BYTE_BITS[values.view(np.uint8)].reshape(*values.shape, -1).sum(axis=-1)
+
+
+class InterestEncoding(NamedTuple):
+    """A profile's interests resolved against the registry, cached on the profile by add_user"""
+    ids: FrozenSet[int]
+    words: np.ndarray  # interest bitmask, INTEREST_WORDS uint64 words
+    category_mask: int
+
+
+def encode_interests(interests: List[str]) -> InterestEncoding:
+    ids = frozenset(INTEREST_IDS[interest] for interest in interests if interest in INTEREST_IDS)
+    words = [0] * INTEREST_WORDS
+    category_mask = 0
+    for interest_id in ids:
+        words[interest_id >> 6] |= 1 << (interest_id & 63)
+        category_mask |= INTEREST_CATEGORY_MASKS[interest_id]
+    return InterestEncoding(ids, np.array(words, dtype=np.uint64), category_mask)
+
+
+def category_names(category_mask: int) -> List[str]:
+    return [name for category_id, name in enumerate(CATEGORY_NAMES) if category_mask >> category_id & 1]
+
 
 # ==========================================
 # DATA MODELS
@@ -85,12 +155,18 @@ class UserProfile(BaseModel):
     interests: List[str]
     location: Dict[str, float]  # {lat: 48.1351, lng: 11.5820}
     bio: Optional[str] = ""
+    avatar_emoji: Optional[str] = ""
+    _encoding: Optional[InterestEncoding] = PrivateAttr(default=None)
 
 
 class MatchRequest(BaseModel):
     current_user_id: str
     max_distance_km: int = 10
     min_match_score: int = 20
+    limit: int = Field(20, ge=1, le=100)
+    # The "cursor" of the last match received, the next page continues after it
+    cursor: Optional[str] = None
+    include_icebreakers: bool = True
 
 
 class ChatSession(BaseModel):
@@ -112,57 +188,173 @@ class IcebreakerRequest(BaseModel):
 # MATCHING SERVICE
 # ==========================================
 
+def _parse_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        score, row = cursor.split(":")
+        return float(score), int(row)
+    except ValueError:
+        raise ValueError(f"Invalid match cursor: {cursor}")
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k best entries (highest score, then earliest row) in that order. Bounded like a heap
+    selection but done with np.partition, so picking a page costs O(n) plus O(k log k) for its order.
+    """
+    candidates = np.arange(len(scores))
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        # rows are ascending, so the first ties are the earliest users
+        tied = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, tied])
+    return candidates[np.lexsort((rows[candidates], -scores[candidates]))]
+
+
+def _encoding_of(user: UserProfile) -> InterestEncoding:
+    """The encoding cached by add_user, profiles that were never added are encoded on the spot"""
+    return user._encoding if user._encoding is not None else encode_interests(user.interests)
+
+
+class _ProfileArrays:
+    """Coordinates and interest/category bitmasks of all profiles in contiguous arrays, one row per user"""
+
+    def __init__(self, capacity: int = 1024):
+        self.grid = GridIndex(MATCH_CELL_KM)  # rows by location
+        self.rows: Dict[str, int] = {}
+        self.user_ids: List[str] = []
+        self.lat = np.zeros(capacity)
+        self.lng = np.zeros(capacity)
+        self.interests = np.zeros((capacity, INTEREST_WORDS), dtype=np.uint64)
+        self.categories = np.zeros(capacity, dtype=np.uint16)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def _grow(self):
+        capacity = 2 * len(self.lat)
+        self.lat = np.resize(self.lat, capacity)
+        self.lng = np.resize(self.lng, capacity)
+        self.interests = np.resize(self.interests, (capacity, INTEREST_WORDS))
+        self.categories = np.resize(self.categories, capacity)
+
+    def put(self, user: UserProfile, encoding: InterestEncoding):
+        row = self.rows.get(user.user_id)
+        if row is None:
+            row = len(self.user_ids)
+            if row == len(self.lat):
+                self._grow()
+            self.rows[user.user_id] = row
+            self.user_ids.append(user.user_id)
+        self.lat[row] = user.location["lat"]
+        self.lng[row] = user.location["lng"]
+        self.grid.insert(row, user.location["lat"], user.location["lng"])
+        self.interests[row] = encoding.words
+        self.categories[row] = encoding.category_mask
+
+    def rows_near(self, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """Rows in the grid cells around the radius, in insertion order"""
+        candidates = self.grid.query(lat, lng, _grid_radius_km(lat, radius_km))
+        rows = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        rows.sort()
+        return rows
+
+    def has_interest(self, rows: np.ndarray, bit: int) -> np.ndarray:
+        return (self.interests[rows, bit >> 6] >> np.uint64(bit & 63)) & np.uint64(1) == 1
+
+
 class MatchingService:
     def __init__(self):
         self.users: Dict[str, UserProfile] = {}
         self.chat_sessions: Dict[str, ChatSession] = {}
         self.icebreaker_templates = self._load_icebreaker_templates()
+        self.profiles = _ProfileArrays()
 
     def add_user(self, user: UserProfile):
         """Add or update user profile"""
         # Validate interests
-        valid_interests = [interest for interest in user.interests if interest in ALL_INTERESTS]
+        valid_interests = [interest for interest in user.interests if interest in INTEREST_IDS]
         user.interests = valid_interests
+        user._encoding = encode_interests(valid_interests)
         self.users[user.user_id] = user
+        self.profiles.put(user, user._encoding)
 
     def find_matches(self, request: MatchRequest) -> List[Dict]:
-        """Find potential matches for a user"""
+        """
+        One page of potential matches for a user, best first (ties in the order the users were added).
+        Only the returned page is turned into payloads.
+        """
         current_user = self.users.get(request.current_user_id)
         if not current_user:
             return []
 
+        rows, distances, scores = self._score_candidates(current_user, request.max_distance_km)
+        keep = scores >= request.min_match_score
+        if request.cursor:
+            cursor_score, cursor_row = _parse_cursor(request.cursor)
+            keep &= (scores < cursor_score) | ((scores == cursor_score) & (rows > cursor_row))
+        rows, distances, scores = rows[keep], distances[keep], scores[keep]
+
+        current = _encoding_of(current_user)
         matches = []
-        for user_id, user in self.users.items():
-            if user_id == request.current_user_id:
-                continue
-
-            # Calculate distance
-            distance = self._calculate_distance(current_user.location, user.location)
-            if distance > request.max_distance_km:
-                continue
-
-            # Calculate match score
-            match_data = self._calculate_match_score(current_user, user, distance)
-
-            if match_data["score"] >= request.min_match_score:
-                matches.append({
-                    "user": {
-                        "user_id": user.user_id,
-                        "name": user.name,
-                        "age": user.age,
-                        "bio": user.bio,
-                        "avatar_emoji": user.avatar_emoji,
-                        "interests": user.interests
-                    },
-                    "score": match_data["score"],
-                    "distance_km": distance,
-                    "shared_interests": match_data["shared_interests"],
-                    "shared_categories": match_data["shared_categories"],
-                    "icebreakers": self._generate_icebreakers(match_data["shared_interests"])
-                })
-
-        # Sort by match score (highest first)
-        return sorted(matches, key=lambda x: x["score"], reverse=True)
+        for i in _top_k(scores, rows, request.limit):
+            user = self.users[self.profiles.user_ids[rows[i]]]
+            distance = float(distances[i])
+            encoding = _encoding_of(user)
+            shared_interests = [ALL_INTERESTS[interest_id] for interest_id in sorted(current.ids & encoding.ids)]
+            matches.append({
+                "user": {
+                    "user_id": user.user_id,
+                    "name": user.name,
+                    "age": user.age,
+                    "bio": user.bio,
+                    "avatar_emoji": user.avatar_emoji,
+                    "interests": user.interests
+                },
+                # An int like _calculate_match_score's when the distance score is 0
+                "score": float(scores[i]) if distance < 10 else int(scores[i]),
+                "distance_km": distance,
+                "shared_interests": shared_interests,
+                "shared_categories": category_names(current.category_mask & encoding.category_mask),
+                "icebreakers": self._generate_icebreakers(shared_interests) if request.include_icebreakers else [],
+                "cursor": f"{float(scores[i])!r}:{rows[i]}"
+            })
+        return matches
+
+    def _score_candidates(self, current_user: UserProfile, max_distance_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Rows, distances and _calculate_match_score scores of everybody within max_distance_km, in one batch"""
+        profiles = self.profiles
+        lat1, lon1 = current_user.location["lat"], current_user.location["lng"]
+        rows = profiles.rows_near(lat1, lon1, max_distance_km)
+        rows = rows[rows != profiles.rows[current_user.user_id]]
+        lat2 = profiles.lat[rows]
+
+        # Same haversine (and operation order) as _calculate_distance
+        dlat = np.radians(lat2 - lat1)
+        dlon = np.radians(profiles.lng[rows] - lon1)
+        a = (np.sin(dlat / 2) * np.sin(dlat / 2) +
+             math.cos(math.radians(lat1)) * np.cos(np.radians(lat2)) *
+             np.sin(dlon / 2) * np.sin(dlon / 2))
+        distances = 6371 * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
+        in_range = distances <= max_distance_km
+        rows, distances = rows[in_range], distances[in_range]
+
+        current = _encoding_of(current_user)
+        exact_match_score = _popcount(profiles.interests[rows] & current.words).sum(axis=1, dtype=np.int64) * 10
+        category_match_score = _popcount(profiles.categories[rows] & np.uint16(current.category_mask)).astype(np.int64) * 5
+        distance_score = np.maximum(0, 10 - distances) * 2
+
+        complementary_score = np.zeros(len(rows), dtype=np.int64)
+        for id_a, id_b in COMPLEMENTARY_IDS:
+            pair = np.zeros(len(rows), dtype=bool)
+            if id_a in current.ids:
+                pair |= profiles.has_interest(rows, id_b)
+            if id_b in current.ids:
+                pair |= profiles.has_interest(rows, id_a)
+            complementary_score += pair * 3
+
+        return rows, distances, exact_match_score + category_match_score + distance_score + complementary_score
 
     def create_chat_session(self, user1_id: str, user2_id: str) -> Optional[ChatSession]:
         """Create a 24-hour chat session between two users"""
@@ -219,21 +411,22 @@ class MatchingService:
 
     def _calculate_match_score(self, user1: UserProfile, user2: UserProfile, distance: float) -> Dict:
         """Calculate comprehensive match score"""
+        encoding1, encoding2 = _encoding_of(user1), _encoding_of(user2)
+
         # Exact interest matches
-        shared_interests = list(set(user1.interests) & set(user2.interests))
+        shared_ids = encoding1.ids & encoding2.ids
+        shared_interests = [ALL_INTERESTS[i] for i in sorted(shared_ids)]
         exact_match_score = len(shared_interests) * 10
 
         # Category matches
-        user1_categories = self._get_user_categories(user1.interests)
-        user2_categories = self._get_user_categories(user2.interests)
-        shared_categories = list(user1_categories & user2_categories)
+        shared_categories = category_names(encoding1.category_mask & encoding2.category_mask)
         category_match_score = len(shared_categories) * 5
 
         # Distance score (closer = better)
         distance_score = max(0, 10 - distance) * 2
 
         # Complementary interests
-        complementary_score = self._calculate_complementary_score(user1.interests, user2.interests)
+        complementary_score = self._calculate_complementary_score(encoding1.ids, encoding2.ids)
 
         total_score = exact_match_score + category_match_score + distance_score + complementary_score
 
@@ -245,29 +438,13 @@ class MatchingService:
 
     def _get_user_categories(self, interests: List[str]) -> set:
         """Get categories for user's interests"""
-        categories = set()
-        for interest in interests:
-            for category, category_interests in INTEREST_CATEGORIES.items():
-                if interest in category_interests:
-                    categories.add(category)
-        return categories
-
-    def _calculate_complementary_score(self, interests1: List[str], interests2: List[str]) -> int:
-        """Score for complementary interest pairs"""
-        complementary_pairs = [
-            ("Cooking & Baking", "Wine Tasting"),
-            ("Hiking", "Wildlife Photography"),
-            ("Programming", "AI"),
-            ("Music Festivals", "Travel Photography"),
-            ("Coffee & Espresso Culture", "Reading"),
-            ("Yoga", "Meditation"),
-            ("Photography", "Travel")
-        ]
+        return set(category_names(encode_interests(interests).category_mask))
 
+    def _calculate_complementary_score(self, ids1: FrozenSet[int], ids2: FrozenSet[int]) -> int:
+        """Score for complementary interest pairs"""
         score = 0
-        for pair in complementary_pairs:
-            if (pair[0] in interests1 and pair[1] in interests2) or \
-                    (pair[1] in interests1 and pair[0] in interests2):
+        for id_a, id_b in COMPLEMENTARY_IDS:
+            if (id_a in ids1 and id_b in ids2) or (id_b in ids1 and id_a in ids2):
                 score += 3
         return score
 
@@ -352,7 +529,8 @@ async def add_user_profile(user: UserProfile):
 @app.post("/api/matching/find-matches")
 async def find_matches(request: MatchRequest):
     matches = matching_service.find_matches(request)
-    return {"matches": matches}
+    next_cursor = matches[-1]["cursor"] if len(matches) == request.limit else None
+    return {"matches": matches, "next_cursor": next_cursor}
 
 @app.post("/api/matching/create-chat")
 async def create_chat(user1_id: str, user2_id: str):
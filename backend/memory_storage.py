@@ -0,0 +1,505 @@
+import gc
+import heapq
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import ChatMessageModel, GroupModel, LocationModel, UserGroupInfo, UserModel
+from chat_archive import ChatArchive
+from journal import Journal
+from spatial_index import GridIndex, estimate_distance_km
+from storage import CHAT_TAIL_SIZE, HISTORY_PAGE_SIZE, StorageBackend, StorageError, group_summary
+
+GRID_CELL_KM = 1.0
+SNAPSHOT_MIN_RECORDS = 10000
+# Messages are moved to the archive in batches once the tail grows this far beyond CHAT_TAIL_SIZE
+CHAT_EVICT_BATCH = 50
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Dict based storage, optionally made durable by a journal plus snapshots in data_dir.
+
+    Locking:
+      registry_lock  -> adding/removing entries of users_db and locations_db (and groups of a new location)
+                        and iterating over them. Looking up a single entry is one atomic dict read and takes no lock,
+                        so requests for unrelated groups share no lock at all.
+      location._lock -> the groups dict and coordinates of one location
+      group._lock    -> member ids, chat_history and the archived chat of one group
+      user._lock     -> joined_groups of one user
+    Locks are always taken in this order. grid_lock and expiry_lock are leaves, nothing is acquired while holding them.
+
+    Journal records are appended while holding the lock that orders the mutation,
+    the fsync is waited for only after all locks are released.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None):
+        self.data_dir = data_dir
+        self.users_db: Dict[int, UserModel] = {}
+        self.locations_db: Dict[str, LocationModel] = {}
+        self.registry_lock = threading.Lock()
+        # Spatial index over locations that currently have groups
+        self.location_grid = GridIndex(cell_km=GRID_CELL_KM)
+        self.grid_lock = threading.Lock()
+        # (date, location_id, group_id) of every group, deleted groups are skipped when they come up
+        self.expiry_heap: List[Tuple[date, str, uuid.UUID]] = []
+        self.expiry_lock = threading.Lock()
+        self.journal: Optional[Journal] = None
+        # Messages older than the last CHAT_TAIL_SIZE of a group, on disk once open() has a data_dir
+        self.chat_archive = ChatArchive(None)
+
+    # --- journal ---
+
+    def _journal_append(self, op: str, **data) -> int:
+        if self.journal is None:
+            return 0
+        return self.journal.append(op, data)
+
+    def _journal_wait(self, seq: int):
+        if self.journal is not None and seq:
+            self.journal.wait_durable(seq)
+
+    # --- helpers ---
+
+    def _index_location(self, location: LocationModel):
+        if location.lat == 0.0 and location.lng == 0.0:
+            return
+        with self.grid_lock:
+            if location.location_id not in self.location_grid:
+                self.location_grid.insert(location.location_id, location.lat, location.lng)
+
+    def _unindex_if_empty(self, location: LocationModel):
+        if not location.groups:
+            with self.grid_lock:
+                self.location_grid.remove(location.location_id)
+
+    def _schedule_expiry(self, location_id: str, group: GroupModel):
+        with self.expiry_lock:
+            heapq.heappush(self.expiry_heap, (group.date, location_id, group.group_id))
+
+    def _forget_group(self, location_id: str, group: GroupModel):
+        """Remove what points at a deleted group: the members' back-references and the archived chat"""
+        for user_id in group.member_ids:
+            user = self.users_db.get(user_id)
+            if user is None:
+                continue
+            with user._lock:
+                user.joined_groups = [g for g in user.joined_groups if g.group_id != group.group_id]
+        # Under the group lock, so archive_chats and _trim_chat cannot recreate the archive afterwards
+        with group._lock:
+            group._deleted = True
+            self.chat_archive.drop(group.group_id)
+
+    def _drop_if_empty(self, location: LocationModel):
+        # create_group adds to a location while holding registry_lock, so an empty location cannot gain a group here
+        with self.registry_lock:
+            with location._lock:
+                if not location.groups and self.locations_db.get(location.location_id) is location:
+                    del self.locations_db[location.location_id]
+
+    def _get_location(self, location_id: str) -> Optional[LocationModel]:
+        return self.locations_db.get(location_id)
+
+    def _get_group(self, location_id: str, group_id: uuid.UUID) -> GroupModel:
+        location = self._get_location(location_id)
+        if location is None:
+            raise StorageError("this location doesnt have any groups yet")
+        with location._lock:
+            group = location.groups.get(group_id)
+        if group is None:
+            raise StorageError("Group was not found at the location")
+        return group
+
+    def _trim_chat(self, group: GroupModel):
+        # Caller holds group._lock
+        if group._deleted:
+            return
+        overflow = len(group.chat_history) - CHAT_TAIL_SIZE
+        if overflow >= CHAT_EVICT_BATCH:
+            self.chat_archive.append(group.group_id, group.chat_history[:overflow])
+            del group.chat_history[:overflow]
+
+    def archive_chats(self, older_than: datetime) -> List[str]:
+        with self.registry_lock:
+            locations = list(self.locations_db.values())
+        changed = []
+        for location in locations:
+            with location._lock:
+                groups = list(location.groups.values())
+            for group in groups:
+                with group._lock:
+                    if group._deleted:
+                        continue  # expired or deleted since the groups were listed
+                    # The newest message always stays, the next seq is derived from it
+                    tail = group.chat_history
+                    old = 0
+                    while old < len(tail) - 1 and tail[old].timestamp < older_than:
+                        old += 1
+                    if old:
+                        self.chat_archive.append(group.group_id, tail[:old])
+                        del tail[:old]
+                        if not changed or changed[-1] != location.location_id:
+                            changed.append(location.location_id)
+        return changed
+
+    def _add_group_to_user(self, user_id: int, location_id: str, group: GroupModel):
+        user = self.users_db.get(user_id)
+        if user is None:
+            return
+        with user._lock:
+            if any(existing.group_id == group.group_id for existing in user.joined_groups):
+                return  #avoid duplicates
+            user.joined_groups.append(UserGroupInfo(location_id=location_id, group_id=group.group_id, title=group.title))
+
+    # --- users ---
+
+    def register_user(self, user: UserModel) -> bool:
+        with self.registry_lock:
+            if user.user_id in self.users_db:
+                return False
+            self.users_db[user.user_id] = user
+            seq = self._journal_append("register", user=user.model_dump(mode='json'))
+        self._journal_wait(seq)
+        return True
+
+    def ensure_user(self, user: UserModel):
+        if user.user_id in self.users_db:
+            return
+        with self.registry_lock:
+            if user.user_id not in self.users_db:
+                self.users_db[user.user_id] = user
+                self._journal_append("register", user=user.model_dump(mode='json'))
+
+    def get_user(self, user_id: int) -> Optional[UserModel]:
+        return self.users_db.get(user_id)
+
+    def get_all_users(self) -> List[UserModel]:
+        with self.registry_lock:
+            return list(self.users_db.values())
+
+    def get_user_groups(self, user_id: int) -> List[UserGroupInfo]:
+        user = self.get_user(user_id)
+        if user is None:
+            return []
+        with user._lock:
+            return list(user.joined_groups)
+
+    # --- locations ---
+
+    def needs_coordinates(self, location_id: str) -> bool:
+        location = self._get_location(location_id)
+        return location is None or not location.resolved
+
+    def unresolved_locations(self) -> List[str]:
+        with self.registry_lock:
+            return [l.location_id for l in self.locations_db.values() if not l.resolved]
+
+    def _apply_coordinates(self, location: LocationModel, coords: Optional[Tuple[float, float]]) -> bool:
+        # Caller holds location._lock
+        if coords is None or location.resolved:
+            return False
+        location.lat, location.lng = coords
+        location.resolved = True
+        self._journal_append("coordinates", location_id=location.location_id, lat=location.lat, lng=location.lng)
+        if location.groups:
+            self._index_location(location)
+        return True
+
+    def set_coordinates(self, location_id: str, lat: float, lng: float) -> bool:
+        location = self._get_location(location_id)
+        if location is None:
+            return False
+        with location._lock:
+            return self._apply_coordinates(location, (lat, lng))
+
+    def location_json(self, location_id: str) -> Optional[bytes]:
+        location = self._get_location(location_id)
+        if location is None:
+            return None
+        # Serialized under the location lock only, appends to member and chat lists are safe to read concurrently
+        with location._lock:
+            return location.model_dump_json().encode()
+
+    def group_summaries(self, location_ids: List[str]) -> Dict[str, List[Dict]]:
+        with self.registry_lock:
+            locations = [self.locations_db[l] for l in location_ids if l in self.locations_db]
+        summaries = {}
+        for location in locations:
+            with location._lock:
+                if location.groups:
+                    summaries[location.location_id] = [group_summary(g, len(g.member_ids)) for g in location.groups.values()]
+        return summaries
+
+    def nearby_locations(self, lat: float, lng: float, radius_km: float) -> Dict[str, float]:
+        with self.grid_lock:
+            candidates = self.location_grid.query(lat, lng, radius_km)
+        with self.registry_lock:
+            locations = [self.locations_db[l] for l in candidates if l in self.locations_db]
+        distances = {}
+        for loc in locations:
+            distance = estimate_distance_km(lat, lng, loc.lat, loc.lng)
+            if distance <= radius_km:
+                distances[loc.location_id] = distance
+        return distances
+
+    def nearby_groups(self, lat: float, lng: float, radius_km: float) -> List[Dict]:
+        nearby_groups = []
+        location_ids = list(self.nearby_locations(lat, lng, radius_km))
+        with self.registry_lock:
+            locations = [self.locations_db[l] for l in location_ids if l in self.locations_db]
+        for loc in locations:
+            with loc._lock:
+                for group in loc.groups.values():
+                    g_data = group.model_dump(mode='json')
+                    g_data['location_id'] = loc.location_id
+                    nearby_groups.append(g_data)
+        return nearby_groups
+
+    # --- groups ---
+
+    def create_group(self, location_id: str, group: GroupModel, coords: Optional[Tuple[float, float]]):
+        with self.registry_lock:
+            location = self.locations_db.get(location_id)
+            if location is None:
+                location = LocationModel(location_id=location_id)
+                self.locations_db[location_id] = location
+
+            with location._lock:
+                if group.group_id in location.groups:
+                    raise StorageError("Something went wrong, pls try again")
+                location.groups[group.group_id] = group
+                seq = self._journal_append("create_group", location_id=location_id, group=group.model_dump(mode='json'))
+                self._apply_coordinates(location, coords)
+                self._index_location(location)
+        self._schedule_expiry(location_id, group)
+        self._add_group_to_user(group.host_id, location_id, group)
+        self._journal_wait(seq)
+
+    def delete_group(self, location_id: str, group_id: uuid.UUID):
+        location = self._get_location(location_id)
+        if location is None:
+            raise StorageError("Location not found")
+        with location._lock:
+            group = location.groups.pop(group_id, None)
+            if group is None:
+                raise StorageError("Group not found")
+            seq = self._journal_append("delete_group", location_id=location_id, group_id=str(group_id))
+            self._unindex_if_empty(location)
+        self._forget_group(location_id, group)
+        self._drop_if_empty(location)
+        self._journal_wait(seq)
+
+    def next_expiry(self) -> Optional[date]:
+        with self.expiry_lock:
+            return self.expiry_heap[0][0] if self.expiry_heap else None
+
+    def delete_expired(self, today: date) -> List[str]:
+        # Pops only the expired entries, one group at a time with only its location locked
+        touched = set()
+        while True:
+            with self.expiry_lock:
+                if not self.expiry_heap or self.expiry_heap[0][0] >= today:
+                    break
+                gdate, location_id, group_id = heapq.heappop(self.expiry_heap)
+            location = self._get_location(location_id)
+            if location is None:
+                continue
+            with location._lock:
+                group = location.groups.get(group_id)
+                if group is None or group.date != gdate:
+                    continue
+                del location.groups[group_id]
+                self._journal_append("delete_group", location_id=location_id, group_id=str(group_id))
+                self._unindex_if_empty(location)
+            self._forget_group(location_id, group)
+            self._drop_if_empty(location)
+            touched.add(location_id)
+        return sorted(touched)
+
+    def join_group(self, location_id: str, group_id: uuid.UUID, user: UserModel):
+        self.ensure_user(user)
+        group = self._get_group(location_id, group_id)
+
+        min_age, max_age = group.age_range
+        if not min_age <= user.age <= max_age:
+            raise StorageError("You dont fit the age restrictions of this Group")
+
+        with group._lock:
+            if not group.add_member(user.user_id):
+                raise StorageError("You cant join a Group twice")
+            seq = self._journal_append("join", location_id=location_id, group_id=str(group_id), user_id=user.user_id)
+        self._add_group_to_user(user.user_id, location_id, group)
+        self._journal_wait(seq)
+
+    # --- chat ---
+
+    def is_member(self, location_id: str, group_id: uuid.UUID, user_id: int) -> bool:
+        try:
+            group = self._get_group(location_id, group_id)
+        except StorageError:
+            return False
+        with group._lock:
+            return group.has_member(user_id)
+
+    def send_message(self, location_id: str, group_id: uuid.UUID, user: UserModel, content: str) -> ChatMessageModel:
+        group = self._get_group(location_id, group_id)
+        with group._lock:
+            if not group.has_member(user.user_id):
+                raise StorageError("You cant write in chats where you arent a member! What the hell did you do????")
+
+            new_message = ChatMessageModel(
+                seq=group.chat_history[-1].seq + 1 if group.chat_history else 1,
+                sender_id=user.user_id,
+                sender_name=user.name,
+                group_id=group.group_id,
+                content=content,
+                timestamp=datetime.now()
+            )
+            group.chat_history.append(new_message)
+            seq = self._journal_append("message", location_id=location_id, group_id=str(group_id), message=new_message.model_dump(mode='json'))
+            self._trim_chat(group)
+        self._journal_wait(seq)
+        return new_message
+
+    def get_chat_history(self, location_id: str, group_id: uuid.UUID, user_id: int,
+                         before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE) -> List[ChatMessageModel]:
+        group = self._get_group(location_id, group_id)
+        with group._lock:
+            if not group.has_member(user_id):
+                raise StorageError("Accesse denied: You are not a member.")
+            # Seqs in the tail are contiguous, the page boundaries are plain index arithmetic
+            tail = group.chat_history
+            oldest = tail[0].seq if tail else 1
+            end = len(tail) if before is None else max(0, min(len(tail), before - oldest))
+            page = tail[max(0, end - limit):end]
+            boundary = oldest if before is None else min(before, oldest)
+            if len(page) < limit and boundary > 1:
+                page = self.chat_archive.read(group_id, boundary, limit - len(page)) + page
+            return page
+
+    # --- persistence ---
+    # The snapshot is taken while requests keep running, so records written after the rotation may
+    # already be contained in it: every replay step is idempotent.
+
+    def _replay_group_joined(self, user_id: int, location_id: str, group: GroupModel):
+        user = self.users_db.get(user_id)
+        if user is not None and not any(g.group_id == group.group_id for g in user.joined_groups):
+            user.joined_groups.append(UserGroupInfo(location_id=location_id, group_id=group.group_id, title=group.title))
+
+    def _replay(self, record: Dict):
+        op = record["op"]
+        if op == "register":
+            user = UserModel.model_validate(record["user"])
+            self.users_db.setdefault(user.user_id, user)
+            return
+
+        location_id = record["location_id"]
+        location = self.locations_db.get(location_id)
+        if op == "create_group":
+            if location is None:
+                location = self.locations_db[location_id] = LocationModel(location_id=location_id)
+            group = GroupModel.model_validate(record["group"])
+            if group.group_id not in location.groups:
+                location.groups[group.group_id] = group
+                self._replay_group_joined(group.host_id, location_id, group)
+            return
+        if location is None:
+            return
+
+        if op == "coordinates":
+            location.lat, location.lng, location.resolved = record["lat"], record["lng"], True
+            return
+
+        group = location.groups.get(uuid.UUID(record["group_id"]))
+        if group is None:
+            return
+        if op == "delete_group":
+            del location.groups[group.group_id]
+            self._forget_group(location_id, group)
+            if not location.groups:
+                del self.locations_db[location_id]
+        elif op == "join":
+            if "user" in record:
+                # Journals written before groups referenced their members by id
+                user = UserModel.model_validate(record["user"])
+                self.users_db.setdefault(user.user_id, user)
+                record["user_id"] = user.user_id
+            if group.add_member(record["user_id"]):
+                self._replay_group_joined(record["user_id"], location_id, group)
+        elif op == "message":
+            message = ChatMessageModel.model_validate(record["message"])
+            if not group.chat_history or message.seq > group.chat_history[-1].seq:
+                group.chat_history.append(message)
+                self._trim_chat(group)
+
+    def open(self):
+        """Load the snapshot, replay the journal and start journaling new mutations"""
+        if not self.data_dir:
+            print("No MUNICH_DATA_DIR set, groups and chats are kept in memory only.")
+            return
+        start = time.perf_counter()
+        self.journal = Journal(self.data_dir)
+        self.chat_archive = ChatArchive(os.path.join(self.data_dir, "chats"))
+        segment, lines = self.journal.read_snapshot()
+        # Millions of long-lived objects are created here, repeated full collections would dominate the restore time
+        gc.disable()
+        try:
+            for line in lines:
+                if line.startswith(b"U "):
+                    user = UserModel.model_validate_json(line[2:])
+                    self.users_db[user.user_id] = user
+                elif line.startswith(b"L "):
+                    location = LocationModel.model_validate_json(line[2:])
+                    self.locations_db[location.location_id] = location
+            replayed = 0
+            for record in self.journal.replay(after_segment=segment):
+                self._replay(record)
+                replayed += 1
+        finally:
+            gc.enable()
+        gc.freeze()
+        # Snapshots written before expiry cleaned up after itself may hold empty locations and stale back-references
+        for location_id in [l for l, location in self.locations_db.items() if not location.groups]:
+            del self.locations_db[location_id]
+        for user in self.users_db.values():
+            user.joined_groups = [g for g in user.joined_groups
+                                  if g.location_id in self.locations_db and g.group_id in self.locations_db[g.location_id].groups]
+        for location in self.locations_db.values():
+            self._index_location(location)
+        self.expiry_heap = [(g.date, l.location_id, g.group_id) for l in self.locations_db.values() for g in l.groups.values()]
+        heapq.heapify(self.expiry_heap)
+        print(f"Restored {len(self.users_db)} users and {len(self.locations_db)} locations "
+              f"({replayed} journal records) in {time.perf_counter() - start:.2f}s")
+        if replayed:
+            self.snapshot()
+
+    def _snapshot_lines(self, users: List[UserModel], locations: List[LocationModel]):
+        for user in users:
+            with user._lock:
+                yield b"U " + user.model_dump_json().encode() + b"\n"
+        for location in locations:
+            with location._lock:
+                yield b"L " + location.model_dump_json().encode() + b"\n"
+        # Messages evicted from the tails above must be durable before the journal segments holding them are dropped
+        self.chat_archive.sync()
+
+    def snapshot(self):
+        if self.journal is None:
+            return
+        segment = self.journal.rotate()
+        with self.registry_lock:
+            users = list(self.users_db.values())
+            locations = list(self.locations_db.values())
+        self.journal.write_snapshot(segment, self._snapshot_lines(users, locations))
+        print(f"Snapshot written ({len(users)} users, {len(locations)} locations)")
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def needs_snapshot(self) -> bool:
+        return self.journal is not None and self.journal.records_since_snapshot >= SNAPSHOT_MIN_RECORDS
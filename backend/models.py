@@ -1,11 +1,13 @@
 import json
+import threading
 import uuid
-from pydantic import BaseModel, Field, model_validator
-from typing import List, Optional, Any, Tuple, Dict
+from pydantic import BaseModel, Field, PrivateAttr, computed_field, model_validator
+from typing import List, Optional, Any, Tuple, Dict, Set
 from datetime import date, datetime
 
 
 class ChatMessageModel(BaseModel):
+    seq: int = 0
     sender_id: int
     sender_name: str
     group_id: uuid.UUID
@@ -26,6 +28,7 @@ class UserModel(BaseModel):
     interests: List[str] = []
     bio: Optional[str] = None
     joined_groups: List[UserGroupInfo] = Field(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
 
 class GroupModel(BaseModel):
     group_id: uuid.UUID
@@ -34,11 +37,47 @@ class GroupModel(BaseModel):
     age_range: Tuple[int,int]
     date: date
     host_id: int
-    members: List[UserModel] = Field(default_factory=list)
+    # Members are referenced by id, the profiles live once in the users registry
+    member_ids: List[int] = Field(default_factory=list)
     chat_history: List[ChatMessageModel] = Field(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _member_set: Set[int] = PrivateAttr(default_factory=set)
+    # Set by the storage once the group is removed, holders of an older reference must not write for it anymore
+    _deleted: bool = PrivateAttr(default=False)
+
+    @model_validator(mode='before')
+    @classmethod
+    def _members_to_ids(cls, data: Any) -> Any:
+        # Older snapshots and journal records embed full user copies in "members"
+        if isinstance(data, dict) and "members" in data and "member_ids" not in data:
+            data = dict(data)
+            data["member_ids"] = [m["user_id"] if isinstance(m, dict) else m.user_id for m in data.pop("members")]
+        return data
+
+    def model_post_init(self, __context: Any):
+        self._member_set = set(self.member_ids)
+
+    @computed_field
+    @property
+    def members(self) -> List[Dict[str, int]]:
+        """Shape the frontend reads from group listings"""
+        return [{"user_id": user_id} for user_id in self.member_ids]
+
+    def has_member(self, user_id: int) -> bool:
+        return user_id in self._member_set
+
+    def add_member(self, user_id: int) -> bool:
+        """False if the user is already a member"""
+        if user_id in self._member_set:
+            return False
+        self._member_set.add(user_id)
+        self.member_ids.append(user_id)
+        return True
 
 class LocationModel(BaseModel):
     location_id: str
     lat: float = 0.0
     lng: float = 0.0
-    groups: Dict[uuid.UUID, GroupModel] = {}
\ No newline at end of file
+    resolved: bool = False
+    groups: Dict[uuid.UUID, GroupModel] = {}
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
@@ -1,17 +1,47 @@
 import googlemaps
+import math
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 import json
-from typing import List, Dict
+from typing import Callable, List, Dict, Set, Tuple
 import sys
 from datetime import datetime
 
+from config import MAPS_API_BASE
+from spatial_index import KM_PER_DEG_LAT, KM_PER_DEG_LNG
+from ttl_cache import TTLCache
+
 load_dotenv()
 
+# Searches from the same ~250 m cell with the same mood and radius share one Places request.
+# The radius is keyed exactly: Google ranks at most 20 results per type over the whole circle,
+# a search over a bigger circle cut down to the requested one would leave only a few of them.
+PLACES_CELL_KM = 0.25
+PLACES_MAX_RADIUS = 50000  # Places API maximum
+PLACES_TTL_SECONDS = 15 * 60
+# After the TTL an entry is still served for this long while it is refreshed in the background
+PLACES_STALE_SECONDS = 45 * 60
+PLACES_CACHE_SIZE = 1024
+# Every type of a mood is queried at once, each can follow up to PLACES_MAX_PAGES pages of 20 results
+PLACES_MAX_PAGES = int(os.getenv("PLACES_MAX_PAGES", "1"))
+PLACES_BUDGET_SECONDS = float(os.getenv("PLACES_BUDGET_SECONDS", "4"))
+PLACES_MAX_RESULTS = 60
+# Google only accepts a next_page_token a moment after handing it out
+PAGE_TOKEN_DELAY_SECONDS = 2.0
+_search_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="places")
+
+PlacesKey = Tuple[str, int, int, int]
+
 
 class DirectMoodMapper:
-    def __init__(self):
-        self.gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'))
+    def __init__(self, gmaps=None):
+        self.gmaps = gmaps or googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'), base_url=MAPS_API_BASE)
+        self.cache = TTLCache(PLACES_CACHE_SIZE, PLACES_TTL_SECONDS, PLACES_STALE_SECONDS)
+        self._inflight: Dict[PlacesKey, Future] = {}
+        self._lock = threading.Lock()
 
     def find_places(self, mood: str, lat: float, lng: float, radius: int = 20000) -> Dict:
         """Find places and return as GeoJSON for maps"""
@@ -28,26 +58,142 @@ class DirectMoodMapper:
             "🌍 Everything": {'types': ['point_of_interest'], 'keywords': ''}
         }
 
-        config = mood_configs.get(mood, {})
-
         try:
-            print(f"🔍 Searching for {mood} places near ({lat}, {lng}) within {radius}m radius...")
-
-            places_result = self.gmaps.places_nearby(
-                location=(lat, lng),
-                radius=radius,
-                type=config.get('types', [''])[0] if config.get('types') else None,
-                keyword=config.get('keywords', '')
-            )
+            key = self._cache_key(mood, lat, lng, radius)
+            places, stale = self.cache.lookup(key)
+            if places is None:
+                places = self._fetch(key, mood_configs.get(mood, {}))
+            elif stale:
+                self._refresh_in_background(key, mood_configs.get(mood, {}))
 
             # Convert to GeoJSON
-            geojson = self._create_geojson(places_result.get('results', []), mood, lat, lng, radius)
+            geojson = self._create_geojson(places, mood, lat, lng, radius)
 
             return geojson
 
         except Exception as e:
             return {"error": str(e), "type": "FeatureCollection", "features": []}
 
+    def _cache_key(self, mood: str, lat: float, lng: float, radius: int) -> PlacesKey:
+        return (mood, math.floor(lat * KM_PER_DEG_LAT / PLACES_CELL_KM), math.floor(lng * KM_PER_DEG_LNG / PLACES_CELL_KM),
+                min(int(radius), PLACES_MAX_RADIUS))
+
+    def _claim(self, key: PlacesKey) -> Tuple[Future, bool]:
+        """The in-flight future of the key and whether the caller created it and has to settle it"""
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return pending, False
+            pending = self._inflight[key] = Future()
+            return pending, True
+
+    def _settle(self, key: PlacesKey, pending: Future, search: Callable[[], Tuple[List[Dict], bool]]) -> List[Dict]:
+        """Runs the search of a claimed key, caches a complete result and hands it to everyone waiting"""
+        try:
+            places, complete = search()
+            if complete:
+                self.cache.set(key, places)
+            pending.set_result(places)
+            return places
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _fetch(self, key: PlacesKey, config: Dict) -> List[Dict]:
+        """Places for the key from Google and into the cache, concurrent fetches of the same key share one request"""
+        pending, owner = self._claim(key)
+        if not owner:
+            return pending.result()
+        return self._settle(key, pending, lambda: self._search(key, config))
+
+    def _refresh_in_background(self, key: PlacesKey, config: Dict):
+        """
+        The type queries go to _search_pool and the last one to finish merges the result,
+        no thread waits for the others. A refresh already in flight for the key is joined.
+        """
+        pending, owner = self._claim(key)
+        if not owner:
+            return
+        futures = self._start_search(key, config)
+        remaining = [len(futures)]
+
+        def query_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                self._settle(key, pending, lambda: self._collect(key[0], futures, set(futures)))
+            except Exception as e:
+                print(f"Error refreshing places for {key[0]}: {e}")
+
+        for future in futures:
+            future.add_done_callback(query_done)
+
+    def _start_search(self, key: PlacesKey, config: Dict) -> List[Future]:
+        """One query per type of the mood, submitted to _search_pool"""
+        mood, lat_cell, lng_cell, radius = key
+        # Searched from the cell center, so the result fits every user in the cell
+        lat = (lat_cell + 0.5) * PLACES_CELL_KM / KM_PER_DEG_LAT
+        lng = (lng_cell + 0.5) * PLACES_CELL_KM / KM_PER_DEG_LNG
+        types = config.get('types') or [None]
+        print(f"🔍 Searching for {mood} places near ({lat:.4f}, {lng:.4f}) within {radius}m radius...")
+
+        deadline = time.monotonic() + PLACES_BUDGET_SECONDS
+        return [_search_pool.submit(self._search_type, (lat, lng), radius, place_type, config.get('keywords', ''), deadline)
+                for place_type in types]
+
+    def _search(self, key: PlacesKey, config: Dict) -> Tuple[List[Dict], bool]:
+        """Merged places of all type queries and whether every query finished within the budget"""
+        futures = self._start_search(key, config)
+        done, _ = wait(futures, timeout=PLACES_BUDGET_SECONDS)
+        return self._collect(key[0], futures, done)
+
+    def _collect(self, mood: str, futures: List[Future], done: Set[Future]) -> Tuple[List[Dict], bool]:
+        results, errors = [], []
+        for future in futures:
+            if future in done:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                else:
+                    results.append(future.result())
+        if errors and not results:
+            raise errors[0]
+        not_done = len(futures) - len(done)
+        if errors or not_done:
+            print(f"Places search for {mood}: {len(errors)} failed, {not_done} over budget of {len(futures)} queries")
+        return self._merge(results), not errors and not not_done
+
+    def _search_type(self, location: Tuple[float, float], radius: int, place_type, keyword: str,
+                     deadline: float) -> List[Dict]:
+        response = self.gmaps.places_nearby(location=location, radius=radius, type=place_type, keyword=keyword)
+        places = list(response.get('results', []))
+        for _ in range(PLACES_MAX_PAGES - 1):
+            token = response.get('next_page_token')
+            if not token or time.monotonic() + PAGE_TOKEN_DELAY_SECONDS >= deadline:
+                break
+            time.sleep(PAGE_TOKEN_DELAY_SECONDS)
+            response = self.gmaps.places_nearby(page_token=token)
+            places.extend(response.get('results', []))
+        return places
+
+    @staticmethod
+    def _merge(results: List[List[Dict]]) -> List[Dict]:
+        """One entry per place_id, places found by several queries first, then by rating weighted with the number of ratings"""
+        merged: Dict[str, Dict] = {}
+        matches: Dict[str, int] = {}
+        for places in results:
+            for place in places:
+                place_id = place['place_id']
+                merged.setdefault(place_id, place)
+                matches[place_id] = matches.get(place_id, 0) + 1
+        ranked = sorted(merged.values(), key=lambda p: (
+            -matches[p['place_id']], -(p.get('rating') or 0) * math.log1p(p.get('user_ratings_total') or 0)))
+        return ranked[:PLACES_MAX_RESULTS]
+
     def _create_geojson(self, places: List, mood: str, user_lat: float, user_lng: float, radius: int) -> Dict:
         """Convert Places API results to GeoJSON format"""
 
@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+Coordinates = Tuple[float, float]
+
+
+class PlaceCoordinateCache:
+    """place_id -> (lat, lng) cache persisted as JSON, concurrent lookups of the same place share one request"""
+
+    def __init__(self, path: Optional[str], resolver: Callable[[str], Optional[Coordinates]]):
+        self.path = path
+        self.resolver = resolver
+        self._coords: Dict[str, Coordinates] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._coords = {place_id: (lat, lng) for place_id, (lat, lng) in json.load(f).items()}
+            print(f"Loaded {len(self._coords)} cached place coordinates")
+        except (OSError, ValueError) as e:
+            print(f"Could not read place cache {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = dict(self._coords)
+        with self._file_lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not write place cache {self.path}: {e}")
+
+    def get(self, place_id: str) -> Optional[Coordinates]:
+        """Cached coordinates, or resolve them. Returns None if the place could not be resolved."""
+        with self._lock:
+            if place_id in self._coords:
+                return self._coords[place_id]
+            pending = self._inflight.get(place_id)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[place_id] = Future()
+
+        if not owner:
+            return pending.result()
+
+        coords = None
+        try:
+            coords = self.resolver(place_id)
+        except Exception as e:
+            print(f"Error resolving coords for {place_id}: {e}")
+        finally:
+            with self._lock:
+                if coords is not None:
+                    self._coords[place_id] = coords
+                del self._inflight[place_id]
+            pending.set_result(coords)
+
+        if coords is not None:
+            self._save()
+        return coords
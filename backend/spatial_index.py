@@ -0,0 +1,73 @@
+import math
+from typing import Dict, Hashable, List, Set, Tuple
+
+# Munich approximations, same as the distance estimate in GroupDataManager (1° Lat ~ 111km, 1° Lng ~ 74km)
+KM_PER_DEG_LAT = 111.0
+KM_PER_DEG_LNG = 74.0
+
+
+def estimate_distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular distance estimate, good enough inside the city"""
+    lat_diff = (lat2 - lat1) * KM_PER_DEG_LAT
+    lng_diff = (lng2 - lng1) * KM_PER_DEG_LNG
+    return math.sqrt(lat_diff ** 2 + lng_diff ** 2)
+
+
+class GridIndex:
+    """Fixed-size lat/lng grid that maps cells to the keys positioned inside them"""
+
+    def __init__(self, cell_km: float = 1.0, km_per_deg_lat: float = KM_PER_DEG_LAT,
+                 km_per_deg_lng: float = KM_PER_DEG_LNG):
+        self.cell_lat = cell_km / km_per_deg_lat
+        self.cell_lng = cell_km / km_per_deg_lng
+        self.km_per_deg_lat = km_per_deg_lat
+        self.km_per_deg_lng = km_per_deg_lng
+        self.cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.positions: Dict[Hashable, Tuple[float, float]] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.positions
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_lat), math.floor(lng / self.cell_lng)
+
+    def insert(self, key: Hashable, lat: float, lng: float):
+        """Add a key or move it to a new position"""
+        if key in self.positions:
+            self.remove(key)
+        self.positions[key] = (lat, lng)
+        self.cells.setdefault(self._cell(lat, lng), set()).add(key)
+
+    def remove(self, key: Hashable):
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, lat: float, lng: float, radius_km: float) -> List[Hashable]:
+        """Keys in all cells overlapping the radius (candidates, callers still check the exact distance)"""
+        min_lat, min_lng = self._cell(lat - radius_km / self.km_per_deg_lat, lng - radius_km / self.km_per_deg_lng)
+        max_lat, max_lng = self._cell(lat + radius_km / self.km_per_deg_lat, lng + radius_km / self.km_per_deg_lng)
+
+        candidates = []
+        # Huge radius: walking the occupied cells is cheaper than walking the covered ones
+        if (max_lat - min_lat + 1) * (max_lng - min_lng + 1) > len(self.cells):
+            for (cell_lat, cell_lng), bucket in self.cells.items():
+                if min_lat <= cell_lat <= max_lat and min_lng <= cell_lng <= max_lng:
+                    candidates.extend(bucket)
+            return candidates
+
+        for cell_lat in range(min_lat, max_lat + 1):
+            for cell_lng in range(min_lng, max_lng + 1):
+                bucket = self.cells.get((cell_lat, cell_lng))
+                if bucket:
+                    candidates.extend(bucket)
+        return candidates
@@ -0,0 +1,362 @@
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import ChatMessageModel, GroupModel, LocationModel, UserGroupInfo, UserModel
+from spatial_index import KM_PER_DEG_LAT, KM_PER_DEG_LNG, estimate_distance_km
+from storage import CHAT_TAIL_SIZE, HISTORY_PAGE_SIZE, StorageBackend, StorageError, group_summary
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY,
+    location_id TEXT NOT NULL UNIQUE,
+    lat REAL NOT NULL DEFAULT 0.0,
+    lng REAL NOT NULL DEFAULT 0.0,
+    resolved INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TABLE IF NOT EXISTS chat_groups (
+    group_id TEXT PRIMARY KEY,
+    location_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    min_age INTEGER NOT NULL,
+    max_age INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    host_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_groups_by_location ON chat_groups(location_id);
+CREATE INDEX IF NOT EXISTS chat_groups_by_date ON chat_groups(date);
+CREATE TABLE IF NOT EXISTS members (
+    group_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (group_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS user_groups (
+    user_id INTEGER NOT NULL,
+    location_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    PRIMARY KEY (user_id, group_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    group_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    sender_name TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (group_id, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_by_time ON messages(group_id, timestamp);
+"""
+
+GROUP_COLUMNS = "group_id, location_id, title, description, min_age, max_age, date, host_id"
+# Stay below SQLITE_MAX_VARIABLE_NUMBER of older SQLite builds
+MAX_PARAMS = 900
+
+
+def _chunks(values: List, size: int = MAX_PARAMS) -> Iterable[List]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _placeholders(values: List) -> str:
+    return ",".join("?" * len(values))
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite storage in WAL mode: one connection per thread, concurrent readers, one writer at a time.
+    Write transactions start with BEGIN IMMEDIATE so check-then-insert sequences are atomic.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # --- row mapping ---
+
+    def _load_users(self, conn: sqlite3.Connection, rows: List[Tuple[int, str]]) -> List[UserModel]:
+        users = {user_id: UserModel.model_validate_json(profile) for user_id, profile in rows}
+        for ids in _chunks(list(users)):
+            for user_id, location_id, group_id, title in conn.execute(
+                    f"SELECT user_id, location_id, group_id, title FROM user_groups "
+                    f"WHERE user_id IN ({_placeholders(ids)}) ORDER BY rowid", ids):
+                users[user_id].joined_groups.append(
+                    UserGroupInfo(location_id=location_id, group_id=uuid.UUID(group_id), title=title))
+        return list(users.values())
+
+    def _load_groups(self, conn: sqlite3.Connection, location_ids: List[str]) -> Dict[str, List[GroupModel]]:
+        groups: Dict[str, GroupModel] = {}
+        by_location: Dict[str, List[GroupModel]] = {}
+        for ids in _chunks(location_ids):
+            for group_id, location_id, title, description, min_age, max_age, gdate, host_id in conn.execute(
+                    f"SELECT {GROUP_COLUMNS} FROM chat_groups WHERE location_id IN ({_placeholders(ids)}) ORDER BY rowid", ids):
+                group = GroupModel(group_id=uuid.UUID(group_id), title=title, description=description,
+                                   age_range=(min_age, max_age), date=date.fromisoformat(gdate), host_id=host_id)
+                groups[group_id] = group
+                by_location.setdefault(location_id, []).append(group)
+
+        group_ids = list(groups)
+        for ids in _chunks(group_ids):
+            for group_id, user_id in conn.execute(
+                    f"SELECT group_id, user_id FROM members WHERE group_id IN ({_placeholders(ids)}) ORDER BY rowid", ids):
+                groups[group_id].add_member(user_id)
+
+            # Only the tail of every chat, same as MemoryStorage keeps in memory
+            for group_id, seq, sender_id, sender_name, content, timestamp in conn.execute(
+                    f"SELECT group_id, seq, sender_id, sender_name, content, timestamp FROM ("
+                    f"SELECT *, ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY seq DESC) AS age FROM messages "
+                    f"WHERE group_id IN ({_placeholders(ids)})) WHERE age <= ? ORDER BY group_id, seq",
+                    ids + [CHAT_TAIL_SIZE]):
+                groups[group_id].chat_history.append(ChatMessageModel(
+                    seq=seq, sender_id=sender_id, sender_name=sender_name, group_id=uuid.UUID(group_id),
+                    content=content, timestamp=datetime.fromisoformat(timestamp)))
+        return by_location
+
+    def _require_group(self, conn: sqlite3.Connection, location_id: str, group_id: uuid.UUID) -> Tuple[int, int, str]:
+        row = conn.execute("SELECT min_age, max_age, title FROM chat_groups WHERE group_id = ? AND location_id = ?",
+                           (str(group_id), location_id)).fetchone()
+        if row is None:
+            if conn.execute("SELECT 1 FROM locations WHERE location_id = ?", (location_id,)).fetchone() is None:
+                raise StorageError("this location doesnt have any groups yet")
+            raise StorageError("Group was not found at the location")
+        return row
+
+    def _is_member(self, conn: sqlite3.Connection, group_id: uuid.UUID, user_id: int) -> bool:
+        return conn.execute("SELECT 1 FROM members WHERE group_id = ? AND user_id = ?",
+                            (str(group_id), user_id)).fetchone() is not None
+
+    # --- users ---
+
+    def register_user(self, user: UserModel) -> bool:
+        with self._write() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO users (user_id, profile) VALUES (?, ?)",
+                                  (user.user_id, user.model_dump_json(exclude={"joined_groups"})))
+            return cursor.rowcount == 1
+
+    def ensure_user(self, user: UserModel):
+        self.register_user(user)
+
+    def get_user(self, user_id: int) -> Optional[UserModel]:
+        conn = self._connection()
+        rows = conn.execute("SELECT user_id, profile FROM users WHERE user_id = ?", (user_id,)).fetchall()
+        users = self._load_users(conn, rows)
+        return users[0] if users else None
+
+    def get_all_users(self) -> List[UserModel]:
+        conn = self._connection()
+        return self._load_users(conn, conn.execute("SELECT user_id, profile FROM users ORDER BY rowid").fetchall())
+
+    def get_user_groups(self, user_id: int) -> List[UserGroupInfo]:
+        rows = self._connection().execute(
+            "SELECT location_id, group_id, title FROM user_groups WHERE user_id = ? ORDER BY rowid", (user_id,))
+        return [UserGroupInfo(location_id=l, group_id=uuid.UUID(g), title=t) for l, g, t in rows]
+
+    # --- locations ---
+
+    def needs_coordinates(self, location_id: str) -> bool:
+        row = self._connection().execute("SELECT resolved FROM locations WHERE location_id = ?", (location_id,)).fetchone()
+        return row is None or not row[0]
+
+    def unresolved_locations(self) -> List[str]:
+        return [row[0] for row in self._connection().execute("SELECT location_id FROM locations WHERE resolved = 0")]
+
+    def _apply_coordinates(self, conn: sqlite3.Connection, location_id: str, lat: float, lng: float) -> bool:
+        cursor = conn.execute("UPDATE locations SET lat = ?, lng = ?, resolved = 1 WHERE location_id = ? AND resolved = 0",
+                              (lat, lng, location_id))
+        if cursor.rowcount == 0:
+            return False
+        conn.execute("INSERT OR REPLACE INTO location_rtree (id, min_lat, max_lat, min_lng, max_lng) "
+                     "SELECT id, lat, lat, lng, lng FROM locations WHERE location_id = ?", (location_id,))
+        return True
+
+    def set_coordinates(self, location_id: str, lat: float, lng: float) -> bool:
+        with self._write() as conn:
+            return self._apply_coordinates(conn, location_id, lat, lng)
+
+    def location_json(self, location_id: str) -> Optional[bytes]:
+        conn = self._connection()
+        row = conn.execute("SELECT lat, lng, resolved FROM locations WHERE location_id = ?", (location_id,)).fetchone()
+        if row is None:
+            return None
+        groups = self._load_groups(conn, [location_id]).get(location_id, [])
+        location = LocationModel(location_id=location_id, lat=row[0], lng=row[1], resolved=bool(row[2]),
+                                 groups={g.group_id: g for g in groups})
+        return location.model_dump_json().encode()
+
+    def group_summaries(self, location_ids: List[str]) -> Dict[str, List[Dict]]:
+        conn = self._connection()
+        summaries: Dict[str, List[Dict]] = {}
+        for ids in _chunks(location_ids):
+            for group_id, location_id, title, description, min_age, max_age, gdate, host_id, member_count in conn.execute(
+                    f"SELECT {GROUP_COLUMNS}, (SELECT COUNT(*) FROM members m WHERE m.group_id = g.group_id) "
+                    f"FROM chat_groups g WHERE location_id IN ({_placeholders(ids)}) ORDER BY rowid", ids):
+                group = GroupModel(group_id=uuid.UUID(group_id), title=title, description=description,
+                                   age_range=(min_age, max_age), date=date.fromisoformat(gdate), host_id=host_id)
+                summaries.setdefault(location_id, []).append(group_summary(group, member_count))
+        return summaries
+
+    def nearby_locations(self, lat: float, lng: float, radius_km: float) -> Dict[str, float]:
+        conn = self._connection()
+        lat_span = radius_km / KM_PER_DEG_LAT
+        lng_span = radius_km / KM_PER_DEG_LNG
+        rows = conn.execute(
+            "SELECT l.location_id, l.lat, l.lng FROM location_rtree r JOIN locations l ON l.id = r.id "
+            "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?",
+            (lat - lat_span, lat + lat_span, lng - lng_span, lng + lng_span)).fetchall()
+        distances = {}
+        for location_id, l_lat, l_lng in rows:
+            distance = estimate_distance_km(lat, lng, l_lat, l_lng)
+            if distance <= radius_km:
+                distances[location_id] = distance
+        return distances
+
+    def nearby_groups(self, lat: float, lng: float, radius_km: float) -> List[Dict]:
+        conn = self._connection()
+        nearby_groups = []
+        for location_id, groups in self._load_groups(conn, list(self.nearby_locations(lat, lng, radius_km))).items():
+            for group in groups:
+                g_data = group.model_dump(mode='json')
+                g_data['location_id'] = location_id
+                nearby_groups.append(g_data)
+        return nearby_groups
+
+    # --- groups ---
+
+    def create_group(self, location_id: str, group: GroupModel, coords: Optional[Tuple[float, float]]):
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO locations (location_id) VALUES (?)", (location_id,))
+            if coords is not None:
+                self._apply_coordinates(conn, location_id, *coords)
+            try:
+                conn.execute(f"INSERT INTO chat_groups ({GROUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (str(group.group_id), location_id, group.title, group.description,
+                              group.age_range[0], group.age_range[1], group.date.isoformat(), group.host_id))
+            except sqlite3.IntegrityError:
+                raise StorageError("Something went wrong, pls try again")
+            for member_id in group.member_ids:
+                conn.execute("INSERT OR IGNORE INTO members (group_id, user_id) VALUES (?, ?)",
+                             (str(group.group_id), member_id))
+            conn.execute("INSERT OR IGNORE INTO user_groups (user_id, location_id, group_id, title) VALUES (?, ?, ?, ?)",
+                         (group.host_id, location_id, str(group.group_id), group.title))
+
+    def _delete_groups(self, conn: sqlite3.Connection, group_ids: List[str], location_ids: List[str]):
+        for ids in _chunks(group_ids):
+            for table in ("members", "user_groups", "messages", "chat_groups"):
+                conn.execute(f"DELETE FROM {table} WHERE group_id IN ({_placeholders(ids)})", ids)
+        for ids in _chunks(location_ids):
+            empty = (f"SELECT id FROM locations l WHERE location_id IN ({_placeholders(ids)}) "
+                     f"AND NOT EXISTS (SELECT 1 FROM chat_groups g WHERE g.location_id = l.location_id)")
+            conn.execute(f"DELETE FROM location_rtree WHERE id IN ({empty})", ids)
+            conn.execute(f"DELETE FROM locations WHERE id IN ({empty})", ids)
+
+    def delete_group(self, location_id: str, group_id: uuid.UUID):
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM locations WHERE location_id = ?", (location_id,)).fetchone() is None:
+                raise StorageError("Location not found")
+            if conn.execute("SELECT 1 FROM chat_groups WHERE group_id = ? AND location_id = ?",
+                            (str(group_id), location_id)).fetchone() is None:
+                raise StorageError("Group not found")
+            self._delete_groups(conn, [str(group_id)], [location_id])
+
+    def delete_expired(self, today: date) -> List[str]:
+        with self._write() as conn:
+            rows = conn.execute("SELECT group_id, location_id FROM chat_groups WHERE date < ?",
+                                (today.isoformat(),)).fetchall()
+            location_ids = sorted({location_id for _, location_id in rows})
+            self._delete_groups(conn, [group_id for group_id, _ in rows], location_ids)
+        return location_ids
+
+    def next_expiry(self) -> Optional[date]:
+        row = self._connection().execute("SELECT MIN(date) FROM chat_groups").fetchone()
+        return date.fromisoformat(row[0]) if row[0] else None
+
+    def join_group(self, location_id: str, group_id: uuid.UUID, user: UserModel):
+        self.ensure_user(user)
+        with self._write() as conn:
+            min_age, max_age, title = self._require_group(conn, location_id, group_id)
+            if not min_age <= user.age <= max_age:
+                raise StorageError("You dont fit the age restrictions of this Group")
+            cursor = conn.execute("INSERT OR IGNORE INTO members (group_id, user_id) VALUES (?, ?)",
+                                  (str(group_id), user.user_id))
+            if cursor.rowcount == 0:
+                raise StorageError("You cant join a Group twice")
+            conn.execute("INSERT OR IGNORE INTO user_groups (user_id, location_id, group_id, title) VALUES (?, ?, ?, ?)",
+                         (user.user_id, location_id, str(group_id), title))
+
+    # --- chat ---
+
+    def is_member(self, location_id: str, group_id: uuid.UUID, user_id: int) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM members m JOIN chat_groups g ON g.group_id = m.group_id "
+            "WHERE m.group_id = ? AND m.user_id = ? AND g.location_id = ?",
+            (str(group_id), user_id, location_id)).fetchone() is not None
+
+    def send_message(self, location_id: str, group_id: uuid.UUID, user: UserModel, content: str) -> ChatMessageModel:
+        with self._write() as conn:
+            self._require_group(conn, location_id, group_id)
+            if not self._is_member(conn, group_id, user.user_id):
+                raise StorageError("You cant write in chats where you arent a member! What the hell did you do????")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE group_id = ?",
+                               (str(group_id),)).fetchone()[0]
+            new_message = ChatMessageModel(seq=seq, sender_id=user.user_id, sender_name=user.name,
+                                           group_id=group_id, content=content, timestamp=datetime.now())
+            conn.execute("INSERT INTO messages (group_id, seq, sender_id, sender_name, content, timestamp) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (str(group_id), seq, user.user_id, user.name, content, new_message.timestamp.isoformat()))
+        return new_message
+
+    def get_chat_history(self, location_id: str, group_id: uuid.UUID, user_id: int,
+                         before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE) -> List[ChatMessageModel]:
+        conn = self._connection()
+        self._require_group(conn, location_id, group_id)
+        if not self._is_member(conn, group_id, user_id):
+            raise StorageError("Accesse denied: You are not a member.")
+        # Walks the primary key backwards from the cursor, cost does not depend on the chat length
+        rows = conn.execute("SELECT seq, sender_id, sender_name, content, timestamp FROM messages "
+                            "WHERE group_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                            (str(group_id), before if before is not None else 2 ** 62, limit)).fetchall()
+        return [ChatMessageModel(seq=seq, sender_id=sender_id, sender_name=sender_name, group_id=group_id,
+                                 content=content, timestamp=datetime.fromisoformat(timestamp))
+                for seq, sender_id, sender_name, content, timestamp in reversed(rows)]
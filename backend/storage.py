@@ -0,0 +1,119 @@
+import uuid
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import ChatMessageModel, GroupModel, UserGroupInfo, UserModel
+
+# Messages kept per group in memory and in listings, older ones are only reachable through history pages
+CHAT_TAIL_SIZE = 200
+HISTORY_PAGE_SIZE = 50
+
+
+class StorageError(Exception):
+    """A request that cannot be applied (unknown group, not a member, ...), the message is shown to the user"""
+
+
+def group_summary(group: GroupModel, member_count: int) -> Dict:
+    return {
+        "group_id": str(group.group_id),
+        "title": group.title,
+        "description": group.description,
+        "age_range": list(group.age_range),
+        "date": group.date.isoformat(),
+        "host_id": group.host_id,
+        "member_count": member_count
+    }
+
+
+class StorageBackend(ABC):
+    """Storage engine behind the module-level functions of GroupDataManager"""
+
+    def open(self):
+        """Load persisted state, called once on startup"""
+
+    def close(self):
+        """Flush and release resources, called on shutdown"""
+
+    def snapshot(self):
+        """Compact persisted state, called on shutdown and whenever needs_snapshot() says so"""
+
+    def needs_snapshot(self) -> bool:
+        return False
+
+    def archive_chats(self, older_than: datetime) -> List[str]:
+        """Move chat messages sent before older_than out of memory, for engines that keep chats there.
+        Returns the ids of the locations whose group listings changed"""
+        return []
+
+    @abstractmethod
+    def register_user(self, user: UserModel) -> bool:
+        """False if the user id is taken"""
+
+    @abstractmethod
+    def ensure_user(self, user: UserModel):
+        """Register the user unless the id is already known"""
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[UserModel]: ...
+
+    @abstractmethod
+    def get_all_users(self) -> List[UserModel]: ...
+
+    @abstractmethod
+    def get_user_groups(self, user_id: int) -> List[UserGroupInfo]: ...
+
+    @abstractmethod
+    def needs_coordinates(self, location_id: str) -> bool:
+        """True for unknown locations and locations whose coordinates are unresolved"""
+
+    @abstractmethod
+    def unresolved_locations(self) -> List[str]: ...
+
+    @abstractmethod
+    def set_coordinates(self, location_id: str, lat: float, lng: float) -> bool:
+        """Store resolved coordinates, False if the location is gone or already resolved"""
+
+    @abstractmethod
+    def create_group(self, location_id: str, group: GroupModel, coords: Optional[Tuple[float, float]]):
+        """Add the group (creating the location if needed), raises StorageError on a duplicate group id"""
+
+    @abstractmethod
+    def delete_group(self, location_id: str, group_id: uuid.UUID): ...
+
+    @abstractmethod
+    def join_group(self, location_id: str, group_id: uuid.UUID, user: UserModel): ...
+
+    @abstractmethod
+    def is_member(self, location_id: str, group_id: uuid.UUID, user_id: int) -> bool:
+        """False for unknown groups too"""
+
+    @abstractmethod
+    def send_message(self, location_id: str, group_id: uuid.UUID, user: UserModel, content: str) -> ChatMessageModel: ...
+
+    @abstractmethod
+    def get_chat_history(self, location_id: str, group_id: uuid.UUID, user_id: int,
+                         before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE) -> List[ChatMessageModel]:
+        """Up to limit messages with seq < before (the newest ones without before), oldest first"""
+
+    @abstractmethod
+    def location_json(self, location_id: str) -> Optional[bytes]:
+        """The full LocationModel as compact JSON, None for unknown locations"""
+
+    @abstractmethod
+    def group_summaries(self, location_ids: List[str]) -> Dict[str, List[Dict]]: ...
+
+    @abstractmethod
+    def nearby_locations(self, lat: float, lng: float, radius_km: float) -> Dict[str, float]:
+        """Distance in km of every location within radius_km"""
+
+    @abstractmethod
+    def nearby_groups(self, lat: float, lng: float, radius_km: float) -> List[Dict]: ...
+
+    @abstractmethod
+    def next_expiry(self) -> Optional[date]:
+        """Earliest group date, the groups of that day expire when it is over"""
+
+    @abstractmethod
+    def delete_expired(self, today: date) -> List[str]:
+        """Remove groups dated before today and locations left without groups, returns the affected location ids"""
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+import broadcast_bus
+from broadcast_bus import BroadcastBroker, BroadcastBus, LocalBus, UnixSocketBus
+
+
+async def _eventually(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def _bus(path, received):
+    bus = UnixSocketBus(path)
+    bus.subscribe("chat/", lambda group_id, data: received.append((group_id, data)))
+    return bus
+
+
+def test_local_bus_dispatches_by_prefix():
+    bus = LocalBus()
+    chats, locations = [], []
+    bus.subscribe("chat/", lambda key, data: chats.append((key, data)))
+    bus.subscribe("location/", lambda key, data: locations.append(key))
+    bus.publish("chat/g1", "hallo")
+    bus.publish("location/marienplatz", "")
+    assert chats == [("g1", "hallo")] and locations == ["marienplatz"]
+
+
+def test_bus_without_publish_cannot_be_created():
+    class SilentBus(BroadcastBus):
+        pass
+
+    with pytest.raises(TypeError):
+        SilentBus()
+
+
+def test_only_the_lock_holder_becomes_broker():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+        open(path, "w").close()  # socket file of a broker that died
+        first, second = BroadcastBroker(path), BroadcastBroker(path)
+        await first.start()
+        with pytest.raises(OSError):
+            await second.start()
+        # The loser did not unlink the socket of the running broker
+        _, writer = await asyncio.open_unix_connection(path)
+        writer.close()
+        await first.close()
+        await second.start()
+        await second.close()
+
+        for _ in range(5):
+            workers = [_bus(path, []) for _ in range(4)]
+            await asyncio.gather(*(w.start() for w in workers))
+            assert sum(w.broker is not None for w in workers) == 1
+            for w in workers:
+                await w.close()
+
+    asyncio.run(scenario())
+
+
+def test_unix_socket_bus_reaches_all_workers():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+        first, second, third = [], [], []
+        worker_a, worker_b = _bus(path, first), _bus(path, second)
+        await worker_a.start()
+        await worker_b.start()
+        assert worker_a.broker is not None and worker_b.broker is None
+
+        worker_b.publish("chat/g1", "Servus ✓")
+        assert second == [("g1", "Servus ✓")]  # delivered locally right away
+        await _eventually(lambda: first == [("g1", "Servus ✓")])
+        await asyncio.sleep(0.05)
+        assert second == [("g1", "Servus ✓")]  # the broker does not echo to the publisher
+
+        # The worker hosting the broker goes away, one of the others takes over
+        await worker_a.close()
+        worker_c = _bus(path, third)
+        await _eventually(lambda: worker_b.broker is not None)
+        await worker_c.start()
+        worker_c.publish("chat/g2", "noch da?")
+        await _eventually(lambda: second[-1] == ("g2", "noch da?"))
+        await worker_b.close()
+        await worker_c.close()
+
+    old_reconnect, broadcast_bus.RECONNECT_SECONDS = broadcast_bus.RECONNECT_SECONDS, 0.05
+    try:
+        asyncio.run(scenario())
+    finally:
+        broadcast_bus.RECONNECT_SECONDS = old_reconnect
+
+
+if __name__ == "__main__":
+    test_local_bus_dispatches_by_prefix()
+    test_bus_without_publish_cannot_be_created()
+    test_only_the_lock_holder_becomes_broker()
+    test_unix_socket_bus_reaches_all_workers()
+    print("🎉 All broadcast bus tests passed!")
@@ -0,0 +1,106 @@
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.dirname(__file__))
+os.environ.setdefault("GOOGLE_API_KEY", "AIza-test-key")
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-test-key")
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import GroupDataManager as db
+import main
+from memory_storage import MemoryStorage
+from models import UserModel
+from place_cache import PlaceCoordinateCache
+
+
+def _setup(monkeypatch):
+    # The lifespan would start the deleter, geocode and snapshot threads, which outlive the test
+    for starter in ("run_deleter_in_background", "run_geocode_retry_in_background", "run_snapshots_in_background"):
+        monkeypatch.setattr(db, starter, lambda: None)
+    monkeypatch.setattr(main, "PREWARM_FUN_FACTS", False)
+    db.close_storage()
+    db.backend = MemoryStorage()
+    db.place_cache = PlaceCoordinateCache(None, lambda place_id: (48.1374, 11.5755))
+    host = UserModel(user_id=1, name="Anna", age=25, gender="weiblich")
+    guest = UserModel(user_id=2, name="Ben", age=27, gender="männlich")
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), host)
+    db.join_group("marienplatz", group.group_id, guest)
+    db.register_users(UserModel(user_id=3, name="Outsider", age=30, gender="x"))
+    return group
+
+
+def test_messages_sent_over_the_socket_are_acked_and_broadcast(monkeypatch):
+    group = _setup(monkeypatch)
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/api/ws/{group.group_id}") as anna, \
+                client.websocket_connect(f"/api/ws/{group.group_id}") as ben:
+            anna.send_json({"type": "auth", "user_id": 1, "location_id": "marienplatz"})
+            ben.send_json({"type": "auth", "user_id": 2, "location_id": "marienplatz"})
+            assert anna.receive_json() == {"type": "ready"}
+            assert ben.receive_json() == {"type": "ready"}
+
+            anna.send_json({"type": "message", "content": "Servus!", "client_id": "c1"})
+            message = anna.receive_json()
+            assert (message["seq"], message["sender_name"], message["content"]) == (1, "Anna", "Servus!")
+            ack = anna.receive_json()
+            assert (ack["type"], ack["client_id"], ack["seq"]) == ("ack", "c1", 1)
+            assert ben.receive_json()["content"] == "Servus!"
+
+            ben.send_json({"type": "message", "content": "", "client_id": "c2"})
+            assert ben.receive_json() == {"type": "error", "client_id": "c2", "detail": "Invalid message"}
+            ben.send_text("not json")
+            assert ben.receive_json()["type"] == "error"
+
+    assert [m.content for m in db.get_chat_history("marienplatz", group.group_id, 2)] == ["Servus!"]
+    db.close_storage()
+
+
+def test_unknown_and_incomplete_frames_get_an_error(monkeypatch):
+    group = _setup(monkeypatch)
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/api/ws/{group.group_id}") as anna:
+            anna.send_json({"type": "auth", "user_id": 1, "location_id": "marienplatz"})
+            assert anna.receive_json() == {"type": "ready"}
+
+            anna.send_json({"type": "foo", "content": "Servus!", "client_id": "c1"})
+            assert anna.receive_json() == {"type": "error", "client_id": "c1", "detail": "Unknown frame type: 'foo'"}
+            anna.send_json({"content": "Servus!", "client_id": "c2"})
+            assert anna.receive_json() == {"type": "error", "client_id": "c2", "detail": "Unknown frame type: None"}
+            anna.send_json({"type": "message", "client_id": "c3"})
+            assert anna.receive_json() == {"type": "error", "client_id": "c3", "detail": "Invalid message"}
+            anna.send_json({"type": "message", "content": 42, "client_id": "c4"})
+            assert anna.receive_json() == {"type": "error", "client_id": "c4", "detail": "Invalid message"}
+            anna.send_json(["message"])
+            assert anna.receive_json() == {"type": "error", "detail": "Invalid frame"}
+
+            # The socket is still usable
+            anna.send_json({"type": "message", "content": "Servus!", "client_id": "c5"})
+            assert anna.receive_json()["content"] == "Servus!"
+            assert anna.receive_json()["type"] == "ack"
+
+    assert [m.content for m in db.get_chat_history("marienplatz", group.group_id, 1)] == ["Servus!"]
+    db.close_storage()
+
+
+def test_socket_requires_membership(monkeypatch):
+    group = _setup(monkeypatch)
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/api/ws/{group.group_id}") as outsider:
+            outsider.send_json({"type": "auth", "user_id": 3, "location_id": "marienplatz"})
+            with pytest.raises(WebSocketDisconnect) as closed:
+                outsider.receive_json()
+            assert closed.value.code == 1008
+    assert main.connection_manager.active_connections == {}
+    db.close_storage()
+
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as mp:
+        test_messages_sent_over_the_socket_are_acked_and_broadcast(mp)
+        test_unknown_and_incomplete_frames_get_an_error(mp)
+        test_socket_requires_membership(mp)
+    print("🎉 All chat socket tests passed!")
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+os.environ.setdefault("GOOGLE_API_KEY", "AIza-test-key")
+
+import httpx
+
+import app
+from app import MunichCompanion
+from fake_llm import DEFAULT_ANSWER, FakeLLMServer
+
+
+def _answer(text):
+    return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+def _run(handler, coroutine_factory):
+    async def scenario():
+        bot = MunichCompanion(transport=httpx.MockTransport(handler))
+        try:
+            return await coroutine_factory(bot)
+        finally:
+            await bot.aclose()
+
+    old_base, app.RETRY_BASE_SECONDS = app.RETRY_BASE_SECONDS, 0.001
+    try:
+        return asyncio.run(scenario())
+    finally:
+        app.RETRY_BASE_SECONDS = old_base
+
+
+def test_overload_and_transport_errors_are_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused")
+        if len(calls) == 2:
+            return httpx.Response(503, text="overloaded")
+        return _answer("Servus!")
+
+    assert _run(handler, lambda bot: bot.ask("Hi", location={"lat": 48.1, "lng": 11.5})) == "Servus!"
+    assert len(calls) == 3
+    assert calls[-1].headers["X-goog-api-key"] == os.environ["GOOGLE_API_KEY"]
+
+
+def test_retries_are_bounded():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(503, text="overloaded")
+
+    assert _run(handler, lambda bot: bot.ask_automated("answer")) == "Error: 503-overloaded"
+    assert len(calls) == app.MAX_RETRIES + 1
+
+
+def test_concurrency_is_capped():
+    running, peak = [0], [0]
+
+    async def handler(request):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return _answer("ok")
+
+    async def many(bot):
+        return await asyncio.gather(*(bot.ask("Hi") for _ in range(app.MAX_CONCURRENT_REQUESTS * 3)))
+
+    assert set(_run(handler, many)) == {"ok"}
+    assert peak[0] == app.MAX_CONCURRENT_REQUESTS
+
+
+def test_stream_delivers_first_chunk_early():
+    async def scenario():
+        server = FakeLLMServer(first_chunk_delay=0.05, chunk_delay=0.05)
+        await server.start()
+        bot = MunichCompanion()
+        bot.api_url = f"{server.base_url}/models/fake:generateContent"
+        bot.stream_url = f"{server.base_url}/models/fake:streamGenerateContent?alt=sse"
+        loop = asyncio.get_running_loop()
+        bot._get_client()  # building the client (SSL context) is not part of the time to first token
+        try:
+            start = loop.time()
+            pieces, first_at = [], None
+            async for text in bot.ask_stream("Fun facts?", location={"lat": 48.1, "lng": 11.5}):
+                first_at = first_at or loop.time() - start
+                pieces.append(text)
+            total = loop.time() - start
+            assert len(pieces) > 5 and "".join(pieces).strip() == DEFAULT_ANSWER
+            assert first_at < total / 3
+            # Same connection pool serves the non-streaming calls
+            assert await bot.ask_automated("answer") == "yes"
+            assert await bot.ask("Fun facts?") == DEFAULT_ANSWER
+        finally:
+            await bot.aclose()
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_overload_and_transport_errors_are_retried()
+    test_retries_are_bounded()
+    test_concurrency_is_capped()
+    test_stream_delivers_first_chunk_early()
+    print("🎉 All chatbot client tests passed!")
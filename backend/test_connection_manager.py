@@ -0,0 +1,75 @@
+import asyncio
+import json
+import uuid
+
+import connection_manager as cm
+from connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.stalled:
+            await asyncio.sleep(3600)
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_slow_client_does_not_hold_up_the_group():
+    async def scenario():
+        manager = ConnectionManager()
+        group_id = uuid.uuid4()
+        fast, stalled = FakeWebSocket(), FakeWebSocket(stalled=True)
+        await manager.connect(fast, group_id)
+        await manager.connect(stalled, group_id)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in range(cm.SEND_QUEUE_SIZE + 2):
+            manager.broadcast({"seq": i, "content": "Grüß Gott"}, group_id)
+            await asyncio.sleep(0)  # one request after the other, the writers get to run in between
+        assert loop.time() - start < 0.1
+        await asyncio.sleep(0.05)
+
+        assert [json.loads(t)["seq"] for t in fast.sent] == list(range(cm.SEND_QUEUE_SIZE + 2))
+        assert fast.sent[0] == '{"seq":0,"content":"Grüß Gott"}'
+        assert list(manager.active_connections[group_id]) == [fast]
+        assert stalled.closed_with == cm.SLOW_CONSUMER_CLOSE_CODE
+
+        manager.disconnect(fast, group_id)
+        assert manager.active_connections == {}
+
+    asyncio.run(scenario())
+
+
+def test_send_timeout_evicts_client():
+    async def scenario():
+        cm.SEND_TIMEOUT_SECONDS, old_timeout = 0.05, cm.SEND_TIMEOUT_SECONDS
+        try:
+            manager = ConnectionManager()
+            group_id = uuid.uuid4()
+            stalled = FakeWebSocket(stalled=True)
+            await manager.connect(stalled, group_id)
+            manager.broadcast({"seq": 1}, group_id)
+            await asyncio.sleep(0.2)
+            assert group_id not in manager.active_connections
+            assert stalled.closed_with == cm.SLOW_CONSUMER_CLOSE_CODE
+        finally:
+            cm.SEND_TIMEOUT_SECONDS = old_timeout
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_slow_client_does_not_hold_up_the_group()
+    test_send_timeout_evicts_client()
+    print("🎉 All ConnectionManager tests passed!")
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+import googlemaps
+import pytest
+
+from fake_places import PAGE_SIZE, FakePlacesServer
+
+
+@pytest.fixture(scope="module")
+def gmaps():
+    server = FakePlacesServer(latency=0.0).start_in_thread()
+    return googlemaps.Client(key="AIza-test-key", base_url=server.base_url)
+
+
+def test_nearby_search_filters_by_type_and_pages(gmaps):
+    first = gmaps.places_nearby(location=(48.1374, 11.5755), radius=5000, type="museum")
+    assert len(first["results"]) == PAGE_SIZE
+    assert all("museum" in place["types"] for place in first["results"])
+    assert first["results"][0]["place_id"] == "fake-deutsches-museum"  # most ratings
+
+    second = gmaps.places_nearby(page_token=first["next_page_token"])
+    assert second["results"]
+    assert not {p["place_id"] for p in first["results"]} & {p["place_id"] for p in second["results"]}
+
+
+def test_place_details_resolve_coordinates(gmaps):
+    result = gmaps.place("fake-englischer-garten", fields=["geometry"])["result"]
+    assert result["geometry"]["location"] == {"lat": 48.1642, "lng": 11.6056}
+    with pytest.raises(googlemaps.exceptions.ApiError):
+        gmaps.place("unknown", fields=["geometry"])
+
+
+if __name__ == "__main__":
+    client = googlemaps.Client(key="AIza-test-key", base_url=FakePlacesServer(latency=0.0).start_in_thread().base_url)
+    test_nearby_search_filters_by_type_and_pages(client)
+    test_place_details_resolve_coordinates(client)
+    print("All fake Places tests passed")
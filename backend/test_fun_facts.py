@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(__file__))
+
+from fun_facts import POPULAR_SPOTS, FunFactService, cell_key
+from ttl_cache import TTLCache
+
+
+class CountingBot:
+    def __init__(self, verdict="yes"):
+        self.verdict = verdict
+        self.asked = 0
+        self.checked = 0
+
+    async def ask(self, user_input, location=None, available_groups=None):
+        self.asked += 1
+        await asyncio.sleep(0.01)
+        return f"Fun fact about {location['lat']:.3f},{location['lng']:.3f}"
+
+    async def ask_automated(self, response):
+        self.checked += 1
+        return self.verdict
+
+
+def test_nearby_requests_share_one_llm_round_trip():
+    async def run():
+        bot = CountingBot()
+        service = FunFactService(bot)
+        noon = datetime(2026, 5, 1, 12, 10)
+        # Concurrent misses for the same cell are coalesced
+        first = await asyncio.gather(*(service.get(48.1374, 11.5755, noon) for _ in range(20)))
+        assert len(set(first)) == 1 and first[0]
+        assert (bot.asked, bot.checked) == (1, 1)
+        # A few meters away and a bit later: same cell, same bucket, served from memory
+        assert await service.get(48.1375, 11.5756, datetime(2026, 5, 1, 13, 50)) == first[0]
+        assert bot.asked == 1
+        # Another time-of-day bucket asks again
+        await service.get(48.1374, 11.5755, datetime(2026, 5, 1, 18, 0))
+        assert bot.asked == 2
+
+    asyncio.run(run())
+
+
+def test_rejected_facts_are_cached_as_empty():
+    async def run():
+        bot = CountingBot(verdict="no")
+        service = FunFactService(bot)
+        now = datetime(2026, 5, 1, 9, 0)
+        assert await service.get(48.15, 11.58, now) == ""
+        assert await service.get(48.15, 11.58, now) == ""
+        assert bot.asked == 1
+
+    asyncio.run(run())
+
+
+def test_prewarm_fills_popular_cells():
+    async def run():
+        bot = CountingBot()
+        service = FunFactService(bot)
+        now = datetime(2026, 5, 1, 20, 0)
+        await service.prewarm(now)
+        asked = bot.asked
+        assert asked == len({cell_key(lat, lng, now) for lat, lng in POPULAR_SPOTS})
+        for lat, lng in POPULAR_SPOTS:
+            assert await service.get(lat, lng, now)
+        assert bot.asked == asked
+
+    asyncio.run(run())
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # "b" was used least recently
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    now[0] = 10.0
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 3, "stale_hits": 0, "misses": 2, "size": 1}
+
+
+if __name__ == "__main__":
+    test_nearby_requests_share_one_llm_round_trip()
+    test_rejected_facts_are_cached_as_empty()
+    test_prewarm_fills_popular_cells()
+    test_ttl_cache_expires_and_evicts_least_recently_used()
+    print("All fun fact tests passed")
@@ -0,0 +1,416 @@
+import sys
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(__file__))
+os.environ.setdefault("GOOGLE_API_KEY", "AIza-test-key")
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-test-key")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import GroupDataManager as db
+import main
+import chat_archive
+import journal
+from journal import JournalError
+from models import GroupModel, UserModel
+from place_cache import PlaceCoordinateCache
+from memory_storage import CHAT_EVICT_BATCH, MemoryStorage
+from sqlite_storage import SQLiteStorage
+from storage import CHAT_TAIL_SIZE
+
+COORDS = {
+    "marienplatz": (48.1374, 11.5755),
+    "englischer_garten": (48.1642, 11.6056),
+    "allianz_arena": (48.2188, 11.6247),
+}
+
+
+def _reset(backend=None):
+    db.close_storage()
+    db.backend = backend or MemoryStorage()
+    db.location_json_cache.clear()
+    db.place_cache = PlaceCoordinateCache(None, COORDS.get)
+
+
+def _host(user_id=1):
+    return UserModel(user_id=user_id, name="Anna", age=25, gender="weiblich")
+
+
+def test_nearby_groups_uses_grid():
+    _reset()
+    host = _host()
+    for place_id in COORDS:
+        db.create_group(place_id, place_id, "test", (18, 40), date.today(), host)
+
+    nearby = db.get_nearby_groups(48.1374, 11.5755, radius_km=3.0)
+    assert [g["location_id"] for g in nearby] == ["marienplatz"]
+
+    nearby = db.get_nearby_groups(48.1374, 11.5755, radius_km=20.0)
+    assert sorted(g["location_id"] for g in nearby) == sorted(COORDS)
+
+
+def test_grid_follows_group_deletion():
+    _reset()
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    assert "marienplatz" in db.backend.location_grid
+
+    db.delete_group("marienplatz", group.group_id)
+    assert "marienplatz" not in db.backend.location_grid
+    assert db.get_nearby_groups(48.1374, 11.5755) == []
+
+    db.create_group("marienplatz", "Beer again", "test", (18, 40), date.today(), _host())
+    assert len(db.get_nearby_groups(48.1374, 11.5755)) == 1
+
+
+def test_unresolved_location_is_retried():
+    _reset()
+    db.place_cache = PlaceCoordinateCache(None, lambda place_id: None)
+    db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    location = db.backend.locations_db["marienplatz"]
+    assert not location.resolved and (location.lat, location.lng) == (0.0, 0.0)
+    assert db.get_nearby_groups(48.137, 11.575) == []
+
+    db.place_cache = PlaceCoordinateCache(None, COORDS.get)
+    db.retry_unresolved_locations()
+    assert location.resolved
+    assert len(db.get_nearby_groups(48.1374, 11.5755)) == 1
+
+
+def test_place_cache_coalesces_and_persists(tmp_path):
+    calls = []
+
+    def slow_lookup(place_id):
+        calls.append(place_id)
+        time.sleep(0.05)
+        return COORDS[place_id]
+
+    path = str(tmp_path / "places.json")
+    cache = PlaceCoordinateCache(path, slow_lookup)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("marienplatz"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["marienplatz"]
+    assert results == [COORDS["marienplatz"]] * 5
+
+    reloaded = PlaceCoordinateCache(path, slow_lookup)
+    assert reloaded.get("marienplatz") == COORDS["marienplatz"]
+    assert calls == ["marienplatz"]
+
+
+def test_group_summaries_by_location():
+    _reset()
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    db.join_group("marienplatz", group.group_id, _host(user_id=2))
+
+    summaries = db.get_group_summaries_by_location(["marienplatz", "allianz_arena", "unknown"])
+    assert list(summaries) == ["marienplatz"]
+    assert summaries["marienplatz"][0]["group_id"] == str(group.group_id)
+    assert summaries["marienplatz"][0]["member_count"] == 2
+
+
+def test_location_json_is_cached_until_changed():
+    _reset()
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    body, etag = db.get_location_groups_json("marienplatz")
+    assert json.loads(body)[0]["groups"][str(group.group_id)]["title"] == "Beer"
+    assert db.get_location_groups_json("marienplatz")[0] is body
+
+    db.join_group("marienplatz", group.group_id, _host(user_id=2))
+    new_body, new_etag = db.get_location_groups_json("marienplatz")
+    assert new_etag != etag
+    assert len(json.loads(new_body)[0]["groups"][str(group.group_id)]["members"]) == 2
+    assert db.get_location_groups_json("unknown")[0] == b"[]"
+
+
+def test_location_listing_honours_if_none_match():
+    _reset()
+    db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    client = TestClient(main.app)  # no lifespan, the background threads stay off
+    etag = client.get("/api/locations/marienplatz/groups").headers["etag"]
+    for header in (etag, f"W/{etag}", f'"other", {etag}', f'"other",{etag}', f'W/"other", W/{etag}', "*"):
+        response = client.get("/api/locations/marienplatz/groups", headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.headers["etag"] == etag and not response.content
+    for header in ('"other"', 'W/"other", "another"', etag.strip('"')):
+        assert client.get("/api/locations/marienplatz/groups", headers={"If-None-Match": header}).status_code == 200, header
+
+
+def _restart(data_dir):
+    db.close_storage()
+    db.backend = MemoryStorage(data_dir)
+    db.open_storage()
+
+
+def test_state_survives_restart(tmp_path):
+    _reset()
+    data_dir = str(tmp_path)
+    _restart(data_dir)
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    removed = db.create_group("allianz_arena", "Football", "test", (18, 40), date.today(), _host())
+    db.join_group("marienplatz", group.group_id, _host(user_id=2))
+    db.send_message("marienplatz", group.group_id, _host(user_id=2), "Servus!")
+    db.delete_group("allianz_arena", removed.group_id)
+
+    # First restart replays the journal, the second one loads the snapshot written after the replay
+    for _ in range(2):
+        _restart(data_dir)
+        restored = db.backend.locations_db["marienplatz"].groups[group.group_id]
+        assert restored.member_ids == [1, 2] and restored.has_member(2)
+        assert [(m.seq, m.content) for m in db.get_chat_history("marienplatz", group.group_id, 2)] == [(1, "Servus!")]
+        assert "allianz_arena" not in db.backend.locations_db
+        assert [g["title"] for g in db.get_user_groups(2)] == ["Beer"]
+        assert len(db.get_nearby_groups(48.1374, 11.5755)) == 1
+    db.close_storage()
+
+
+def test_sqlite_backend(tmp_path):
+    path = str(tmp_path / "munich.db")
+    _reset(SQLiteStorage(path))
+    group = db.create_group("marienplatz", "Beer", "test", (18, 40), date.today(), _host())
+    football = db.create_group("allianz_arena", "Football", "test", (18, 40), date.today(), _host())
+    db.create_group("englischer_garten", "Yesterday", "test", (18, 40), date.today() - timedelta(days=1), _host())
+
+    assert db.join_group("marienplatz", group.group_id, _host(user_id=2))
+    assert not db.join_group("marienplatz", group.group_id, _host(user_id=2))
+    assert not db.join_group("marienplatz", group.group_id, UserModel(user_id=3, name="Kid", age=12, gender="x"))
+    assert db.send_message("marienplatz", group.group_id, _host(user_id=2), "Servus!").seq == 1
+    assert db.send_message("marienplatz", group.group_id, _host(), "Griaß di!").seq == 2
+    assert db.send_message("marienplatz", group.group_id, UserModel(user_id=3, name="Kid", age=12, gender="x"), "hi") is None
+
+    nearby = db.get_nearby_groups(48.1374, 11.5755, radius_km=3.0)
+    assert [g["group_id"] for g in nearby] == [str(group.group_id)]
+    assert [m["user_id"] for m in nearby[0]["members"]] == [1, 2]
+    assert db.get_group_summaries_by_location(["marienplatz"])["marienplatz"][0]["member_count"] == 2
+    location = json.loads(db.get_location_groups_json("marienplatz")[0])[0]
+    assert location["resolved"] and len(location["groups"][str(group.group_id)]["chat_history"]) == 2
+
+    assert db.delete_group("allianz_arena", football.group_id)
+    assert not db.delete_group("allianz_arena", football.group_id)
+    db.delete_expired_groups()
+    assert db.get_group_summaries_by_location(["allianz_arena", "englischer_garten"]) == {}
+
+    db.close_storage()
+    db.backend = SQLiteStorage(path)
+    assert [m.content for m in db.get_chat_history("marienplatz", group.group_id, 2)] == ["Servus!", "Griaß di!"]
+    assert db.get_chat_history("marienplatz", group.group_id, 3) == []
+    assert [g["title"] for g in db.get_user_groups(2)] == ["Beer"]
+    db.close_storage()
+
+
+def test_chat_history_pages(tmp_path):
+    for backend in (MemoryStorage(str(tmp_path / "memory")), SQLiteStorage(str(tmp_path / "chat.db"))):
+        _reset(backend)
+        db.open_storage()
+        group = db.create_group("marienplatz", "Chat", "Lots of messages", (18, 99), date.today(), _host())
+        total = CHAT_TAIL_SIZE + 2 * CHAT_EVICT_BATCH + 7
+        for i in range(1, total + 1):
+            db.send_message("marienplatz", group.group_id, _host(), f"msg {i}")
+
+        latest = db.get_chat_history("marienplatz", group.group_id, 1)
+        assert [m.seq for m in latest] == list(range(total - db.HISTORY_PAGE_SIZE + 1, total + 1))
+
+        # Walking backwards with the cursor returns every message exactly once, across the in-memory tail and the archive
+        seqs, before = [], None
+        while True:
+            page = db.get_chat_history("marienplatz", group.group_id, 1, before=before, limit=33)
+            if not page:
+                break
+            seqs = [m.seq for m in page] + seqs
+            before = page[0].seq
+        assert seqs == list(range(1, total + 1))
+        assert db.get_chat_history("marienplatz", group.group_id, 1, before=5, limit=10)[-1].content == "msg 4"
+        if isinstance(backend, MemoryStorage):
+            assert len(backend._get_group("marienplatz", group.group_id).chat_history) < CHAT_TAIL_SIZE + CHAT_EVICT_BATCH
+            _restart(str(tmp_path / "memory"))
+            assert [m.seq for m in db.get_chat_history("marienplatz", group.group_id, 1, before=3)] == [1, 2]
+        db.close_storage()
+
+
+def test_old_messages_move_to_archive(tmp_path):
+    _reset(MemoryStorage(str(tmp_path)))
+    db.open_storage()
+    group = db.create_group("marienplatz", "Chat", "Quiet group", (18, 99), date.today(), _host())
+    guest = UserModel(user_id=2, name="Zoë", age=30, gender="weiblich")
+    db.join_group("marienplatz", group.group_id, guest)
+    for i in range(1, 11):
+        db.send_message("marienplatz", group.group_id, _host() if i % 2 else guest, f"nachricht {i} ✓")
+    before = db.get_chat_history("marienplatz", group.group_id, 1)
+
+    db.backend.archive_chats(datetime.now() + timedelta(seconds=1))
+    assert [m.seq for m in db.backend._get_group("marienplatz", group.group_id).chat_history] == [10]
+    assert db.get_chat_history("marienplatz", group.group_id, 1) == before
+    db.send_message("marienplatz", group.group_id, guest, "noch eine")
+
+    db.write_snapshot()
+    _restart(str(tmp_path))
+    history = db.get_chat_history("marienplatz", group.group_id, 2)
+    assert history[:10] == before
+    assert [m.seq for m in history] == list(range(1, 12))
+    assert {m.sender_name for m in history} == {"Anna", "Zoë"}
+    db.close_storage()
+
+
+def test_archiving_changes_the_listing_etag(monkeypatch):
+    _reset()
+    group = db.create_group("marienplatz", "Chat", "Quiet group", (18, 99), date.today(), _host())
+    db.create_group("allianz_arena", "Silent", "no chat", (18, 99), date.today(), _host())
+    for i in range(3):
+        db.send_message("marienplatz", group.group_id, _host(), f"nachricht {i}")
+    _, etag = db.get_location_groups_json("marienplatz")
+    _, quiet_etag = db.get_location_groups_json("allianz_arena")
+
+    monkeypatch.setattr(db, "CHAT_ARCHIVE_AGE", timedelta(seconds=-1))
+    db.archive_old_messages()
+    body, new_etag = db.get_location_groups_json("marienplatz")
+    assert new_etag != etag
+    assert len(json.loads(body)[0]["groups"][str(group.group_id)]["chat_history"]) == 1
+    assert db.get_location_groups_json("allianz_arena")[1] == quiet_etag
+
+
+class _DeleteOnEnter:
+    """Group lock that deletes the group right before archive_chats gets it, like expiry running in between"""
+
+    def __init__(self, lock, delete):
+        self.lock = lock
+        self.delete = delete
+
+    def __enter__(self):
+        delete, self.delete = self.delete, None
+        if delete is not None:
+            delete()
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+def test_group_deleted_while_archiving_leaves_no_archive(tmp_path):
+    storage = MemoryStorage(str(tmp_path))
+    _reset(storage)
+    db.open_storage()
+    group = db.create_group("marienplatz", "Chat", "Quiet group", (18, 99), date.today(), _host())
+    for i in range(3):
+        db.send_message("marienplatz", group.group_id, _host(), f"nachricht {i}")
+    group = storage._get_group("marienplatz", group.group_id)
+    group._lock = _DeleteOnEnter(group._lock, lambda: db.delete_group("marienplatz", group.group_id))
+
+    storage.archive_chats(datetime.now() + timedelta(seconds=1))
+    assert group.group_id not in storage.chat_archive._groups
+    assert not os.path.exists(os.path.join(str(tmp_path), "chats", str(group.group_id)))
+    db.close_storage()
+
+
+def test_archive_sync_makes_new_directories_durable(tmp_path, monkeypatch):
+    _reset(MemoryStorage(str(tmp_path)))
+    db.open_storage()
+    group = db.create_group("marienplatz", "Chat", "Quiet group", (18, 99), date.today(), _host())
+    for i in range(3):
+        db.send_message("marienplatz", group.group_id, _host(), f"nachricht {i}")
+    db.backend.archive_chats(datetime.now() + timedelta(seconds=1))
+
+    synced = []
+    monkeypatch.setattr(chat_archive, "fsync_directory", synced.append)
+    db.backend.chat_archive.sync()
+    chats = os.path.join(str(tmp_path), "chats")
+    assert sorted(synced) == sorted([chats, os.path.join(chats, str(group.group_id))])
+    db.close_storage()
+
+
+def test_failed_fsync_fails_requests_instead_of_hanging(tmp_path, monkeypatch):
+    _reset(MemoryStorage(str(tmp_path)))
+    db.open_storage()
+    group = db.create_group("marienplatz", "Chat", "Quiet group", (18, 99), date.today(), _host())
+
+    def broken_fsync(fd):
+        raise OSError(5, "Input/output error")
+    monkeypatch.setattr(journal.os, "fsync", broken_fsync)
+
+    errors = []
+
+    def send():
+        try:
+            db.send_message("marienplatz", group.group_id, _host(), "hallo?")
+        except JournalError as e:
+            errors.append(e)
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    sender.join(timeout=5)
+    assert not sender.is_alive() and len(errors) == 1
+    assert isinstance(errors[0].__cause__, OSError)
+    with pytest.raises(JournalError):
+        db.send_message("marienplatz", group.group_id, _host(), "noch jemand da?")
+    with pytest.raises(JournalError):
+        db.write_snapshot()
+    db.close_storage()
+
+
+def test_group_members_are_ids():
+    group = GroupModel.model_validate({
+        "group_id": str(uuid.uuid4()), "title": "Old", "description": "from an old snapshot", "age_range": [18, 99],
+        "date": date.today().isoformat(), "host_id": 1, "members": [_host().model_dump(mode='json'), {"user_id": 2}]
+    })
+    assert group.member_ids == [1, 2] and group.has_member(1) and not group.has_member(3)
+    assert not group.add_member(2) and group.add_member(3)
+    assert json.loads(group.model_dump_json())["members"] == [{"user_id": 1}, {"user_id": 2}, {"user_id": 3}]
+    assert GroupModel.model_validate_json(group.model_dump_json()).member_ids == [1, 2, 3]
+
+
+def test_expiry_deletes_only_expired_groups():
+    for backend in (MemoryStorage(), SQLiteStorage(":memory:")):
+        _reset(backend)
+        today = date.today()
+        old = db.create_group("englischer_garten", "Yesterday", "test", (18, 40), today - timedelta(days=1), _host())
+        db.join_group("englischer_garten", old.group_id, _host(user_id=2))
+        db.create_group("marienplatz", "Today", "test", (18, 40), today, _host())
+        db.create_group("allianz_arena", "Next week", "test", (18, 40), today + timedelta(days=7), _host())
+        assert db.backend.next_expiry() == today - timedelta(days=1)
+        assert db.seconds_until_next_expiry(datetime.now()) == 1.0
+
+        db.delete_expired_groups()
+        assert db.backend.needs_coordinates("englischer_garten")  # the empty location is gone
+        assert db.get_location_groups_json("englischer_garten")[0] == b"[]"
+        assert [g["title"] for g in db.get_user_groups(1)] == ["Today", "Next week"]
+        assert db.get_user_groups(2) == []
+        assert db.backend.next_expiry() == today
+        assert 0 < db.seconds_until_next_expiry(datetime.combine(today, datetime.min.time())) <= db.EXPIRY_MAX_SLEEP_SECONDS
+        db.close_storage()
+
+
+def test_nearby_group_summaries_are_ranked_and_capped():
+    for backend in (MemoryStorage(), SQLiteStorage(":memory:")):
+        _reset(backend)
+        today = date.today()
+        later = db.create_group("marienplatz", "Next week", "test", (18, 40), today + timedelta(days=7), _host())
+        db.create_group("englischer_garten", "Garden", "test", (18, 40), today, _host())
+        now = db.create_group("marienplatz", "Now", "test", (18, 40), today, _host())
+        db.join_group("marienplatz", now.group_id, _host(user_id=2))
+        db.send_message("marienplatz", now.group_id, _host(), "Servus")
+
+        summaries = db.get_nearby_group_summaries(48.1374, 11.5755, radius_km=5.0)
+        assert [s["title"] for s in summaries] == ["Now", "Garden", "Next week"]
+        assert summaries[0]["member_count"] == 2 and summaries[0]["distance_km"] == 0.0
+        assert "members" not in summaries[0] and "chat_history" not in summaries[0]
+        assert summaries[2]["group_id"] == str(later.group_id)
+        assert len(db.get_nearby_group_summaries(48.1374, 11.5755, radius_km=5.0, limit=2)) == 2
+        db.close_storage()
+
+
+if __name__ == "__main__":
+    test_nearby_groups_uses_grid()
+    test_grid_follows_group_deletion()
+    test_unresolved_location_is_retried()
+    test_group_summaries_by_location()
+    test_location_json_is_cached_until_changed()
+    test_location_listing_honours_if_none_match()
+    test_nearby_group_summaries_are_ranked_and_capped()
+    print("🎉 All GroupDataManager tests passed!")
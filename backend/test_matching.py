@@ -1,9 +1,11 @@
 import sys
 import os
+import random
 
 sys.path.append(os.path.dirname(__file__))
 
-from matching_service import MatchingService, UserProfile
+from matching_service import (ALL_INTERESTS, CATEGORY_NAMES, COMPLEMENTARY_PAIRS, INTEREST_CATEGORIES,
+                              INTEREST_CATEGORY_IDS, INTEREST_IDS, MatchingService, MatchRequest, UserProfile)
 
 
 def test_matching_service():
@@ -81,5 +83,97 @@ def test_matching_service():
     print("\n🎉 All tests passed! Matching service is working.")
 
 
+def test_vectorized_scores_match_the_scalar_scoring():
+    rng = random.Random(7)
+    matching = MatchingService()
+    paired = [interest for pair in COMPLEMENTARY_PAIRS for interest in pair]
+    for i in range(2000):
+        interests = rng.sample(ALL_INTERESTS, rng.randint(0, 8)) + rng.sample(paired, 2)
+        matching.add_user(UserProfile(user_id=f"user{i}", name=f"User {i}", age=25, interests=interests,
+                                      location={"lat": rng.gauss(48.137, 0.05), "lng": rng.gauss(11.575, 0.07)}))
+    matching.add_user(matching.users["user3"].model_copy(update={"interests": ["Yoga", "AI"]}))  # update keeps the row
+
+    for current_id in ("user0", "user3", "user42"):
+        request = MatchRequest(current_user_id=current_id, max_distance_km=8, min_match_score=15, limit=37)
+        current = matching.users[current_id]
+        expected = []
+        for user_id, user in matching.users.items():
+            distance = matching._calculate_distance(current.location, user.location)
+            if user_id != current_id and distance <= request.max_distance_km:
+                score = matching._calculate_match_score(current, user, distance)["score"]
+                if score >= request.min_match_score:
+                    expected.append((user_id, score, distance))
+        expected.sort(key=lambda m: m[1], reverse=True)
+
+        matches = []
+        while True:
+            page = matching.find_matches(request)
+            matches.extend(page)
+            if len(page) < request.limit:
+                break
+            request = request.model_copy(update={"cursor": page[-1]["cursor"]})
+        assert [(m["user"]["user_id"], m["score"], m["distance_km"]) for m in matches] == expected
+
+
+def test_only_users_near_the_radius_are_scored():
+    matching = MatchingService()
+    # Oslo: a degree of longitude is much shorter than in Munich, 9.9 km east must still be found
+    matching.add_user(UserProfile(user_id="oslo", name="Ola", age=25, interests=["Hiking"], location={"lat": 59.91, "lng": 10.75}))
+    matching.add_user(UserProfile(user_id="east", name="Kari", age=25, interests=["Hiking"], location={"lat": 59.91, "lng": 10.9277}))
+    matching.add_user(UserProfile(user_id="munich", name="Anna", age=25, interests=["Hiking"], location={"lat": 48.137, "lng": 11.575}))
+    assert matching._calculate_distance(matching.users["oslo"].location, matching.users["east"].location) < 10
+    request = MatchRequest(current_user_id="oslo", max_distance_km=10, min_match_score=0)
+    assert [m["user"]["user_id"] for m in matching.find_matches(request)] == ["east"]
+    assert matching.profiles.rows["munich"] not in matching.profiles.rows_near(59.91, 10.75, 10)
+
+    # Moving to Munich moves the row in the grid
+    matching.add_user(UserProfile(user_id="east", name="Kari", age=25, interests=["Hiking"], location={"lat": 48.14, "lng": 11.58}))
+    assert matching.find_matches(request) == []
+    request = MatchRequest(current_user_id="munich", max_distance_km=10, min_match_score=0)
+    assert [m["user"]["user_id"] for m in matching.find_matches(request)] == ["east"]
+
+
+def test_interest_registry_and_cached_encoding():
+    for category, interests in INTEREST_CATEGORIES.items():
+        for interest in interests:
+            assert ALL_INTERESTS[INTEREST_IDS[interest]] == interest
+            assert CATEGORY_NAMES[INTEREST_CATEGORY_IDS[INTEREST_IDS[interest]]] == category
+
+    matching = MatchingService()
+    for user_id, interests in (("a", ["Yoga", "Programming", "Jazz", "Unknown"]), ("b", ["Jazz", "AI", "Yoga"])):
+        matching.add_user(UserProfile(user_id=user_id, name=user_id, age=25, interests=interests,
+                                      location={"lat": 48.137, "lng": 11.575}))
+    a, b = matching.users["a"], matching.users["b"]
+    assert a.interests == ["Yoga", "Programming", "Jazz"]
+    assert a._encoding.ids == frozenset(INTEREST_IDS[i] for i in a.interests)
+    assert matching._get_user_categories(a.interests) == {"🎮 Gaming & Tech", "⚽ Sports & Fitness", "🎵 Music"}
+
+    score = matching._calculate_match_score(a, b, 0.0)
+    # Shared interests and categories in taxonomy order; Programming + AI is a complementary pair
+    assert score["shared_interests"] == ["Yoga", "Jazz"]
+    assert score["shared_categories"] == ["🎮 Gaming & Tech", "⚽ Sports & Fitness", "🎵 Music"]
+    assert score["score"] == 2 * 10 + 3 * 5 + 20 + 3
+
+
+def test_pages_follow_the_cursor_and_skip_icebreakers_on_request():
+    matching = MatchingService()
+    for i in range(30):
+        # Equal scores everywhere, the order falls back to the order users were added
+        matching.add_user(UserProfile(user_id=f"user{i}", name=f"User {i}", age=25, interests=["Jazz"],
+                                      location={"lat": 48.137, "lng": 11.575}))
+    request = MatchRequest(current_user_id="user0", min_match_score=0, limit=12, include_icebreakers=False)
+    first = matching.find_matches(request)
+    assert [m["user"]["user_id"] for m in first] == [f"user{i}" for i in range(1, 13)]
+    assert all(m["icebreakers"] == [] for m in first)
+
+    second = matching.find_matches(request.model_copy(update={"cursor": first[-1]["cursor"]}))
+    third = matching.find_matches(request.model_copy(update={"cursor": second[-1]["cursor"]}))
+    assert [m["user"]["user_id"] for m in second + third] == [f"user{i}" for i in range(13, 30)]
+
+
 if __name__ == "__main__":
-    test_matching_service()
\ No newline at end of file
+    test_matching_service()
+    test_vectorized_scores_match_the_scalar_scoring()
+    test_only_users_near_the_radius_are_scored()
+    test_interest_registry_and_cached_encoding()
+    test_pages_follow_the_cursor_and_skip_icebreakers_on_request()
\ No newline at end of file
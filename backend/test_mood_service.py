@@ -0,0 +1,193 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import mood_service
+from mood_service import DirectMoodMapper
+from spatial_index import KM_PER_DEG_LAT, KM_PER_DEG_LNG, estimate_distance_km
+
+
+class FakePlaces:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def places_nearby(self, location=None, radius=None, type=None, keyword='', page_token=None):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.delay)
+        lat, lng = location
+        results = [{"place_id": f"near-{call}", "name": "Near", "geometry": {"location": {"lat": lat, "lng": lng}}}]
+        if radius > 25000:
+            results.append({"place_id": "far", "name": "Far", "geometry": {"location": {"lat": lat + 0.2, "lng": lng}}})
+        return {"results": results}
+
+
+def _ids(result):
+    return [f["properties"]["id"] for f in result["features"][1:]]
+
+
+def test_nearby_searches_share_the_cached_result():
+    gmaps = FakePlaces()
+    mapper = DirectMoodMapper(gmaps)
+    first = mapper.find_places("🌍 Everything", 48.1374, 11.5755, 10000)
+    assert _ids(first) == ["near-1"]
+    # Panned a few meters, same mood and radius
+    moved = mapper.find_places("🌍 Everything", 48.1375, 11.5756, 10000)
+    assert _ids(moved) == ["near-1"]
+    assert moved["features"][0]["geometry"]["coordinates"] == [11.5756, 48.1375]
+    assert gmaps.calls == 1
+    mapper.find_places("💫 Hidden Gems", 48.1374, 11.5755, 10000)
+    assert gmaps.calls == 2
+    assert mapper.cache.stats() == {"hits": 1, "stale_hits": 0, "misses": 2, "size": 2}
+
+
+def test_concurrent_misses_share_one_request():
+    gmaps = FakePlaces(delay=0.1)
+    mapper = DirectMoodMapper(gmaps)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mapper.find_places("🌍 Everything", 48.15, 11.58, 5000)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert gmaps.calls == 1
+    assert all(_ids(r) == ["near-1"] for r in results)
+
+
+def test_stale_entries_are_served_while_refreshing():
+    now = [0.0]
+    gmaps = FakePlaces(delay=0.05)
+    mapper = DirectMoodMapper(gmaps)
+    mapper.cache.clock = lambda: now[0]
+    mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)
+
+    now[0] = mood_service.PLACES_TTL_SECONDS + 1
+    started = time.perf_counter()
+    stale = mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)
+    assert time.perf_counter() - started < 0.05  # did not wait for the refresh
+    assert _ids(stale) == ["near-1"]
+    deadline = time.time() + 2
+    while _ids(mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)) != ["near-2"]:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert gmaps.calls == 2
+
+    now[0] += mood_service.PLACES_TTL_SECONDS + mood_service.PLACES_STALE_SECONDS
+    assert _ids(mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)) == ["near-3"]
+
+
+def test_concurrent_stale_hits_refresh_once():
+    now = [0.0]
+    gmaps = FakePlaces(delay=0.1)
+    mapper = DirectMoodMapper(gmaps)
+    mapper.cache.clock = lambda: now[0]
+    mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)
+
+    now[0] = mood_service.PLACES_TTL_SECONDS + 1
+    before = set(threading.enumerate())
+    threads = [threading.Thread(target=mapper.find_places, args=("🌍 Everything", 48.1374, 11.5755, 2000))
+               for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # The refresh runs on the Places search pool, not on threads of its own
+    assert all(t.name.startswith("places") for t in set(threading.enumerate()) - before)
+    deadline = time.time() + 2
+    while mapper._inflight:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert gmaps.calls == 2
+    assert _ids(mapper.find_places("🌍 Everything", 48.1374, 11.5755, 2000)) == ["near-2"]
+
+
+class RankedPlaces:
+    """Like Google: the 20 most prominent places within the radius, prominence falls with the place number"""
+
+    def __init__(self):
+        self.places = [(f"place-{i}", 48.1374 + (i % 40) * 0.001, 11.5755 + (i // 40) * 0.001) for i in range(400)]
+
+    def places_nearby(self, location=None, radius=None, type=None, keyword='', page_token=None):
+        lat, lng = location
+        found = [{"place_id": place_id, "name": place_id, "geometry": {"location": {"lat": p_lat, "lng": p_lng}}}
+                 for place_id, p_lat, p_lng in self.places
+                 if estimate_distance_km(lat, lng, p_lat, p_lng) * 1000 <= radius]
+        return {"results": found[:20]}
+
+
+def test_radius_between_slider_steps_keeps_all_results():
+    gmaps = RankedPlaces()
+    mapper = DirectMoodMapper(gmaps)
+    _, lat_cell, lng_cell, _ = mapper._cache_key("🌍 Everything", 48.1374, 11.5755, 2500)
+    lat = (lat_cell + 0.5) * mood_service.PLACES_CELL_KM / KM_PER_DEG_LAT
+    lng = (lng_cell + 0.5) * mood_service.PLACES_CELL_KM / KM_PER_DEG_LNG
+    for radius in (1500, 2500, 3500):
+        uncached = [p["place_id"] for p in gmaps.places_nearby(location=(lat, lng), radius=radius)["results"]]
+        assert _ids(mapper.find_places("🌍 Everything", lat, lng, radius)) == uncached
+        assert len(uncached) == 20
+
+
+class TypedPlaces:
+    """Two pages per type, the park and the zoo query both find the Tierpark"""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+
+    def places_nearby(self, location=None, radius=None, type=None, keyword='', page_token=None):
+        self.calls.append(page_token or type)
+        place_type = page_token.split(":")[0] if page_token else type
+        time.sleep(self.delays.get(place_type, 0.0))
+        loc = {"lat": 48.1374, "lng": 11.5755}
+        if page_token:
+            return {"results": [{"place_id": f"{place_type}-page2", "name": "More", "geometry": {"location": loc}}]}
+        return {"results": [{"place_id": f"{place_type}-1", "name": type, "rating": 4.0, "user_ratings_total": 10,
+                             "geometry": {"location": loc}},
+                            {"place_id": "tierpark", "name": "Tierpark", "rating": 3.0, "geometry": {"location": loc}}],
+                "next_page_token": f"{type}:2"}
+
+
+def test_all_types_are_searched_concurrently_and_merged(monkeypatch):
+    monkeypatch.setattr(mood_service, "PLACES_MAX_PAGES", 2)
+    monkeypatch.setattr(mood_service, "PAGE_TOKEN_DELAY_SECONDS", 0.0)
+    gmaps = TypedPlaces({"park": 0.2, "zoo": 0.2})
+    mapper = DirectMoodMapper(gmaps)
+    started = time.perf_counter()
+    result = mapper.find_places("🌿 Nature / Relax", 48.1374, 11.5755, 2000)
+    assert time.perf_counter() - started < 0.6  # two sequential rounds of one page, not four
+    ids = _ids(result)
+    assert ids[0] == "tierpark"  # found by both queries
+    assert sorted(ids) == ["park-1", "park-page2", "tierpark", "zoo-1", "zoo-page2"]
+    assert sorted(gmaps.calls) == ["park", "park:2", "zoo", "zoo:2"]
+
+
+def test_queries_over_budget_are_dropped_and_not_cached(monkeypatch):
+    monkeypatch.setattr(mood_service, "PLACES_BUDGET_SECONDS", 0.2)
+    gmaps = TypedPlaces({"night_club": 1.0})
+    mapper = DirectMoodMapper(gmaps)
+    started = time.perf_counter()
+    result = mapper.find_places("🎉 Party / Pub Crawl", 48.1374, 11.5755, 2000)
+    assert time.perf_counter() - started < 0.5
+    assert sorted(_ids(result)) == ["bar-1", "tierpark"]
+    assert len(mapper.cache) == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    test_nearby_searches_share_the_cached_result()
+    test_concurrent_misses_share_one_request()
+    test_stale_entries_are_served_while_refreshing()
+    test_concurrent_stale_hits_refresh_once()
+    test_radius_between_slider_steps_keeps_all_results()
+    with pytest.MonkeyPatch.context() as mp:
+        test_all_types_are_searched_concurrently_and_merged(mp)
+    with pytest.MonkeyPatch.context() as mp:
+        test_queries_over_budget_are_dropped_and_not_cached(mp)
+    print("All mood service tests passed")
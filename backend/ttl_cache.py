@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple, Any
+
+
+class TTLCache:
+    """
+    Bounded LRU map whose entries are fresh for ttl seconds after they were stored, safe to share between threads.
+    With stale_ttl they are kept that much longer and lookup() still hands them out, marked stale.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """(value, stale), (None, False) on a miss or once the entry is past its stale time too"""
+        with self.lock:
+            entry = self.entries.get(key)
+            age = self.clock() - entry[0] if entry is not None else None
+            if entry is None or age >= self.ttl + self.stale_ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None, False
+            self.entries.move_to_end(key)
+            if age >= self.ttl:
+                self.stale_hits += 1
+                return entry[1], True
+            self.hits += 1
+            return entry[1], False
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The cached value, None on a miss or when it is no longer fresh"""
+        value, stale = self.lookup(key)
+        return None if stale else value
+
+    def set(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "size": len(self.entries)}
@@ -106,53 +106,15 @@ function App() {
   };
 
 
-  const augmentPlacesWithGroups = async (features) => {
-      // Filtere alle Orte außer der Benutzerposition
-      const placeFeatures = features.filter(f => f.properties.type !== 'user');
-
-      // Erstelle ein Array von Promises für alle Gruppenabrufe
-      const groupPromises = placeFeatures.map(f =>
-          ApiService.getGroupsAtLocation(f.properties.id)
-              .then(data => {
-                  // Wenn data[0] existiert, nimm die Gruppen (Dictionary)
-                  const groupsDict = data.length > 0 && data[0].groups ? data[0].groups : {};
-                  return {
-                      placeId: f.properties.id,
-                      groups: Object.values(groupsDict) // Konvertiere Dictionary in Array
-                  };
-              })
-              .catch(e => {
-                  console.warn(`Failed to fetch groups for ${f.properties.id}:`, e);
-                  return { placeId: f.properties.id, groups: [] };
-              })
-      );
-
-      // Warte auf alle Gruppenabrufe
-      const groupResults = await Promise.all(groupPromises);
-      const groupMap = new Map(groupResults.map(res => [res.placeId, res.groups]));
-
-      // Füge die Gruppeninformationen den GeoJSON-Features hinzu
-      return features.map(f => {
-          if (f.properties.type !== 'user') {
-              f.properties.groups = groupMap.get(f.properties.id) || [];
-          }
-          return f;
-      });
-  };
-
-
   const triggerSearch = async (lat, lng, mood, radius) => {
     setLoading(true);
     try {
-        // 1. Orte abrufen
-        const result = await ApiService.getNearbyPlaces(lat, lng, mood, radius);
-        let features = result.features || [];
-
-        // 2. Orte mit Gruppeninformationen augmentieren
-        const augmentedFeatures = await augmentPlacesWithGroups(features);
+        // Orte inklusive Gruppeninformationen in einem Request abrufen
+        const result = await ApiService.searchPlacesWithGroups(lat, lng, mood, radius);
+        const features = result.features || [];
 
-        setRawPlaces(augmentedFeatures);
-        setMapPlaces(augmentedFeatures); // Wir setzen die augmentierten Features direkt
+        setRawPlaces(features);
+        setMapPlaces(features);
     } catch (e) {
         console.error("Search failed:", e);
         setMapPlaces([]);
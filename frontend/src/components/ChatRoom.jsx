@@ -5,13 +5,18 @@ import { ArrowLeft, Send } from 'lucide-react';
 const ChatRoom = ({ locationId, groupId, title, user, onBack }) => {
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState("");
+    const [hasOlder, setHasOlder] = useState(false);
     const ws = useRef(null);
+    const pending = useRef(new Map());
     const bottomRef = useRef(null);
 
     useEffect(() => {
         // Historie laden
         ApiService.getChatHistory(locationId, groupId, user.user_id)
-            .then(hist => setMessages(hist || []))
+            .then(hist => {
+                setMessages(hist || []);
+                setHasOlder((hist || []).length > 0 && hist[0].seq > 1);
+            })
             .catch(console.error);
 
         // WebSocket verbinden
@@ -19,10 +24,19 @@ const ChatRoom = ({ locationId, groupId, title, user, onBack }) => {
         const wsUrl = `${protocol}//${window.location.host}/api/ws/${groupId}`;
 
         ws.current = new WebSocket(wsUrl);
-        ws.current.onopen = () => console.log("WS Connected");
+        // Einmal pro Verbindung anmelden, danach laufen Nachrichten über denselben Socket
+        ws.current.onopen = () => ws.current.send(JSON.stringify({ type: 'auth', user_id: user.user_id, location_id: locationId }));
         ws.current.onmessage = (event) => {
             const msg = JSON.parse(event.data);
-            setMessages(prev => [...prev, msg]);
+            if (msg.type === 'ready') {
+                console.log("WS Connected");
+            } else if (msg.type === 'ack') {
+                pending.current.delete(msg.client_id);
+            } else if (msg.type === 'error') {
+                console.error("Sending failed", msg.detail);
+            } else {
+                setMessages(prev => [...prev, msg]);
+            }
         };
 
         return () => ws.current?.close();
@@ -30,10 +44,28 @@ const ChatRoom = ({ locationId, groupId, title, user, onBack }) => {
 
     useEffect(() => bottomRef.current?.scrollIntoView({ behavior: "smooth" }), [messages]);
 
+    // Ältere Nachrichten seitenweise über den seq-Cursor nachladen
+    const loadOlder = async () => {
+        if (messages.length === 0) return;
+        try {
+            const older = await ApiService.getChatHistory(locationId, groupId, user.user_id, messages[0].seq);
+            setMessages(prev => [...(older || []), ...prev]);
+            setHasOlder((older || []).length > 0 && older[0].seq > 1);
+        } catch (e) {
+            console.error("Loading older messages failed", e);
+        }
+    };
+
     const sendMessage = async () => {
         if(!input.trim()) return;
         try {
-            await ApiService.sendChatMessage(locationId, groupId, user, input);
+            if (ws.current?.readyState === WebSocket.OPEN) {
+                const clientId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+                pending.current.set(clientId, input);
+                ws.current.send(JSON.stringify({ type: 'message', content: input, client_id: clientId }));
+            } else {
+                await ApiService.sendChatMessage(locationId, groupId, user, input);
+            }
             setInput("");
         } catch (e) {
             console.error("Sending failed", e);
@@ -47,8 +79,11 @@ const ChatRoom = ({ locationId, groupId, title, user, onBack }) => {
                 <div><h3 style={{margin:0, fontSize: '16px', color: '#0f172a'}}>{title}</h3><small style={{color: '#64748b'}}>Chat</small></div>
             </div>
             <div style={{flex: 1, overflowY: 'auto', padding: '15px', background: '#f8fafc'}}>
+                {hasOlder && (
+                    <button onClick={loadOlder} style={{display: 'block', margin: '0 auto 10px', background: 'none', border: 'none', color: '#2563eb', cursor: 'pointer', fontSize: '12px'}}>Load older messages</button>
+                )}
                 {messages.map((m, i) => (
-                    <div key={i} style={{marginBottom: '10px', textAlign: m.sender_id === user.user_id ? 'right' : 'left'}}>
+                    <div key={m.seq ?? i} style={{marginBottom: '10px', textAlign: m.sender_id === user.user_id ? 'right' : 'left'}}>
                         <div style={{display: 'inline-block', padding: '8px 14px', borderRadius: '16px', background: m.sender_id === user.user_id ? '#2563eb' : 'white', color: m.sender_id === user.user_id ? 'white' : '#334155', border: m.sender_id !== user.user_id ? '1px solid #e2e8f0' : 'none', boxShadow: '0 1px 2px rgba(0,0,0,0.05)', maxWidth: '85%', textAlign: 'left'}}>
                             <small style={{opacity: 0.8, fontSize: '10px', display: 'block', marginBottom: '2px', color: m.sender_id === user.user_id ? '#bfdbfe' : '#94a3b8'}}>{m.sender_name}</small>
                             <span style={{fontSize: '14px'}}>{m.content}</span>
@@ -21,9 +21,19 @@ const ChatbotWidget = ({ userLocation }) => {
         try {
             const lat = userLocation?.lat || 48.137;
             const lng = userLocation?.lon || 11.575;
-            // Ruft den /api/chatbot/user Endpoint auf
-            const response = await ApiService.askChatbot(userMsg, lat, lng);
-            setMessages(prev => [...prev, { sender: 'bot', text: response.response }]);
+            // Antwort über /api/chatbot/user/stream stückweise anzeigen, sobald das erste Stück da ist
+            let started = false;
+            await ApiService.streamChatbot(userMsg, lat, lng, (text) => {
+                setLoading(false);
+                setMessages(prev => {
+                    if (!started) {
+                        started = true;
+                        return [...prev, { sender: 'bot', text }];
+                    }
+                    const last = prev[prev.length - 1];
+                    return [...prev.slice(0, -1), { ...last, text: last.text + text }];
+                });
+            });
         } catch (err) {
             setMessages(prev => [...prev, { sender: 'bot', text: "Sorry, I couldn't reach the server." }]);
         } finally {
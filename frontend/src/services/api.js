@@ -29,6 +29,11 @@ export const ApiService = {
         const params = new URLSearchParams({ lat, lng, mood, radius });
         return request(`/map/nearby?${params.toString()}`);
     },
+    // Places plus group summaries per place in one request
+    searchPlacesWithGroups: (lat, lng, mood, radius) => {
+        const params = new URLSearchParams({ lat, lng, mood, radius });
+        return request(`/map/search?${params.toString()}`);
+    },
     getGroupsAtLocation: (locationId) => {
         return request(`/locations/${locationId}/groups`);
     },
@@ -61,8 +66,9 @@ export const ApiService = {
     },
 
     // --- CHAT & CHATBOT ---
-    getChatHistory: (locationId, groupId, userId) => {
-        const params = new URLSearchParams({ location_id: locationId, group_id: groupId, user_id: userId });
+    getChatHistory: (locationId, groupId, userId, before = null, limit = 50) => {
+        const params = new URLSearchParams({ location_id: locationId, group_id: groupId, user_id: userId, limit });
+        if (before !== null) params.append('before', before);
         return request(`/chat/history?${params.toString()}`);
     },
     sendChatMessage: (locationId, groupId, user, content) => {
@@ -74,5 +80,18 @@ export const ApiService = {
     askChatbot: (userInput, lat, lng) => {
         const params = new URLSearchParams({ user_input: userInput, lat, lng });
         return request(`/chatbot/user?${params.toString()}`);
+    },
+    // Streams the answer via Server-Sent Events, onText gets each piece as soon as it is generated
+    streamChatbot: (userInput, lat, lng, onText) => {
+        const params = new URLSearchParams({ user_input: userInput, lat, lng });
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/chatbot/user/stream?${params.toString()}`);
+            source.onmessage = (event) => onText(JSON.parse(event.data).text);
+            source.addEventListener('done', () => { source.close(); resolve(); });
+            source.addEventListener('error', (event) => {
+                source.close();
+                reject(new Error(event.data ? JSON.parse(event.data).detail : 'Stream interrupted'));
+            });
+        });
     }
 };
\ No newline at end of file